@@ -0,0 +1,6 @@
+# Runs xmascard/batch_convert.py, so that it can still be run from here without
+# installing the package.
+from xmascard.batch_convert import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+usage = '''
+This program times the slow parts of getting an animation onto the Xmas Tree
+Board: parsing animation files and expanding their fades, encoding frames into
+memory entries, and uploading to a board. Uploads go to board_emulator.py at a
+simulated baud rate, so no board is needed.
+
+Results are written as JSON so runs from different versions can be compared;
+give an earlier run with --compare to see how much each benchmark changed.
+'''
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import serial
+from xmascard import convert_animation_file
+from xmascard import led_mem_utils
+from xmascard import upload_new_pattern
+from board_emulator import BoardEmulator
+from xmascard.convert_animation_file import AnimationParser
+from xmascard.led_mem_utils import LEDS_PER_BOARD, MEMORY_ENTRIES
+
+def make_animation(keyframes, seed=0):
+    '''Returns the lines of a made up animation file with keyframes frames,
+    with a fade (of varying speed) before every other one.'''
+    rng = random.Random(seed)
+    lines = []
+    for i in range(keyframes):
+        if i % 2:
+            lines.append('fade_to:{0}'.format(rng.choice([1, 2, 3])))
+        lines.append(' '.join(str(rng.randrange(8)) for led in range(LEDS_PER_BOARD)))
+    return lines
+
+def make_frames(count, seed=0):
+    rng = random.Random(seed)
+    return [[rng.randrange(8) for led in range(LEDS_PER_BOARD)] for i in range(count)]
+
+def quiet(*items):
+    pass
+
+def measure(function, repeats):
+    '''Calls function repeats times and returns the min, median and mean times
+    in seconds along with what it returned the last time.'''
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return {'min': min(times), 'median': statistics.median(times),
+            'mean': statistics.mean(times), 'repeats': repeats}, result
+
+def parse(lines):
+    return list(AnimationParser(log=quiet).parse(lines))
+
+def bench_parse(results, repeats, scale):
+    for name, keyframes in (('small', 20), ('large', 2000 * scale)):
+        lines = make_animation(keyframes)
+        seconds, frames = measure(lambda: parse(lines), repeats)
+        results['parse_' + name] = dict(seconds, lines=len(lines), frames=len(frames),
+                                        frames_per_second=len(frames) / seconds['min'])
+
+def bench_fade(results, repeats, scale):
+    '''Times fades alone, with NumPy and with the pure Python fallback.'''
+    rng = random.Random(1)
+    lines = []
+    for i in range(200 * scale):
+        lines.append('fade_to:3')
+        lines.append(' '.join(rng.choice('07') for led in range(LEDS_PER_BOARD)))
+    lines = lines[1:]
+    implementations = [('python', None)]
+    saved = convert_animation_file.load_frame_store()
+    if saved:
+        implementations.append(('numpy', saved))
+    try:
+        for name, implementation in implementations:
+            convert_animation_file.frame_store = implementation
+            seconds, frames = measure(lambda: parse(lines), repeats)
+            results['fade_' + name] = dict(seconds, frames=len(frames),
+                frames_per_second=len(frames) / seconds['min'])
+    finally:
+        convert_animation_file.frame_store = saved
+
+def bench_encode(results, repeats, scale):
+    frames = make_frames(MEMORY_ENTRIES)
+
+    def memory_entries():
+        for frame in frames:
+            entry = led_mem_utils.MemoryEntry()
+            for intensity in frame:
+                entry.add_led(intensity)
+            entry.get_bytes()
+    seconds, result = measure(memory_entries, repeats)
+    results['encode_memory_entry'] = dict(seconds,
+        seconds_per_frame=seconds['min'] / len(frames))
+
+    seconds, result = measure(lambda: led_mem_utils.encode_frames(frames), repeats)
+    results['encode_image'] = dict(seconds,
+        seconds_per_frame=seconds['min'] / len(frames))
+
+    animation = [convert_animation_file.Frame(0, frame) for frame in frames]
+    def convert():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return convert_animation_file.convert_frames(animation)
+    seconds, result = measure(convert, repeats)
+    results['convert_frames'] = seconds
+
+def bench_upload(results, repeats, scale, baudrate=115200):
+    '''Times uploads to an emulated board. ideal_seconds is how long the bytes
+    alone take on the wire at the baud rate: with one line in flight each
+    command and its response take turns, otherwise the longer responses set the
+    pace. A burst is a single command and acknowledgement.'''
+    emulator = BoardEmulator(baudrate, log=quiet)
+    port = emulator.start()
+    pattern = led_mem_utils.split_entries(led_mem_utils.encode_frames(
+        make_frames(MEMORY_ENTRIES)))
+    changed = list(pattern)
+    for address in random.Random(2).sample(range(MEMORY_ENTRIES), MEMORY_ENTRIES // 10):
+        changed[address] = bytes(reversed(changed[address]))
+    command_len = len(upload_new_pattern.build_write_command(0, pattern[0]))
+
+    with serial.Serial(port, baudrate, timeout=1) as ser:
+        for name, window, burst, new, previous in (
+                ('upload_window_1', 1, False, pattern, None),
+                ('upload_window_{0}'.format(upload_new_pattern.MAX_WINDOW),
+                 upload_new_pattern.MAX_WINDOW, False, pattern, None),
+                ('upload_burst', 1, True, pattern, None),
+                ('upload_delta', 1, False, changed, pattern)):
+            def upload():
+                return upload_new_pattern.upload_pattern(ser, new, window,
+                                                         previous=previous, log=quiet,
+                                                         burst=burst)
+            seconds, failed = measure(upload, repeats)
+            lines = sum(previous is None or previous[address] != data
+                        for address, data in enumerate(new))
+            if burst:
+                # One command for everything, then a short acknowledgement.
+                wire_bytes = (len(upload_new_pattern.build_burst_command(0, new)) +
+                              upload_new_pattern.BURST_RESPONSE_LEN)
+            else:
+                line_len = upload_new_pattern.RESPONSE_LEN
+                if window == 1:
+                    line_len += command_len
+                wire_bytes = lines * line_len
+            results[name] = dict(seconds, baudrate=baudrate, lines=lines,
+                                 failed=len(failed),
+                                 ideal_seconds=wire_bytes * 10.0 / baudrate)
+
+BENCHMARKS = collections.OrderedDict([
+    ('parse', bench_parse),
+    ('fade', bench_fade),
+    ('encode', bench_encode),
+    ('upload', bench_upload),
+])
+
+def git_version():
+    '''Returns which commit of the tools is being measured, wherever they're
+    run from, or None if they aren't in a git checkout.'''
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    '''Prints how much each benchmark's best time changed from baseline.'''
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        ratio = result['min'] / baseline[name]['min']
+        print('{0:24} {1:10.4f} s  was {2:10.4f} s  ({3:+.0%})'.format(
+              name, result['min'], baseline[name]['min'], ratio - 1),
+              file=sys.stderr)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs='*',
+                        help="Which benchmarks to run, out of {0} (default: "
+                             "all).".format(', '.join(BENCHMARKS)))
+    parser.add_argument("--output", help="Write the results to this file "
+                        "rather than standard output.")
+    parser.add_argument("--repeats", type=int, default=5,
+                        help="How many times to run each benchmark.")
+    parser.add_argument("--scale", type=int, default=1,
+                        help="Multiply the size of the large inputs by this.")
+    parser.add_argument("--baud", type=int, default=115200,
+                        help="Baud rate to simulate for uploads.")
+    parser.add_argument("--compare", help="An earlier results file to compare against.")
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        print(usage)
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark {0}'.format(repr(name)))
+
+    try:
+        import numpy
+        numpy_version = numpy.__version__
+    except ImportError:
+        numpy_version = None
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        print('Running', name, file=sys.stderr)
+        if name == 'upload':
+            bench_upload(results, args.repeats, args.scale, args.baud)
+        else:
+            BENCHMARKS[name](results, args.repeats, args.scale)
+
+    report = {
+        'version': git_version(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': numpy_version,
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(results, json.load(f)['results'])
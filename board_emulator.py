@@ -0,0 +1,355 @@
+usage = '''
+This program pretends to be an Xmas Tree Board on a pseudo-terminal, so
+upload_new_pattern.py, light_control.py and the other tools can be tried out
+without a board plugged in. Run it, then point the tools at the port it prints.
+
+It follows the serial protocol of the design in hdl/serial.v: 'm' to switch
+display modes, 'i' to set individual LEDs, 'w' to write a line of the 256
+entry pattern RAM, 'b' to write a run of lines at once, 'c' to get the CRC of a
+run of lines, 'r' and 'p' to change baud rate and 'a' to ask which line of the
+RAM is being shown. Bytes take as long to send
+and receive as they would at the real baud rate, and faults can be injected to
+see how the tools cope.
+
+Only works on systems with pseudo-terminals (Linux, macOS).
+'''
+
+import argparse
+import binascii
+import collections
+import os
+import queue
+import random
+import signal
+import struct
+import sys
+import threading
+import time
+import tty
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.led_mem_utils import LEDS_PER_BOARD, MEMORY_ENTRIES, BYTES_PER_ENTRY
+from xmascard.convert_animation_file import Frame, pretty_print_frame
+
+FIFO_DEPTH = 63 # Bytes the receive FIFO in serial.v can hold
+BURST_TIMEOUT = 2 ** 18 / 6451200.0 # Seconds a stalled burst is given
+RATE_TIMEOUT = 2 ** 21 / 6451200.0 # Seconds a new baud rate is given to be confirmed
+DEFAULT_DIVISOR = 7 # For 115200 baud
+PLAY_FPS = 6451200.0 / 2 ** 18 # Lines of pattern RAM shown per second
+PING_BYTES = b'\x00\xff\x55\xaa\x0f\xf0\x33\xcc' # What a ping carries
+
+class BoardModel():
+    '''The board's serial command state machine (new_pattern in hdl/serial.v)
+    and the memories it controls.'''
+
+    def __init__(self):
+        self.ram = bytearray(MEMORY_ENTRIES * BYTES_PER_ENTRY)
+        self.mode = 0
+        self.individual_leds = 0
+        self.in_burst = False
+        self.divisor = DEFAULT_DIVISOR
+        self.rate_pending = False
+        self.rate_changes = 0
+        # Playback steps through the RAM from play_start, whatever the mode.
+        # now is the time the byte being handled is taken, kept up to date by
+        # whoever runs the model.
+        self.play_start = 0
+        self.now = 0
+        self.machine = self.run()
+        next(self.machine)
+
+    def receive(self, byte):
+        '''Handles one received byte. Returns the bytes sent in response and
+        how many of them have to be sent before the state machine will look at
+        another received byte.'''
+        return self.machine.send(byte)
+
+    def abandon_burst(self):
+        '''Goes back to waiting for a command, as the board does when a burst
+        stops arriving part way through.'''
+        if self.in_burst:
+            self.in_burst = False
+            self.machine = self.run()
+            next(self.machine)
+
+    def abandon_rate(self):
+        '''Goes back to 115200 baud and waiting for a command, as the board
+        does when a new baud rate isn't confirmed in time.'''
+        self.divisor = DEFAULT_DIVISOR
+        self.rate_pending = False
+        self.in_burst = False
+        self.machine = self.run()
+        next(self.machine)
+
+    def play_address(self, when=None):
+        '''Returns the line of RAM being shown at time when (now if None).'''
+        when = self.now if when is None else when
+        return int((when - self.play_start) * PLAY_FPS) % MEMORY_ENTRIES
+
+    def run(self):
+        response, busy = b'', 0
+        while True:
+            command = yield response, busy
+            response, busy = b'', 0
+            if command == ord('w'):
+                # Update stored pattern RAM
+                address = yield b'', 0
+                data = bytearray()
+                for i in range(BYTES_PER_ENTRY):
+                    data.append((yield b'', 0))
+                self.ram[address * BYTES_PER_ENTRY:(address + 1) * BYTES_PER_ENTRY] = data
+                response = b'o' + bytes([address]) + bytes(data) + b'd'
+                # It goes back to waiting for commands as it starts the 'd'.
+                busy = len(response) - 1
+            elif command == ord('b'):
+                # Write a run of lines, acknowledged once with the sum of
+                # every byte after the 'b'
+                self.in_burst = True
+                address = yield b'', 0
+                count = (yield b'', 0) + 1
+                total = address + count - 1
+                for line in range(count):
+                    data = bytearray()
+                    for i in range(BYTES_PER_ENTRY):
+                        data.append((yield b'', 0))
+                    total += sum(data)
+                    start = ((address + line) % MEMORY_ENTRIES) * BYTES_PER_ENTRY
+                    self.ram[start:start + BYTES_PER_ENTRY] = data
+                self.in_burst = False
+                response = b'o' + struct.pack('>H', total & 0xffff) + b'd'
+                busy = len(response) - 1
+            elif command == ord('c'):
+                # Answer with the CRC of a run of lines
+                address = yield b'', 0
+                count = (yield b'', 0) + 1
+                crc = 0xffff
+                for line in range(count):
+                    start = ((address + line) % MEMORY_ENTRIES) * BYTES_PER_ENTRY
+                    crc = binascii.crc_hqx(self.ram[start:start + BYTES_PER_ENTRY], crc)
+                response = b'o' + struct.pack('>H', crc) + b'd'
+                busy = len(response) - 1
+            elif command == ord('m'):
+                # Change mode
+                mode_byte = yield b'', 0
+                self.mode = mode_byte & 3
+                response = bytes([mode_byte])
+            elif command == ord('i'):
+                # Set an individual LED
+                led = (yield b'', 0) & 0x1f
+                brightness = (yield b'', 0) & 7
+                self.individual_leds &= ~(7 << (led * 3))
+                self.individual_leds |= brightness << (led * 3)
+                self.individual_leds &= (1 << (3 * LEDS_PER_BOARD)) - 1
+                response = bytes([led, brightness])
+                busy = 1
+            elif command == ord('r'):
+                # Change baud rate, once the divisor has been echoed
+                divisor = yield b'', 0
+                response = bytes([divisor])
+                busy = 1
+                if 1 <= divisor <= 7:
+                    self.divisor = divisor
+                    self.rate_pending = True
+                    self.rate_changes += 1
+            elif command == ord('a'):
+                # Say which line is being shown
+                response = bytes([self.play_address()])
+            elif command == ord('p'):
+                # Ping, echoing each byte; confirms a new baud rate
+                intact = True
+                for expected in PING_BYTES:
+                    byte = yield response, busy
+                    intact = intact and byte == expected
+                    response, busy = bytes([byte]), 1
+                busy = 0
+                if intact:
+                    self.rate_pending = False
+
+    def led_state(self):
+        '''Returns the 24 intensities set with 'i' commands.'''
+        return led_mem_utils.unpack_entry(self.individual_leds)
+
+class BoardEmulator():
+    '''Runs a BoardModel behind a pseudo-terminal with the timing of a real
+    serial link.
+
+    Every byte takes 10 bit times to arrive and to be sent back. If fifo is
+    False, bytes which arrive while the board is busy sending a response are
+    lost, as on boards built before the receive FIFO was added. drop_rate and
+    corrupt_rate are the chances of each received byte being lost and each
+    sent byte having a bit flipped.
+
+    baudrate is the rate at the board's default divisor; the board can be
+    switched to faster ones. Above max_baudrate, if given, the link garbles
+    every byte, like a cable or adapter which can't keep up.'''
+
+    def __init__(self, baudrate=115200, fifo=True, drop_rate=0, corrupt_rate=0,
+                 seed=None, log=print, max_baudrate=None):
+        self.model = BoardModel()
+        self.model.play_start = time.time()
+        self.baudrate = baudrate
+        self.max_baudrate = max_baudrate
+        self.fifo = fifo
+        self.drop_rate = drop_rate
+        self.corrupt_rate = corrupt_rate
+        self.random = random.Random(seed)
+        self.log = log
+        self.faults = 0
+        self.rx_free_at = 0         # When the next byte can start arriving
+        self.tx_free_at = 0         # When the transmitter will be idle
+        self.machine_free_at = 0    # When the state machine will take a byte
+        self.last_arrival = 0       # When the last byte finished arriving
+        self.rate_changed = 0       # When the baud rate last changed
+        self.queued = collections.deque() # When each byte in the FIFO is taken
+        self.outgoing = queue.Queue()
+        self.master = None
+
+    def current_baudrate(self):
+        return self.baudrate * DEFAULT_DIVISOR / self.model.divisor
+
+    def byte_time(self):
+        return 10.0 / self.current_baudrate() if self.baudrate else 0
+
+    def garbled(self):
+        return self.max_baudrate and self.current_baudrate() > self.max_baudrate
+
+    def feed(self, data, now):
+        '''Runs bytes which started arriving at time now through the model,
+        returning (when, bytes) pairs for the responses.'''
+        responses = []
+        for byte in data:
+            if self.random.random() < self.drop_rate:
+                self.faults += 1
+                continue
+            if self.model.rate_pending and now - self.rate_changed > RATE_TIMEOUT:
+                self.model.abandon_rate()
+            byte_time = self.byte_time()
+            if self.garbled():
+                byte = self.random.randrange(256)
+            arrived = max(now, self.rx_free_at) + byte_time
+            self.rx_free_at = arrived
+            if arrived - self.last_arrival > BURST_TIMEOUT:
+                self.model.abandon_burst()
+            self.last_arrival = arrived
+            while self.queued and self.queued[0] <= arrived:
+                self.queued.popleft()
+            if self.fifo and len(self.queued) >= FIFO_DEPTH:
+                self.log('Receive FIFO overflowed; byte lost.')
+                continue
+            if not self.fifo and arrived < self.machine_free_at:
+                continue # Nobody was listening.
+            taken = max(arrived, self.machine_free_at)
+            self.queued.append(taken)
+            garbled = self.garbled()
+            self.model.now = taken
+            rate_changes = self.model.rate_changes
+            response, busy = self.model.receive(byte)
+            if not response:
+                continue
+            response = bytearray(response)
+            for i in range(len(response)):
+                if garbled:
+                    response[i] = self.random.randrange(256)
+                elif self.random.random() < self.corrupt_rate:
+                    self.faults += 1
+                    response[i] ^= 1 << self.random.randrange(8)
+            start = max(taken, self.tx_free_at)
+            self.tx_free_at = start + len(response) * byte_time
+            self.machine_free_at = start + busy * byte_time
+            if self.model.rate_changes != rate_changes:
+                # The new rate starts once the echo has been sent.
+                self.rate_changed = self.tx_free_at
+            responses.append((self.tx_free_at, bytes(response)))
+        return responses
+
+    def start(self, link=None):
+        '''Opens the pseudo-terminal and starts serving it in the background.
+        Returns the name of the port to connect to (link, if given, is made a
+        symlink to it).'''
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        # Keep the slave open so reads don't fail while no tool is connected.
+        self.slave = slave
+        port = os.ttyname(slave)
+        if link:
+            if os.path.lexists(link):
+                os.remove(link)
+            os.symlink(port, link)
+            port = link
+        threading.Thread(target=self.receive_loop, daemon=True).start()
+        threading.Thread(target=self.send_loop, daemon=True).start()
+        return port
+
+    def receive_loop(self):
+        while True:
+            data = os.read(self.master, 4096)
+            for response in self.feed(data, time.time()):
+                self.outgoing.put(response)
+
+    def send_loop(self):
+        while True:
+            when, response = self.outgoing.get()
+            delay = when - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            os.write(self.master, response)
+
+    def dump(self, path):
+        '''Writes the pattern RAM to path, as a pattern image if it ends in
+        .bin or a text pattern file otherwise.'''
+        if path.endswith('.bin'):
+            pattern_image.write_image(path, self.model.ram)
+        else:
+            led_mem_utils.write_pattern_file(path, self.model.ram)
+
+    def print_state(self):
+        print('Display mode {0}. Individual LEDs:'.format(self.model.mode))
+        pretty_print_frame(Frame(0, self.model.led_state()))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baud", type=int, default=115200,
+                        help="Baud rate to pace the link at; 0 to answer instantly.")
+    parser.add_argument("--max-baud", type=int,
+                        help="Garble everything sent faster than this, to see "
+                             "the tools fall back to a slower baud rate.")
+    parser.add_argument("--no-fifo", dest='fifo', action='store_false',
+                        help="Behave like boards without the receive FIFO.")
+    parser.add_argument("--drop-rate", type=float, default=0,
+                        help="Chance of losing each received byte.")
+    parser.add_argument("--corrupt-rate", type=float, default=0,
+                        help="Chance of flipping a bit of each sent byte.")
+    parser.add_argument("--seed", type=int, help="Seed for the fault injection.")
+    parser.add_argument("--ram", help="Pattern file or image to load the RAM with.")
+    parser.add_argument("--link", help="Make a symlink with this name to the port.")
+    parser.add_argument("--dump", help="Write the RAM to this pattern file "
+                        "(or image, if it ends in .bin) on exit.")
+    if len(sys.argv) > 1 and sys.argv[1] in ('-h', '--help'):
+        print(usage)
+    args = parser.parse_args()
+
+    emulator = BoardEmulator(args.baud, args.fifo, args.drop_rate,
+                             args.corrupt_rate, args.seed,
+                             max_baudrate=args.max_baud)
+    if args.ram:
+        emulator.model.ram[:] = pattern_image.read_memory(args.ram)
+    port = emulator.start(args.link)
+    print('Emulating a board on {0}. Press Ctrl-C to stop.'.format(port))
+    sys.stdout.flush()
+    # Stop the same way when killed, so the RAM still gets dumped.
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, interrupt)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print()
+    emulator.print_state()
+    if emulator.faults:
+        print('Injected {0} faults.'.format(emulator.faults))
+    if args.dump:
+        emulator.dump(args.dump)
+        print('Wrote RAM to {0}.'.format(args.dump))
+    if args.link:
+        os.remove(args.link)
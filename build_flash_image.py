@@ -0,0 +1,6 @@
+# Runs xmascard/build_flash_image.py, so that it can still be run from here without
+# installing the package.
+from xmascard.build_flash_image import main
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,9 @@ REM Create the prom file
 promgen -w -p bin -o %PROM_FILE% -s 512 -u 0000 %1 -spi
 IF %ERRORLEVEL% NEQ 0 GOTO Error
 
-REM Determine how big the file is
-FOR /F "usebackq" %%A IN ('%PROM_FILE%.bin') DO set promsize=%%~zA
-IF %ERRORLEVEL% NEQ 0 GOTO Error
-
-REM Pad the file
-AddBytesToFlash.exe %PROM_FILE%.bin %PADDED_PROM_FILE% %promsize% %SIZE_512KB%
+REM Pad the file to the size of the flash, adding any patterns given after the
+REM bitstream to the space it leaves
+python build_flash_image.py %PROM_FILE%.bin %PADDED_PROM_FILE% --size %SIZE_512KB% %2 %3 %4 %5 %6 %7 %8 %9
 IF %ERRORLEVEL% NEQ 0 GOTO Error
 
 REM Program the flash
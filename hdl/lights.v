@@ -39,6 +39,9 @@ module lights(
     wire [7:0] pat_up_a;
     wire [71:0] pat_up_d;
     wire pat_up_we;
+    wire pat_up_re;
+    wire [71:0] pat_q;
+    wire [7:0] play_addr;
 
     wire [1:0] pattern_type; // 0: free running, 1: stored pattern, 2: random, 3: individual LEDs
 
@@ -48,9 +51,9 @@ module lights(
         .leds(leds)
     );
 
-    stored_pattern p(clk_uart, step, pat_up_a, pat_up_d, pat_up_we, leds_p);
+    stored_pattern p(clk_uart, step, pat_up_a, pat_up_d, pat_up_we, pat_up_re, pat_q, leds_p, play_addr);
     random r(clk_uart, step, pwm_counter, leds_r);
-    serial s(clk_uart, rx_i, tx, pat_up_a, pat_up_d, pat_up_we, pattern_type, leds_i);
+    serial s(clk_uart, rx_i, tx, pat_up_a, pat_up_d, pat_up_we, pattern_type, leds_i, pat_up_re, pat_q, play_addr);
     wire clk_switch = clk_div[26];
     always @ (*)
         case (pattern_type)
@@ -151,12 +154,25 @@ module stored_pattern(
     input [7:0] pat_up_a,
     input [71:0] pat_up_d,
     input pat_up_we,
-    output [71:0] leds
+    input pat_up_re,
+    output [71:0] pat_q,
+    output reg [71:0] leds = 0,
+    output [7:0] play_addr
     );
     
     wire [71:0] led_values;
-    assign leds = led_values;
+    assign pat_q = led_values;
     reg [7:0] prog_addr = 0;
+    assign play_addr = prog_addr;
+
+    // The serial port borrows the RAM's only port to write and read lines.
+    // Keep showing the current step while it does, rather than flashing
+    // whichever line it asked for.
+    reg serial_access_l = 0;
+    always @ (posedge clk) begin
+        serial_access_l <= pat_up_we || pat_up_re;
+        if (!serial_access_l) leds <= led_values;
+    end
 
     // 12 LEDs. 8 bits of color per LED; 4 bits per color. 96 bits per program
     // step. BRAMs have 256 x 72 at their widest. Could we reduce the colors so
@@ -167,7 +183,7 @@ module stored_pattern(
     ram72bit pattern_ram (
       .clka(clk), // input clka
       .wea(pat_up_we), // input [0 : 0] wea
-      .addra(pat_up_we ? pat_up_a : prog_addr), // input [7 : 0] addra
+      .addra((pat_up_we || pat_up_re) ? pat_up_a : prog_addr), // input [7 : 0] addra
       .dina(pat_up_d), // input [71 : 0] dina
       .douta(led_values) // output [71 : 0] douta
     );
@@ -1,4 +1,9 @@
 `timescale 1ns / 1ps
+
+// The UART clock divided by 8 times 115200. Other divisors give 806400 / n
+// baud.
+`define DEFAULT_DIVISOR 7
+
 module serial(
     input clk_uart,
     input rx,
@@ -7,7 +12,10 @@ module serial(
     output [71:0] d,
     output we,
     output [1:0] pattern_type, // 0: free running, 1: stored pattern, 2: random, 3: individual LEDs
-    output [71:0] specific_led_values
+    output [71:0] specific_led_values,
+    output re, // Read line a of the pattern RAM
+    input [71:0] q, // The line read, the clock after re
+    input [7:0] play_addr // The line of the pattern RAM being shown
     );
     
     wire done, rdy, xmit, busy;
@@ -15,7 +23,8 @@ module serial(
     wire [7:0] txd;
 
     wire tick_8x;
-    uart_clk_synth u(clk_uart, tick_8x);
+    wire [2:0] divisor;
+    uart_clk_synth u(clk_uart, divisor, tick_8x);
   
     tx t(.clk(clk_uart),
          .tick_8x(tick_8x),
@@ -26,11 +35,22 @@ module serial(
          .busy(busy),
          .error());
 
+    wire uart_rdy, statem_ready;
+    wire [7:0] uart_rxd;
     rx r(.clk(clk_uart),
          .tick_8x(tick_8x),
          .rx(rx),
-         .data_received(rdy),
-         .rxd(rxd));
+         .data_received(uart_rdy),
+         .rxd(uart_rxd));
+
+    // Buffer received bytes so the host can send the next command while the
+    // response to the previous one is still being transmitted.
+    rx_fifo f(.clk(clk_uart),
+              .din(uart_rxd),
+              .wr(uart_rdy),
+              .ready(statem_ready),
+              .dout(rxd),
+              .valid(rdy));
          
     new_pattern statem(clk_uart,
                        rxd, 
@@ -42,7 +62,12 @@ module serial(
                        d, 
                        we, 
                        pattern_type, 
-                       specific_led_values);
+                       specific_led_values,
+                       statem_ready,
+                       re,
+                       q,
+                       divisor,
+                       play_addr);
 
 endmodule
 
@@ -57,11 +82,41 @@ module new_pattern(
     output reg [71:0] d = 0,
     output reg we = 0,
     output reg [1:0] mode = 0,
-    output reg [71:0] individual_leds = 0
+    output reg [71:0] individual_leds = 0,
+    output ready,
+    output reg re = 0,
+    input [71:0] q,
+    output reg [2:0] divisor = `DEFAULT_DIVISOR,
+    input [7:0] play_addr
     );
 
     reg [4:0] led = 0;
     reg [2:0] led_brightness = 0;
+
+    // Burst writes ('b') reuse the RECEIVE_DATA states for each line, then
+    // acknowledge the whole burst at once with the 16 bit sum of every byte
+    // after the 'b'. Verifies ('c') answer with the CRC of a run of lines.
+    // Either way the answer is built up in check.
+    reg burst = 0;
+    reg [7:0] lines_left = 0;
+    reg [15:0] check = 0;
+
+    // If a burst stops part way through (a byte was lost), give up on it
+    // after this many clocks without a byte, about 40 ms, so the following
+    // commands aren't taken for line data.
+    parameter BURST_TIMEOUT_BITS = 18;
+    reg [BURST_TIMEOUT_BITS-1:0] idle = 0;
+
+    // A new baud rate ('r') is only kept once a ping ('p') arrives intact at
+    // it. Until then rate_pending is set, and if no good ping has arrived
+    // after this many clocks, about a third of a second, the port goes back to
+    // 115200 so a host which can't keep up can always get through again.
+    parameter RATE_TIMEOUT_BITS = 21;
+    reg [RATE_TIMEOUT_BITS-1:0] rate_wait = 0;
+    reg rate_pending = 0;
+    reg [2:0] new_divisor = `DEFAULT_DIVISOR;
+    reg [2:0] ping_index = 0;
+    reg ping_ok = 0;
     
     integer s = 0;
     `define RESET 0
@@ -70,30 +125,104 @@ module new_pattern(
     `define READBACK (`RECEIVE_DATA + 9)
     `define SWITCH_MODE (`READBACK + 11)
     `define INDIVIDUAL_LEDS (`SWITCH_MODE + 1)
+    `define BURST_ADDR (`INDIVIDUAL_LEDS + 3)
+    `define BURST_COUNT (`BURST_ADDR + 1)
+    `define BURST_NEXT (`BURST_COUNT + 1)
+    `define BURST_ACK (`BURST_NEXT + 1)
+    `define VERIFY_ADDR (`BURST_ACK + 3)
+    `define VERIFY_COUNT (`VERIFY_ADDR + 1)
+    `define VERIFY_READ (`VERIFY_COUNT + 1)
+    `define SET_RATE (`VERIFY_READ + 4)
+    `define PING (`SET_RATE + 2)
+    `define PLAY_ADDR (`PING + 1)
+
+    // The bytes a ping carries after the 'p'. They exercise every bit both
+    // ways, and none of them is a command, so a board without pings ignores
+    // them.
+    function [7:0] ping_byte;
+        input [2:0] index;
+        case (index)
+            0: ping_byte = 8'h00;
+            1: ping_byte = 8'hFF;
+            2: ping_byte = 8'h55;
+            3: ping_byte = 8'hAA;
+            4: ping_byte = 8'h0F;
+            5: ping_byte = 8'hF0;
+            6: ping_byte = 8'h33;
+            7: ping_byte = 8'hCC;
+        endcase
+    endfunction
+
+    // CRC-16-CCITT (polynomial 0x1021, not reflected) of a line, most
+    // significant bit first, continuing from crc. Starting from 16'hFFFF this
+    // matches Python's binascii.crc_hqx(line, 0xFFFF).
+    function [15:0] crc16_line;
+        input [15:0] crc;
+        input [71:0] line;
+        integer i;
+        begin
+            crc16_line = crc;
+            for (i = 71; i >= 0; i = i - 1)
+                crc16_line = {crc16_line[14:0], 1'b0} ^
+                             ((crc16_line[15] ^ line[i]) ? 16'h1021 : 16'h0000);
+        end
+    endfunction
+
+    // Ask the receive FIFO for the next byte only in states which consume one.
+    // States which answer as soon as the byte arrives also have to wait for
+    // the transmitter, since the FIFO can hand bytes over back to back.
+    assign ready = (s == `RESET) || (s == `RECEIVE_ADDR) ||
+                   (s >= `RECEIVE_DATA && s < `RECEIVE_DATA + 8) ||
+                   (s == `INDIVIDUAL_LEDS) ||
+                   (s == `BURST_ADDR) || (s == `BURST_COUNT) ||
+                   (s == `VERIFY_ADDR) || (s == `VERIFY_COUNT) ||
+                   (!busy && (s == `RECEIVE_DATA + 8 ||
+                              s == `SWITCH_MODE ||
+                              s == `INDIVIDUAL_LEDS + 1 ||
+                              s == `SET_RATE ||
+                              s == `PING));
+
     always @ (posedge clk) begin
         xmit <= 0;
         we <= 0;
+        re <= 0;
         case (s)
             `RESET: if (data_received) begin
                 case (rxd)
-                    "w":        s <= `RECEIVE_ADDR;
+                    "w":        begin burst <= 0; s <= `RECEIVE_ADDR; end
+                    "b":        begin burst <= 1; check <= 0; s <= `BURST_ADDR; end
+                    "c":        begin check <= 16'hFFFF; s <= `VERIFY_ADDR; end
                     "m":        s <= `SWITCH_MODE;
                     "i":        s <= `INDIVIDUAL_LEDS;
+                    "r":        s <= `SET_RATE;
+                    "p":        begin ping_index <= 0; ping_ok <= 1; s <= `PING; end
+                    "a":        s <= `PLAY_ADDR;
                     default:    s <= `RESET;
                 endcase
             end
 
             // Update stored pattern RAM
             `RECEIVE_ADDR:      if (data_received) begin a <= rxd; s <= s + 1; end
-            `RECEIVE_DATA:      if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 1:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 2:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 3:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 4:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 5:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 6:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 7:  if (data_received) begin d <= {d[63:0], rxd}; s <= s + 1; end
-            `RECEIVE_DATA + 8:  if (data_received) begin d <= {d[63:0], rxd}; txd <= "o"; xmit <= 1; we <= 1; s <= `READBACK; end
+            `RECEIVE_DATA:      if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 1:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 2:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 3:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 4:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 5:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 6:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 7:  if (data_received) begin d <= {d[63:0], rxd}; check <= check + rxd; s <= s + 1; end
+            `RECEIVE_DATA + 8:  if (data_received) begin
+                                    d <= {d[63:0], rxd};
+                                    check <= check + rxd;
+                                    we <= 1;
+                                    if (burst) begin
+                                        s <= `BURST_NEXT;
+                                    end else begin
+                                        txd <= "o";
+                                        xmit <= 1;
+                                        s <= `READBACK;
+                                    end
+                                end
             
             `READBACK:          if (!busy) begin txd <= a;          xmit <= 1; s <= s + 1; end
             `READBACK + 1:      if (!busy) begin txd <= d[71:64];   xmit <= 1; s <= s + 1; end
@@ -120,11 +249,138 @@ module new_pattern(
                                                          xmit <= 1;
                                                          s <= `RESET;
                                            end
+
+            // Write a run of lines: "b" [START ADDR] [COUNT - 1] then COUNT
+            // lines of 9 bytes, each written as soon as it arrives. The line
+            // just written is still being stored as a is moved on to the next.
+            `BURST_ADDR:        if (data_received) begin a <= rxd; check <= check + rxd; s <= s + 1; end
+            `BURST_COUNT:       if (data_received) begin lines_left <= rxd; check <= check + rxd; s <= `RECEIVE_DATA; end
+            `BURST_NEXT:        if (!busy) begin
+                                    a <= a + 1;
+                                    if (lines_left == 0) begin
+                                        txd <= "o";
+                                        xmit <= 1;
+                                        s <= `BURST_ACK;
+                                    end else begin
+                                        lines_left <= lines_left - 1;
+                                        s <= `RECEIVE_DATA;
+                                    end
+                                end
+            `BURST_ACK:         if (!busy) begin txd <= check[15:8]; xmit <= 1; s <= s + 1; end
+            `BURST_ACK + 1:     if (!busy) begin txd <= check[7:0];  xmit <= 1; s <= s + 1; end
+            `BURST_ACK + 2:     if (!busy) begin txd <= "d";         xmit <= 1; burst <= 0; s <= `RESET; end
+
+            // Verify a run of lines: "c" [START ADDR] [COUNT - 1], answered
+            // like a burst but with the CRC of the lines. Each line is read
+            // with re, and arrives on q the clock after next.
+            `VERIFY_ADDR:       if (data_received) begin a <= rxd; s <= s + 1; end
+            `VERIFY_COUNT:      if (data_received) begin lines_left <= rxd; s <= s + 1; end
+            `VERIFY_READ:       begin re <= 1; s <= s + 1; end
+            `VERIFY_READ + 1:   s <= s + 1;
+            `VERIFY_READ + 2:   begin
+                                    // q only holds the line for this clock.
+                                    check <= crc16_line(check, q);
+                                    a <= a + 1;
+                                    if (lines_left == 0) begin
+                                        s <= s + 1;
+                                    end else begin
+                                        lines_left <= lines_left - 1;
+                                        s <= `VERIFY_READ;
+                                    end
+                                end
+            `VERIFY_READ + 3:   if (!busy) begin txd <= "o"; xmit <= 1; s <= `BURST_ACK; end
+
+            // Change baud rate: "r" [DIVISOR], for 806400 / DIVISOR baud (7 is
+            // 115200). The divisor is echoed at the old rate, then the new
+            // one is tried until a ping confirms it. Divisors which aren't
+            // 1-7 are echoed and ignored.
+            `SET_RATE:          if (data_received) begin
+                                    new_divisor <= rxd;
+                                    txd <= rxd;
+                                    xmit <= 1;
+                                    s <= (rxd >= 1 && rxd <= 7) ? s + 1 : `RESET;
+                                end
+            `SET_RATE + 1:      if (!busy) begin
+                                    divisor <= new_divisor;
+                                    rate_pending <= 1;
+                                    s <= `RESET;
+                                end
+
+            // Ping: "p" then the 8 ping bytes, each echoed as it arrives. If
+            // they all arrived intact, the baud rate is good.
+            `PING:              if (data_received) begin
+                                    txd <= rxd;
+                                    xmit <= 1;
+                                    ping_index <= ping_index + 1;
+                                    ping_ok <= ping_ok && rxd == ping_byte(ping_index);
+                                    if (ping_index == 7) begin
+                                        if (ping_ok && rxd == ping_byte(ping_index))
+                                            rate_pending <= 0;
+                                        s <= `RESET;
+                                    end
+                                end
+
+            // Say which line of the pattern RAM is being shown: "a", answered
+            // with the address. The host uses it to keep writing a long
+            // animation into the lines which have already been shown.
+            `PLAY_ADDR:         if (!busy) begin txd <= play_addr; xmit <= 1; s <= `RESET; end
         endcase
+
+        // Abandon a burst which has stopped arriving. The acknowledgement
+        // doesn't wait on the host, so only the receiving states count.
+        idle <= (data_received || !burst || s >= `BURST_ACK) ? 0 : idle + 1;
+        if (&idle) begin
+            burst <= 0;
+            s <= `RESET;
+        end
+
+        // Go back to 115200 if the new baud rate was never confirmed. Whatever
+        // was received at it is probably garbage, so start afresh.
+        rate_wait <= rate_pending ? rate_wait + 1 : 0;
+        if (&rate_wait) begin
+            divisor <= `DEFAULT_DIVISOR;
+            rate_pending <= 0;
+            burst <= 0;
+            s <= `RESET;
+        end
     end
 
 endmodule
 
+module rx_fifo(
+    input clk,
+    input [7:0] din,
+    input wr,
+    input ready,
+    output reg [7:0] dout = 0,
+    output reg valid = 0
+    );
+    parameter DEPTH_BITS = 6; // 64 bytes; enough for 5 'w' commands in flight
+
+    reg [7:0] mem [0:(1 << DEPTH_BITS) - 1];
+    reg [DEPTH_BITS-1:0] wr_ptr = 0;
+    reg [DEPTH_BITS-1:0] rd_ptr = 0;
+    wire empty = wr_ptr == rd_ptr;
+    wire full = (wr_ptr + 1'b1) == rd_ptr;
+
+    always @ (posedge clk) begin
+        valid <= 0;
+        // If the host overruns the FIFO the byte is dropped; the host will
+        // notice when the response doesn't match.
+        if (wr && !full) begin
+            mem[wr_ptr] <= din;
+            wr_ptr <= wr_ptr + 1;
+        end
+        // Hand over one byte at a time. Skip the cycle right after handing one
+        // over, since the state machine hasn't moved on to its next state yet.
+        if (ready && !empty && !valid) begin
+            dout <= mem[rd_ptr];
+            valid <= 1;
+            rd_ptr <= rd_ptr + 1;
+        end
+    end
+endmodule
+
 `define RESET_TYPE_ZEROS 0
 `define RESET_TYPE_HALF 1
 
@@ -245,6 +501,7 @@ endmodule
 
 module uart_clk_synth(
     input clk,
+    input [2:0] divisor, // Clocks per tick; 7 for 115200 baud
     output reg uart_8x_tick = 0
     );
 
@@ -253,7 +510,8 @@ module uart_clk_synth(
     always @ (posedge clk) begin
         clk_div <= clk_div + 1;
         uart_8x_tick <= 0;
-        if (clk_div == 6) begin
+        // >= rather than == in case the divisor has just been made smaller.
+        if (clk_div >= divisor - 1) begin
             clk_div <= 0;
             uart_8x_tick <= 1;
         end
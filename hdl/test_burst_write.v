@@ -0,0 +1,328 @@
+`timescale 1ns / 1ps
+
+//
+// Validates the burst write ('b'), verify ('c'), baud rate ('r' and 'p') and
+// playback address ('a') commands in serial.v, and that the old 'w' command still works alongside
+// them.
+//
+// Unlike the other testbenches this one only needs serial.v, not the Xilinx
+// clock and RAM cores, so it runs in a free simulator:
+//
+//     iverilog -o test_burst_write hdl/test_burst_write.v hdl/serial.v
+//     vvp test_burst_write
+//
+// It also runs in Verilator 5: build the same two files with --binary
+// --timing --top-module test -Wno-fatal (adding -CFLAGS "-std=c++20
+// -fcoroutines" if the compiler doesn't enable coroutines by itself), then run
+// obj_dir/Vtest.
+//
+// The pattern RAM is modelled here: it records what the serial module writes
+// to it and, like the block RAM, answers reads on the clock after re.
+//
+
+module test;
+
+    reg clk = 0;
+    reg rx = 1; // RS-232 idle condition is logic high
+    wire tx;
+    wire [7:0] a;
+    wire [71:0] d;
+    wire we;
+    wire [1:0] pattern_type;
+    wire [71:0] specific_led_values;
+    wire re;
+    reg [71:0] q = 0;
+    reg [7:0] play_addr = 8'h5A;
+
+    reg [71:0] ram [0:255];
+    reg [7:0] received [0:63];
+    integer received_count = 0;
+    integer failures = 0;
+    integer i;
+    integer j;
+    reg [15:0] sum;
+    reg [71:0] line;
+    integer bit_time = 8681; // ns at the port's current baud rate
+
+    serial uut(.clk_uart(clk),
+               .rx(rx),
+               .tx(tx),
+               .a(a),
+               .d(d),
+               .we(we),
+               .pattern_type(pattern_type),
+               .specific_led_values(specific_led_values),
+               .re(re),
+               .q(q),
+               .play_addr(play_addr));
+
+    // Give up on stalled bursts after 4096 clocks rather than 40 ms, to keep
+    // the simulation short.
+    defparam uut.statem.BURST_TIMEOUT_BITS = 12;
+    // Likewise give up on an unconfirmed baud rate after 16384 clocks.
+    defparam uut.statem.RATE_TIMEOUT_BITS = 14;
+
+    // The UART clock: 6.4512 MHz, 56 cycles per bit at 115200 baud.
+    always #77.5 clk = ~clk;
+
+    // While the serial module isn't reading, q holds something else (the
+    // board would be reading the playing step), so a read at the wrong time
+    // gives the wrong CRC.
+    always @ (posedge clk) begin
+        if (we) ram[a] <= d;
+        q <= re ? ram[a] : {9{8'hA5}};
+    end
+
+    // The data written to line n of the burst.
+    function [71:0] test_line;
+        input [7:0] n;
+        test_line = {n, 8'h11, 8'h22, 8'h33, 8'h44, 8'h55, 8'h66, 8'h77, ~n};
+    endfunction
+
+    // What a ping carries after the 'p', which the board checks for.
+    function [7:0] ping_byte;
+        input [2:0] index;
+        ping_byte = {8'h00, 8'hFF, 8'h55, 8'hAA, 8'h0F, 8'hF0, 8'h33, 8'hCC} >> ((7 - index) * 8);
+    endfunction
+
+    initial begin
+        #1000;
+
+        // The original single line write still answers with the line.
+        xmit_byte("w");
+        xmit_byte(8'h10);
+        line = test_line(8'h10);
+        for (i=8; i>=0; i=i-1) xmit_byte(line[i*8 +: 8]);
+        wait_for_bytes(12);
+        expect_byte(0, "o");
+        expect_byte(1, 8'h10);
+        for (i=0; i<9; i=i+1) expect_byte(2 + i, line[(8-i)*8 +: 8]);
+        expect_byte(11, "d");
+        expect_line(8'h10, line);
+
+        // A burst of 4 lines starting at 254 wraps round to 0 and 1, and is
+        // acknowledged once with the sum of everything after the 'b'.
+        received_count = 0;
+        xmit_byte("b");
+        xmit_byte(8'hFE);
+        xmit_byte(8'h03);
+        sum = 8'hFE + 8'h03;
+        for (j=0; j<4; j=j+1) begin
+            line = test_line(j);
+            for (i=8; i>=0; i=i-1) begin
+                xmit_byte(line[i*8 +: 8]);
+                sum = sum + line[i*8 +: 8];
+            end
+        end
+        wait_for_bytes(4);
+        expect_byte(0, "o");
+        expect_byte(1, sum[15:8]);
+        expect_byte(2, sum[7:0]);
+        expect_byte(3, "d");
+        expect_line(8'hFE, test_line(0));
+        expect_line(8'hFF, test_line(1));
+        expect_line(8'h00, test_line(2));
+        expect_line(8'h01, test_line(3));
+        expect_line(8'h10, test_line(8'h10));
+
+        // Two verifies sent back to back: line 16 alone, then the four lines
+        // of the burst. The CRCs are CRC-16-CCITT from 16'hFFFF, as Python's
+        // binascii.crc_hqx() computes them.
+        received_count = 0;
+        xmit_byte("c");
+        xmit_byte(8'h10);
+        xmit_byte(8'h00);
+        xmit_byte("c");
+        xmit_byte(8'hFE);
+        xmit_byte(8'h03);
+        wait_for_bytes(8);
+        expect_byte(0, "o");
+        expect_byte(1, 8'h3B);
+        expect_byte(2, 8'h46);
+        expect_byte(3, "d");
+        expect_byte(4, "o");
+        expect_byte(5, 8'h0A);
+        expect_byte(6, 8'h53);
+        expect_byte(7, "d");
+
+        // A burst which stops part way is abandoned, and the next command
+        // works.
+        received_count = 0;
+        xmit_byte("b");
+        xmit_byte(8'h20);
+        xmit_byte(8'h01);
+        for (i=0; i<5; i=i+1) xmit_byte(8'hEE);
+        #1000000;
+        xmit_byte("m");
+        xmit_byte(8'h01);
+        wait_for_bytes(1);
+        expect_byte(0, 8'h01);
+        if (pattern_type != 1) begin
+            $display("Mode is %d after the abandoned burst", pattern_type);
+            failures = failures + 1;
+        end
+
+        // Asking which line is playing, twice as it moves on.
+        received_count = 0;
+        xmit_byte("a");
+        wait_for_bytes(1);
+        expect_byte(0, 8'h5A);
+        play_addr = 8'h5B;
+        xmit_byte("a");
+        wait_for_bytes(2);
+        expect_byte(1, 8'h5B);
+
+        // Switch to 403200 baud: the divisor is echoed at 115200, then a ping
+        // at the new rate is echoed and keeps it.
+        received_count = 0;
+        xmit_byte("r");
+        xmit_byte(8'h02);
+        wait_for_bytes(1);
+        expect_byte(0, 8'h02);
+        bit_time = 2480;
+        #10000; // Until the echo's stop bit is over and the rate changes
+        received_count = 0;
+        xmit_ping;
+        wait_for_bytes(8);
+        for (i=0; i<8; i=i+1) expect_byte(i, ping_byte(i));
+        #3000000;
+        expect_divisor(2);
+
+        // Back to 115200, confirmed in the same way.
+        received_count = 0;
+        xmit_byte("r");
+        xmit_byte(8'h07);
+        wait_for_bytes(1);
+        expect_byte(0, 8'h07);
+        bit_time = 8681;
+        #10000;
+        received_count = 0;
+        xmit_ping;
+        wait_for_bytes(8);
+
+        // Divisors out of range are echoed and ignored, even those whose low
+        // bits would make a valid one.
+        received_count = 0;
+        xmit_byte("r");
+        xmit_byte(8'h00);
+        xmit_byte("r");
+        xmit_byte(8'h09);
+        wait_for_bytes(2);
+        expect_byte(0, 8'h00);
+        expect_byte(1, 8'h09);
+        #10000;
+        expect_divisor(7);
+
+        // A rate which is never confirmed is dropped again, and the next
+        // command works at 115200.
+        received_count = 0;
+        xmit_byte("r");
+        xmit_byte(8'h01);
+        wait_for_bytes(1);
+        expect_byte(0, 8'h01);
+        #3000000;
+        expect_divisor(7);
+        received_count = 0;
+        xmit_byte("m");
+        xmit_byte(8'h02);
+        wait_for_bytes(1);
+        expect_byte(0, 8'h02);
+
+        if (failures == 0)  $display("Test passed");
+        else                $display("Test failed");
+        $finish;
+    end
+
+    // Receiver loop
+    always begin
+        recv_byte(received[received_count % 64]);
+        received_count = received_count + 1;
+    end
+
+    task wait_for_bytes;
+        input integer count;
+        integer waited;
+        begin
+            waited = 0;
+            while (received_count < count && waited < 200) begin
+                #8681 waited = waited + 1;
+            end
+            if (received_count != count) begin
+                $display("Expected %0d bytes back, got %0d", count, received_count);
+                failures = failures + 1;
+            end
+        end
+    endtask
+
+    task expect_byte;
+        input integer index;
+        input [7:0] expected;
+        begin
+            if (received[index] !== expected) begin
+                $display("Byte %0d back was %h, expected %h", index, received[index], expected);
+                failures = failures + 1;
+            end
+        end
+    endtask
+
+    task expect_divisor;
+        input [2:0] expected;
+        begin
+            if (uut.statem.divisor !== expected) begin
+                $display("Divisor is %0d, expected %0d", uut.statem.divisor, expected);
+                failures = failures + 1;
+            end
+        end
+    endtask
+
+    task xmit_ping;
+        integer k;
+        begin
+            xmit_byte("p");
+            for (k=0; k<8; k=k+1) xmit_byte(ping_byte(k));
+        end
+    endtask
+
+    task expect_line;
+        input [7:0] address;
+        input [71:0] expected;
+        begin
+            if (ram[address] !== expected) begin
+                $display("Line %h is %h, expected %h", address, ram[address], expected);
+                failures = failures + 1;
+            end
+        end
+    endtask
+
+    task xmit_byte;
+        input [7:0] b;
+        integer i;
+        begin
+            #(bit_time) rx = 0; // start bit
+
+            for (i=0;i<8;i = i+1) begin
+                #(bit_time) rx = b[0];
+                b = {1'b0, b[7:1]};
+            end
+
+            #(bit_time) rx = 1; // stop bit
+        end
+    endtask
+
+    task recv_byte;
+        output [7:0] b;
+        integer i;
+        begin
+            b = 0;
+            @ (negedge tx); // Wait for start bit
+            #(bit_time/2);          // Wait half a bit period to align sampling to middle of transition.
+            // 8 times, wait a bit period and then sample the value, shifting in from left to right.
+            for (i=0;i<8;i = i+1) begin
+                b = {1'b0, b[7:1]};
+                #(bit_time) b[7] = tx;
+            end
+            #(bit_time/2);          // Wait another half a bit period to give the stop bit some time to occur.
+        end
+    endtask
+
+endmodule
@@ -0,0 +1,6 @@
+# Runs xmascard/import_images.py, so that it can still be run from here without
+# installing the package.
+from xmascard.import_images import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+# Runs xmascard/link_stats.py, so that it can still be run from here without
+# installing the package.
+from xmascard.link_stats import main
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,6 @@
-import sys
-print('memory_initialization_radix = 16;')
-vector = []
-vector.append('memory_initialization_vector = ')
-with open(sys.argv[1], 'r') as f:
-    for l in f:
-        vector.append(l.strip())
-        vector.append(',')
-vector.pop()
-vector.append(';')
-print(''.join(vector))
\ No newline at end of file
+# Runs xmascard/mif2coe.py, so that it can still be run from here without
+# installing the package.
+from xmascard.mif2coe import main
+
+if __name__ == '__main__':
+    main()
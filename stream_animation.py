@@ -0,0 +1,6 @@
+# Runs xmascard/stream_animation.py, so that it can still be run from here without
+# installing the package.
+from xmascard.stream_animation import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''The Christmas card's tools as a library.
+
+The most useful parts of the scripts are importable from here: the animation
+parser, the memory encoder, pattern images, the pattern generators and the
+serial client. Nothing is imported until it's first used, so importing this
+package doesn't pull in pyserial or NumPy unless something needs them:
+
+    import xmascard
+    with open('animation.txt') as f:
+        frames = list(xmascard.AnimationParser().parse(f))
+    xmascard.write_image('animation.bin', xmascard.convert_frames(frames))
+
+The scripts themselves are still the place to look for the details.'''
+
+import importlib
+
+# Which module each name comes from. Modules listed under their own name are
+# exported whole.
+EXPORTS = {
+    # Animation files
+    'AnimationParser': 'convert_animation_file',
+    'AnimationError': 'convert_animation_file',
+    'convert_frames': 'convert_animation_file',
+    'optimize_frames': 'convert_animation_file',
+    # Pictures
+    'import_pictures': 'import_images',
+    # The board's memory
+    'LEDS_PER_BOARD': 'led_mem_utils',
+    'MEMORY_ENTRIES': 'led_mem_utils',
+    'MemoryEntry': 'led_mem_utils',
+    'encode_frames': 'led_mem_utils',
+    'decode_frames': 'led_mem_utils',
+    'split_entries': 'led_mem_utils',
+    'read_pattern_file': 'led_mem_utils',
+    'write_pattern_file': 'led_mem_utils',
+    'read_image': 'pattern_image',
+    'write_image': 'pattern_image',
+    'read_memory': 'pattern_image',
+    # Generators
+    'patterns': 'patterns',
+    'generate': 'gen_top_down_waterfall_pattern',
+    # Talking to the board
+    'BoardClient': 'serial_utils',
+    'SerialWorker': 'serial_utils',
+    'find_card_ports': 'serial_utils',
+    'negotiate_baudrate': 'serial_utils',
+    'restore_baudrate': 'serial_utils',
+    'MODE_FREE_RUNNING': 'serial_utils',
+    'MODE_STORED_PATTERN': 'serial_utils',
+    'MODE_RANDOM': 'serial_utils',
+    'MODE_INDIVIDUAL_LEDS': 'serial_utils',
+    'set_display_mode': 'upload_new_pattern',
+    'upload_pattern': 'upload_new_pattern',
+    'write_lines': 'upload_new_pattern',
+}
+
+__all__ = sorted(EXPORTS)
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError("module 'xmascard' has no attribute '{0}'".format(name))
+    module = importlib.import_module('.' + EXPORTS[name], __name__)
+    value = module if EXPORTS[name] == name else getattr(module, name)
+    # Look it up directly from now on.
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
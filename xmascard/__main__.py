@@ -0,0 +1,3 @@
+from xmascard.cli import main
+
+main()
@@ -0,0 +1,228 @@
+usage = '''
+This program converts a whole library of animation files at once, in parallel,
+rather than one at a time with convert_animation_file.py.
+
+The input is either a directory, in which every .txt file (including those in
+subdirectories) is an animation, or a manifest: a text file listing one
+animation file per line, relative to the manifest, optionally followed by the
+name to give its output. Blank lines and lines starting with # are ignored.
+
+Outputs are pattern images (or text pattern files with --format txt) written
+to the output directory under the same relative names. A cache in the output
+directory remembers a hash of each animation and the converter version, so
+only files which changed since the last build are converted again.
+'''
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import time
+from xmascard import convert_animation_file
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.convert_animation_file import (AnimationParser, AnimationError,
+                                    CONVERTER_VERSION, convert_frames)
+from xmascard.led_mem_utils import MEMORY_ENTRIES
+
+CACHE_NAME = '.xmascard_build_cache.json'
+
+# Below this many files to convert, starting worker processes takes longer
+# than it saves.
+MIN_PARALLEL = 4
+
+def find_sources(path, output_dir=None):
+    '''Returns (source, output) pairs of paths for a directory or manifest,
+    with outputs relative to the output directory and missing their
+    extension. output_dir is skipped if it's inside the directory, so text
+    patterns written there aren't taken for animations.'''
+    if os.path.isdir(path):
+        skip = os.path.realpath(output_dir) if output_dir else None
+        sources = []
+        for directory, subdirectories, files in os.walk(path):
+            subdirectories[:] = sorted(
+                name for name in subdirectories
+                if os.path.realpath(os.path.join(directory, name)) != skip)
+            for name in sorted(files):
+                if name.endswith('.txt'):
+                    source = os.path.join(directory, name)
+                    sources.append((source, os.path.splitext(
+                                    os.path.relpath(source, path))[0]))
+        return sources
+    sources = []
+    base = os.path.dirname(path)
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            items = line.split(None, 1)
+            output = items[1] if len(items) > 1 else items[0]
+            sources.append((os.path.join(base, items[0]), os.path.splitext(output)[0]))
+    return sources
+
+def cache_key(source, fit):
+    '''Returns the key a conversion of source (its bytes) is cached under:
+    anything which would change the output has to be part of it.'''
+    key = hashlib.sha1()
+    key.update(json.dumps([CONVERTER_VERSION, fit,
+                           convert_animation_file.load_frame_store() is not None]).encode())
+    key.update(source)
+    return key.hexdigest()
+
+def convert_source(source, fit=None):
+    '''Converts the bytes of an animation file. Returns a report (a dict of
+    what happened, including any messages the converter printed) and the
+    memory image, which is None if the animation couldn't be parsed.'''
+    messages = []
+    def log(*items):
+        messages.append(' '.join(str(item) for item in items))
+    report = {'messages': messages}
+    try:
+        frames = list(AnimationParser(log=log).parse(
+            source.decode('utf-8').splitlines()))
+    except (AnimationError, UnicodeDecodeError) as e:
+        report['error'] = str(e)
+        return report, None
+    report['frames'] = len(frames)
+    frames = convert_animation_file.optimize_frames(frames, fit, log)
+    report['fitted_frames'] = len(frames)
+    report['truncated'] = max(len(frames) - MEMORY_ENTRIES, 0)
+    report['padded'] = max(MEMORY_ENTRIES - len(frames), 0)
+    return report, convert_frames(frames, log=log)
+
+def write_output(path, data, report, source, output_format):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if output_format == 'bin':
+        pattern_image.write_image(path, data, min(report['fitted_frames'],
+                                                  MEMORY_ENTRIES), source)
+    else:
+        led_mem_utils.write_pattern_file(path, data)
+
+def build(sources, output_dir, output_format='bin', fit=None, jobs=None):
+    '''Converts every (source, output) pair which isn't already up to date in
+    output_dir. Returns a dict from source path to its report.'''
+    cache_path = os.path.join(output_dir, CACHE_NAME)
+    try:
+        with open(cache_path, 'r') as f:
+            cache = json.load(f)
+    except (IOError, ValueError):
+        cache = {}
+
+    reports = {}
+    work = []
+    for source_path, output in sources:
+        output += '.' + output_format
+        with open(source_path, 'rb') as f:
+            source = f.read()
+        key = cache_key(source, fit)
+        cached = cache.get(output)
+        if (cached and cached['key'] == key and
+                os.path.exists(os.path.join(output_dir, output))):
+            reports[source_path] = dict(cached['report'], cached=True)
+        else:
+            work.append((source_path, output, source, key))
+
+    def finish(source_path, output, source, key, report, data):
+        if data is not None:
+            write_output(os.path.join(output_dir, output), data, report,
+                         source, output_format)
+            cache[output] = {'key': key, 'report': report}
+        else:
+            cache.pop(output, None)
+        reports[source_path] = dict(report, cached=False)
+
+    if len(work) >= MIN_PARALLEL and jobs != 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+            results = pool.map(convert_source, [item[2] for item in work],
+                               [fit] * len(work))
+            for item, (report, data) in zip(work, results):
+                finish(*item, report, data)
+    else:
+        for item in work:
+            finish(*item, *convert_source(item[2], fit))
+
+    os.makedirs(output_dir, exist_ok=True)
+    with open(cache_path, 'w') as f:
+        json.dump(cache, f)
+    return reports
+
+def print_report(reports):
+    '''Prints a line for each file, then a count of files with problems.
+    Returns the number which failed.'''
+    failed = 0
+    for source_path, report in sorted(reports.items()):
+        if 'error' in report:
+            failed += 1
+            print('{0}: FAILED: {1}'.format(source_path, report['error']))
+            continue
+        notes = []
+        if report['fitted_frames'] != report['frames']:
+            notes.append('fitted to {0}'.format(report['fitted_frames']))
+        if report['truncated']:
+            notes.append('WARNING: last {0} frames thrown out'.format(report['truncated']))
+        if report['padded']:
+            notes.append('last frame repeated {0} times'.format(report['padded']))
+        if report['cached']:
+            notes.append('unchanged')
+        print('{0}: {1} frames{2}'.format(source_path, report['frames'],
+              ''.join('; ' + note for note in notes)))
+    truncated = sum(1 for report in reports.values() if report.get('truncated'))
+    print('{0} files: {1} converted, {2} unchanged, {3} truncated, {4} failed.'.format(
+          len(reports),
+          sum(1 for report in reports.values()
+              if 'error' not in report and not report['cached']),
+          sum(1 for report in reports.values() if report.get('cached')),
+          truncated, failed))
+    return failed
+
+def main(argv=None, prog=None):
+    '''Converts the animations named on the command line, argv (sys.argv[1:]
+    if None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("input", help="A directory of animation files, or a manifest listing them.")
+    parser.add_argument("output_dir", help="The directory to write the converted patterns to.")
+    parser.add_argument("--format", choices=['bin', 'txt'], default='bin',
+                        help="Write pattern images (bin, the default) or text pattern files.")
+    parser.add_argument("--fit", type=convert_animation_file.frame_budget, nargs='?',
+                        const=MEMORY_ENTRIES, metavar='FRAMES',
+                        help="Shorten animations which are too long to fit, as "
+                             "convert_animation_file.py --fit does.")
+    parser.add_argument("--jobs", type=int,
+                        help="How many files to convert at once (default: one "
+                             "per processor).")
+    parser.add_argument("--report", metavar='FILE',
+                        help="Also write the report to FILE as JSON.")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+
+    if args.fit and not convert_animation_file.load_frame_store():
+        print('--fit needs NumPy to be installed.')
+        sys.exit(1)
+
+    start = time.time()
+    if (args.format == 'txt' and os.path.isdir(args.input) and
+            os.path.realpath(args.input) == os.path.realpath(args.output_dir)):
+        parser.error('text patterns written to the input directory would '
+                     'replace the animations; use another output directory.')
+    sources = find_sources(args.input, args.output_dir)
+    reports = build(sources, args.output_dir, args.format, args.fit, args.jobs)
+    failed = print_report(reports)
+    print('Took {0:.2f} seconds.'.format(time.time() - start))
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(reports, f, indent=2, sort_keys=True)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
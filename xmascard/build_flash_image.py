@@ -0,0 +1,247 @@
+usage = '''
+This program builds the image to write to the board's SPI flash: the FPGA
+bitstream made by promgen, padded with 0xFF to the size of the flash, with a
+bank of patterns in the space the bitstream doesn't use.
+
+The patterns can be pattern images, text pattern files, or directories, in
+which case every pattern image (.bin) in them is used, in order of name. Text
+pattern files shorter than the board's memory (like the waterfall, 208 lines)
+are filled out with lines which turn every LED off, as pattern images are. With
+no patterns it just pads the bitstream, as AddBytesToFlash.exe used to.
+
+The bank starts on the first 4 KB sector boundary after the bitstream (or at
+--bank-offset), so it can be erased and rewritten without touching the
+bitstream. In little endian order it holds:
+    4 bytes  magic, b'XBNK'
+    1 byte   format version
+    1 byte   reserved, zero
+    2 bytes  number of patterns
+    4 bytes  size of each pattern, 2304
+    4 bytes  CRC-32 of the index
+then an index of 32 byte entries, one per pattern:
+    4 bytes  where the pattern starts, from the start of the bank
+    2 bytes  number of frames in the animation before it was padded
+    2 bytes  reserved, zero
+    4 bytes  CRC-32 of the pattern
+    20 bytes name, UTF-8, padded with zeros
+then, from the next 256 byte flash page, the patterns themselves: the board's
+256 9-byte memory entries each, exactly as they are sent to it.
+
+The design in hdl/ doesn't read the bank yet; it still plays the pattern
+built into the FPGA.
+'''
+
+import argparse
+import binascii
+import mmap
+import os
+import struct
+import sys
+from xmascard import pattern_image
+from xmascard.led_mem_utils import BYTES_PER_ENTRY, MEMORY_ENTRIES, read_pattern_file
+from xmascard.pattern_image import IMAGE_SIZE
+
+FLASH_SIZE = 512 * 1024 # The MX25L4006E on the board
+SECTOR_SIZE = 4096      # The smallest part of the flash which can be erased
+PAGE_SIZE = 256         # The most of the flash which can be written at once
+
+BANK_MAGIC = b'XBNK'
+BANK_VERSION = 1
+BANK_HEADER = struct.Struct('<4sBBHII')
+INDEX_ENTRY = struct.Struct('<IHHI20s')
+NAME_SIZE = 20
+
+class Pattern():
+    '''A pattern to put in the bank: data is its 2304 byte memory image.'''
+    def __init__(self, name, data, frame_count=MEMORY_ENTRIES):
+        self.name = name
+        self.data = data
+        self.frame_count = frame_count
+
+def align(offset, alignment):
+    '''Rounds offset up to a multiple of alignment.'''
+    return (offset + alignment - 1) // alignment * alignment
+
+def read_patterns(paths):
+    '''Returns a Pattern for each pattern file named in paths, and for each
+    pattern image in the directories named in paths.'''
+    patterns = []
+    for path in paths:
+        if os.path.isdir(path):
+            names = sorted(name for name in os.listdir(path) if name.endswith('.bin'))
+            patterns += read_patterns([os.path.join(path, name) for name in names])
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        if pattern_image.is_image(path):
+            image = pattern_image.read_image(path)
+            patterns.append(Pattern(name, image.data, image.frame_count))
+        else:
+            data = read_pattern_file(path)
+            frame_count = min(len(data) // BYTES_PER_ENTRY, MEMORY_ENTRIES)
+            if len(data) < IMAGE_SIZE and len(data) % BYTES_PER_ENTRY == 0:
+                data += bytes(IMAGE_SIZE - len(data))
+            patterns.append(Pattern(name, data, frame_count))
+    return patterns
+
+def bank_size(count):
+    '''Returns how many bytes a bank of count patterns takes up.'''
+    return align(BANK_HEADER.size + count * INDEX_ENTRY.size, PAGE_SIZE) + count * IMAGE_SIZE
+
+def bank_capacity(space):
+    '''Returns how many patterns fit in a bank of space bytes.'''
+    count = space // (INDEX_ENTRY.size + IMAGE_SIZE)
+    while count and bank_size(count) > space:
+        count -= 1
+    return count
+
+def check_layout(bitstream_size, patterns, size, bank_offset):
+    '''Raises ValueError if the bitstream and a bank of patterns at
+    bank_offset don't fit in a flash of size bytes, or anything in them is
+    the wrong size or misaligned.'''
+    if size % SECTOR_SIZE:
+        raise ValueError('The flash size, {0} bytes, is not a whole number of '
+                         '{1} byte sectors.'.format(size, SECTOR_SIZE))
+    if bitstream_size > size:
+        raise ValueError('The bitstream is {0} bytes, which is more than the '
+                         '{1} byte flash holds.'.format(bitstream_size, size))
+    for pattern in patterns:
+        if len(pattern.data) != IMAGE_SIZE:
+            raise ValueError('Pattern {0} is {1} bytes but should be {2}.'.format(
+                             pattern.name, len(pattern.data), IMAGE_SIZE))
+    if not patterns:
+        return
+    if bank_offset % SECTOR_SIZE:
+        raise ValueError('The bank has to start on a {0} byte sector boundary, '
+                         'not at {1:#x}.'.format(SECTOR_SIZE, bank_offset))
+    if bank_offset < bitstream_size:
+        raise ValueError('The bank at {0:#x} would overwrite the end of the '
+                         'bitstream, which is {1} bytes.'.format(bank_offset, bitstream_size))
+    if bank_offset + bank_size(len(patterns)) > size:
+        raise ValueError('{0} patterns need {1} bytes, but there are only {2} '
+                         'after the bitstream, enough for {3}.'.format(
+                         len(patterns), bank_size(len(patterns)),
+                         max(size - bank_offset, 0),
+                         bank_capacity(max(size - bank_offset, 0))))
+
+def write_flash_image(path, bitstream, patterns, size=FLASH_SIZE, bank_offset=None):
+    '''Writes the flash image to path, memory mapped so that every byte is
+    written exactly once: bitstream, a bank of patterns at bank_offset (by
+    default the first sector after the bitstream) if there are any, and 0xFF
+    everywhere else. Returns where the bank starts, or None if there isn't
+    one.'''
+    if bank_offset is None:
+        bank_offset = align(len(bitstream), SECTOR_SIZE)
+    check_layout(len(bitstream), patterns, size, bank_offset)
+
+    with open(path, 'w+b') as f:
+        f.truncate(size)
+        with mmap.mmap(f.fileno(), size) as image:
+            position = 0
+            def put(data):
+                nonlocal position
+                image[position:position + len(data)] = data
+                position += len(data)
+            def pad_to(offset):
+                put(b'\xff' * (offset - position))
+
+            put(bitstream)
+            if patterns:
+                pad_to(bank_offset)
+                first = align(BANK_HEADER.size + len(patterns) * INDEX_ENTRY.size, PAGE_SIZE)
+                index = b''.join(INDEX_ENTRY.pack(
+                    first + i * IMAGE_SIZE, pattern.frame_count, 0,
+                    binascii.crc32(pattern.data) & 0xffffffff,
+                    pattern.name.encode('utf-8')[:NAME_SIZE])
+                    for i, pattern in enumerate(patterns))
+                put(BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, 0, len(patterns),
+                                     IMAGE_SIZE, binascii.crc32(index) & 0xffffffff))
+                put(index)
+                pad_to(bank_offset + first)
+                for pattern in patterns:
+                    put(pattern.data)
+            pad_to(size)
+            image.flush()
+    return bank_offset if patterns else None
+
+def find_bank(image):
+    '''Looks for a bank of patterns on a sector boundary of a flash image, the
+    way the board would. Returns (offset, patterns) with a Pattern for each
+    one whose data refers to image without copying it, or None if there is no
+    bank. Raises ValueError if the bank is corrupt.'''
+    for offset in range(0, len(image) - BANK_HEADER.size + 1, SECTOR_SIZE):
+        if image[offset:offset + len(BANK_MAGIC)] != BANK_MAGIC:
+            continue
+        magic, version, reserved, count, pattern_size, index_crc = \
+            BANK_HEADER.unpack_from(image, offset)
+        if version != BANK_VERSION or pattern_size != IMAGE_SIZE:
+            continue # Most likely part of the bitstream that happens to match.
+        start = offset + BANK_HEADER.size
+        index = image[start:start + count * INDEX_ENTRY.size]
+        if binascii.crc32(index) & 0xffffffff != index_crc:
+            continue
+        data = memoryview(image)
+        patterns = []
+        for i in range(count):
+            pattern_offset, frame_count, reserved, crc, name = \
+                INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size)
+            pattern_data = data[offset + pattern_offset:offset + pattern_offset + IMAGE_SIZE]
+            name = name.rstrip(b'\x00').decode('utf-8', 'replace')
+            if (len(pattern_data) != IMAGE_SIZE or
+                    binascii.crc32(pattern_data) & 0xffffffff != crc):
+                raise ValueError('Pattern {0} ({1}) in the bank at {2:#x} is '
+                                 'corrupt.'.format(i, name, offset))
+            patterns.append(Pattern(name, pattern_data, frame_count))
+        return offset, patterns
+    return None
+
+def main(argv=None, prog=None):
+    '''Builds the flash image the command line arguments, argv (sys.argv[1:]
+    if None), describe.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("bitstream", help="The .bin file made by promgen.")
+    parser.add_argument("output", help="The flash image to write.")
+    parser.add_argument("patterns", nargs='*',
+                        help="Pattern images, text pattern files or directories "
+                             "of pattern images to put in the bank.")
+    parser.add_argument("--size", type=int, default=FLASH_SIZE,
+                        help="Size of the flash in bytes (default: {0}).".format(FLASH_SIZE))
+    parser.add_argument("--bank-offset", type=lambda text: int(text, 0),
+                        help="Where to put the bank (ex: 0x60000). Has to be a "
+                             "multiple of {0}. By default it goes straight after "
+                             "the bitstream.".format(SECTOR_SIZE))
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+
+    try:
+        patterns = read_patterns(args.patterns)
+        with open(args.bitstream, 'rb') as f:
+            bitstream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        bank_offset = write_flash_image(args.output, bitstream, patterns,
+                                        args.size, args.bank_offset)
+    except (IOError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    print('Bitstream: {0} bytes.'.format(len(bitstream)))
+    if bank_offset is None:
+        print('Padded to {0} bytes.'.format(args.size))
+        return
+    # Read it back, as a check that it can be found and is intact.
+    with open(args.output, 'rb') as f:
+        image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    found = find_bank(image)
+    if found is None or found[0] != bank_offset or len(found[1]) != len(patterns):
+        print('The bank could not be read back from {0}.'.format(args.output))
+        sys.exit(1)
+    end = bank_offset + bank_size(len(patterns))
+    print('Bank: {0} patterns at {1:#x}-{2:#x}; room for {3} more.'.format(
+          len(patterns), bank_offset, end,
+          bank_capacity(args.size - bank_offset) - len(patterns)))
+
+if __name__ == '__main__':
+    main()
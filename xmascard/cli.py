@@ -0,0 +1,54 @@
+'''The xmascard command, which runs each of the scripts as a subcommand:
+
+    xmascard convert animation.txt memory.bin
+    xmascard upload COM3 memory.bin
+
+Only the script for the subcommand given is imported, so that e.g. converting
+an animation doesn't wait for pyserial or Tkinter to load.'''
+
+import collections
+import importlib
+import sys
+
+# Subcommand: (the script which implements it, what it does)
+COMMANDS = collections.OrderedDict([
+    ('convert', ('convert_animation_file',
+                 'Convert an animation file into a pattern for the board.')),
+    ('import', ('import_images',
+                'Turn an animated GIF or a sequence of pictures into a pattern.')),
+    ('generate', ('gen_top_down_waterfall_pattern',
+                  'Generate the waterfall pattern.')),
+    ('upload', ('upload_new_pattern',
+                'Upload a pattern to one or more cards.')),
+    ('export', ('mif2coe',
+                'Print a pattern as a .coe file, to build into the FPGA.')),
+    ('control', ('light_control',
+                 'Open a window for turning the lights on and off by hand.')),
+    ('flash', ('build_flash_image',
+               'Pad a bitstream into a flash image, with a bank of patterns.')),
+])
+
+def print_usage(file=sys.stdout):
+    print('usage: xmascard COMMAND [ARGUMENTS...]', file=file)
+    print(file=file)
+    print('Commands:', file=file)
+    for name, (module, description) in COMMANDS.items():
+        print('  {0:10}{1}'.format(name, description), file=file)
+    print(file=file)
+    print("Run 'xmascard COMMAND --help' for a command's arguments.", file=file)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] in ('-h', '--help'):
+        print_usage()
+        return
+    if argv[0] not in COMMANDS:
+        print("xmascard: unknown command '{0}'".format(argv[0]), file=sys.stderr)
+        print_usage(sys.stderr)
+        sys.exit(2)
+    module = importlib.import_module('.' + COMMANDS[argv[0]][0], __package__)
+    module.main(argv[1:], prog='xmascard ' + argv[0])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,496 @@
+usage = '''
+This program accepts an animation file in the format of a frame of the
+animation per line.
+
+Each line specifies the LEDs, from the top left to the bottom right.
+
+Each LED is two digits from 0 to 7 for the red, then green brightness.
+For readability, spaces can be added as desired and are ignored.
+
+For example, to light the red LED on the top, then the entire row of green on
+the bottom, the line would look like the following:
+
+70  00  00 00  00 00 00  07 07 07 07  00
+
+For additional readbility, you can also use a blank line as the separator
+between frames in the animation.
+This allows you to write the pattern out visually, at the cost of vertical
+space, like so:
+
+           70
+           00 
+         00  00
+       00  00  00
+     07  07  07  07
+           00
+
+This program converts the animation into a memory buffer ready to program into
+the Xmas Tree Board. Use upload_new_pattern.py to do so.
+'''
+
+# How should the fade work? One simple algorithm is to look at the maximum
+# difference in any single LED between A and B. That's the number of steps for
+# interpolation. Then, for each frame, and with that interpolation constant,
+# create a new calculate the new LED value.
+# This only works if you want to be able to fade the value of a single LED,
+# however. Suppose you specified frame A with the top LED on and frame B with
+# the bottom row on, and you wanted to interpolate between them. What would the
+# right behavior be? One approach would be to fade out the top and fade in the
+# bottom. What if you wanted to do night-rider style where the transition lit up
+# all the rows? Could you treat it like a fluid and flow the water from one to
+# the next? How would you deal with the fact that you have a different quantity
+# of water at the start than the end in terms of dealing with LED intensity?
+# Sadly that seems like the sort of thing best left to the user at the moment.
+
+import argparse
+import collections
+import importlib
+import sys
+import struct
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.led_mem_utils import LEDS_PER_BOARD, MEMORY_ENTRIES
+
+# frame_store needs NumPy, which takes a while to import, so it's only loaded
+# when the first fade or --fit needs it (see load_frame_store()). It's None if
+# NumPy isn't installed, and fades fall back to the slower pure Python version.
+NOT_LOADED = object()
+frame_store = NOT_LOADED
+
+# Bump this whenever a change makes the converter produce different output for
+# the same input, so cached conversions (see batch_convert.py) are redone.
+CONVERTER_VERSION = 1
+
+def load_frame_store():
+    '''Returns the frame_store module, importing it the first time, or None if
+    NumPy isn't installed.'''
+    global frame_store
+    if frame_store is NOT_LOADED:
+        try:
+            frame_store = importlib.import_module('xmascard.frame_store')
+        except ImportError:
+            frame_store = None
+    return frame_store
+
+class AnimationError(Exception):
+    '''Raised when an animation file can't be parsed. line and column count
+    from 1; column is None when the problem isn't with a particular
+    character.'''
+    def __init__(self, message, line, column=None):
+        Exception.__init__(self, message)
+        self.line = line
+        self.column = column
+
+# A frame of animation: the (0-based) line it came from, its 24 LED values and
+# whether it is one of the steps of a fade.
+Frame = collections.namedtuple('Frame', ['line', 'leds', 'faded'], defaults=[False])
+
+class AnimationParser():
+    '''Turns the lines of an animation file into frames.
+
+    Lines are consumed one at a time, so they can come from a file, a list or
+    any other iterable, and frames come out as soon as they are complete:
+
+        for frame in AnimationParser().parse(open('animation.txt')):
+            ...
+
+    The parser only holds on to the frames a later repeat could still copy.
+    copy() takes a snapshot of its state, so a caller which changes a file can
+    reparse from the changed line onward instead of from the start.'''
+
+    def __init__(self, log=print):
+        self.log = log
+        self.line_count = 0         # Lines consumed so far
+        self.frame_count = 0        # Frames produced so far
+        self.history = []           # The most recent frames...
+        self.history_start = 0      # ...starting from this frame number
+        self.current_frame = []
+        self.frame_start_line = 0
+        self.in_fade = False
+        self.fade_speed = 1
+        self.fade_easing = 'linear'
+        self.repeat_markers = {}
+        self.repeat_forever = False
+
+    def copy(self):
+        '''Returns an independent parser in the same state as this one.'''
+        other = AnimationParser(self.log)
+        other.__dict__.update(self.__dict__)
+        other.history = list(self.history)
+        other.current_frame = list(self.current_frame)
+        other.repeat_markers = dict(self.repeat_markers)
+        return other
+
+    def parse(self, lines):
+        '''Parses each of lines, yielding frames as they are completed, then
+        checks the animation ended properly.'''
+        for line in lines:
+            for frame in self.parse_line(line):
+                yield frame
+        self.finish()
+
+    def finish(self):
+        '''Checks that the lines parsed so far form a complete animation.'''
+        # Check that something was read.
+        if not self.frame_count:
+            raise AnimationError('No animation frames read from input file!',
+                                 self.line_count)
+
+        # Check that the final line was complete.
+        if self.current_frame:
+            raise AnimationError(
+                'End of file at line {0}. However, not enough LEDs were found to '
+                'form a complete frame. Only {1} LEDs were found between line {2} '
+                'and this one. There needs to be exactly 24.'.format(
+                 self.line_count, len(self.current_frame),
+                 self.frame_start_line + 1), self.line_count)
+
+    def parse_line(self, line):
+        '''Parses the next line and returns the list of frames it
+        completed.'''
+        self.trim_history()
+        first_new_frame = self.frame_count
+        line_idx = self.line_count
+        self.line_count += 1
+
+        # Go through each line. Remove all the spaces. If a given line does not
+        # contain enough digits to contain an entire line, assume that the next
+        # lines will fill out the line. If, however, the line contains no
+        # digits at all, this indicates the end of a frame of animation when
+        # the LEDs are spread across multiple lines, and all LEDs must be
+        # specified before that point. Therefore, indicate an error to the
+        # user.
+        raw_line = line.rstrip('\r\n')
+        line = raw_line.strip()
+        indent = len(raw_line) - len(raw_line.lstrip())
+
+        if line != '' and self.repeat_forever:
+            raise AnimationError(
+                'Line {0} has LED information, but repeat_forever was specified, '
+                'which must be the last line in the file.'.format(line_idx + 1),
+                line_idx + 1)
+        if line == '':
+            # If this is an empty line, ensure sufficient LEDs accumulated.
+            if self.current_frame:
+                raise AnimationError(
+                    'Line {0} is blank, indicating the start of a new animation '
+                    'frame. However, not enough LEDs were found in the previous '
+                    'lines to form a complete frame. Only {1} LEDs were found '
+                    'between line {2} and this one. '
+                    'There needs to be exactly 24.'.format(
+                     line_idx + 1, len(self.current_frame),
+                     self.frame_start_line + 1), line_idx + 1)
+        elif line.startswith('fade_to'):
+            # Fade commands must come between two complete frames.
+            if not self.frame_count or self.current_frame:
+                raise AnimationError(
+                    'Line {0} specified a fade, but did not come between '
+                    'two complete frames (see if the previous frame had too few '
+                    'or too many LED entries).'.format(line_idx + 1), line_idx + 1)
+            self.fade_speed = 1
+            self.fade_easing = 'linear'
+            self.in_fade = True
+            # Options follow colons: a number slows the fade down, a name picks
+            # the easing curve (ex: fade_to:2:ease_in_out).
+            for option in line.split(':')[1:]:
+                option = option.strip()
+                if option.isdigit():
+                    self.fade_speed = int(option)
+                elif option == 'linear' or (load_frame_store() and
+                                            option in frame_store.EASINGS):
+                    self.fade_easing = option
+                else:
+                    raise AnimationError(
+                        'Line {0} specified a fade with an unknown option {1}. '
+                        'Options are a number to slow the fade down, or one of '
+                        '{2}.'.format(line_idx + 1, repr(option),
+                                      ', '.join(sorted(frame_store.EASINGS))
+                                      if frame_store else "'linear' (install "
+                                      "NumPy for the others)"), line_idx + 1)
+        elif line.startswith('set_marker'):
+            # Set a marker so a group of frames can be repeated.
+            # Marker commands must not be in the middle of a frame.
+            if self.current_frame:
+                raise AnimationError(
+                    'Line {0} specified a marker, but is in the middle of a '
+                    'frame (see if the previous frame had too few '
+                    'or too many LED entries).'.format(line_idx + 1), line_idx + 1)
+            marker_name = 'default'
+            if ':' in line:
+                marker_name = line.split(':')[1].strip()
+            self.repeat_markers[marker_name] = max(self.frame_count - 1, 0)
+            self.log('Setting marker {0} to line {1}.'.format(
+                     marker_name, self.repeat_markers[marker_name]))
+        elif line.startswith('repeat'):
+            self.repeat(line, line_idx)
+        else:
+            self.add_leds(line, line_idx, indent)
+
+        return self.history[first_new_frame - self.history_start:]
+
+    def add_leds(self, line, line_idx, indent):
+        '''Adds LEDs from this line to the frame.'''
+        for char_idx, char in enumerate(line):
+            # Skip if a space character
+            if char == ' ':
+                continue
+            if not self.current_frame:
+                self.frame_start_line = line_idx
+            column = indent + char_idx + 1
+            # Check that the current frame is not full.
+            if len(self.current_frame) == LEDS_PER_BOARD:
+                raise AnimationError(
+                    'On line {0}, at character {1}, there are too many LEDs '
+                    'for the current animation frame. There should only be '
+                    'exactly 24.'.format(line_idx + 1, column),
+                    line_idx + 1, column)
+            # Check that the symbol is a digit in the valid brightness range.
+            if not char.isdigit() or int(char) < 0 or int(char) > 7:
+                raise AnimationError(
+                    'On line {0}, at character {1}, invalid brightness '
+                    'value for LED. It is {2} but should be a number '
+                    'between 0 and 7.'.format(line_idx + 1, column, repr(char)),
+                    line_idx + 1, column)
+            # Checks passed; add to animation frame.
+            self.current_frame.append(int(char))
+        # If frame is complete, add to animation and clear current frame state.
+        if len(self.current_frame) == LEDS_PER_BOARD:
+            self.add_frame()
+
+    def add_frame(self):
+        # Add current frame to animation and clear current frame state.
+        self.append(Frame(self.frame_start_line, self.current_frame))
+        self.current_frame = []
+        if self.in_fade:
+            self.fade()
+
+    def append(self, frame):
+        self.history.append(frame)
+        self.frame_count += 1
+
+    def frames_from(self, start, stop):
+        '''Returns frames numbered start up to (but not including) stop.'''
+        return self.history[start - self.history_start:stop - self.history_start]
+
+    def trim_history(self):
+        '''Forgets frames which neither a repeat nor a fade can refer to.'''
+        keep_from = min(list(self.repeat_markers.values()) +
+                        [self.frame_count - 1])
+        if keep_from > self.history_start:
+            del self.history[:keep_from - self.history_start]
+            self.history_start = keep_from
+
+    def fade(self):
+        self.in_fade = False
+        start = self.history[-2]
+        end = self.history[-1]
+        self.log('Fading frames {0} to {1}'.format(self.frame_count - 1,
+                                                   self.frame_count))
+        if load_frame_store():
+            # Compute every step of the fade at once.
+            fade_frames = frame_store.fade(start.leds, end.leds,
+                                           self.fade_speed, self.fade_easing)
+            self.history.pop()
+            self.frame_count -= 1
+            for leds in fade_frames[:-1].tolist():
+                self.append(Frame(start.line, leds, True))
+            self.append(end)
+            return
+        frame_max_delta = 0
+        # What's the greatest change between start and end frames?
+        for idx, start_led in enumerate(start.leds):
+            end_led = end.leds[idx]
+            led_delta = abs(end_led - start_led)
+            if led_delta > frame_max_delta:
+                frame_max_delta = led_delta
+        # If there's not enough difference to fade, return.
+        if frame_max_delta < 2:
+            return
+        # Slow down the fade by fade_speed, by increasing the frame_max_delta
+        frame_max_delta *= self.fade_speed
+        # We're going to add frames so temporarily remove the end frame from the
+        # collection.
+        self.history.pop()
+        self.frame_count -= 1
+        # Calculate each frame of the fade.
+        for step in range(frame_max_delta - 1):
+            intermediate_frame = []
+            for idx, start_led in enumerate(start.leds):
+                start_led *= self.fade_speed
+                end_led = end.leds[idx] * self.fade_speed
+                led_delta = end_led - start_led
+                derating_factor = led_delta / frame_max_delta
+                transition_led = (start_led + derating_factor * (step + 1)) / self.fade_speed
+                intermediate_frame.append(int(transition_led))
+            self.append(Frame(start.line, intermediate_frame, True))
+        self.append(end)
+
+    def repeat(self, line, line_idx):
+        '''Repeat everything from here to the marker.'''
+        # Repeat commands must not be in the middle of a frame.
+        if self.current_frame:
+            raise AnimationError(
+                'Line {0} specified a repeat, but is in the middle of a '
+                'frame (see if the previous frame had too few '
+                'or too many LED entries).'.format(line_idx + 1), line_idx + 1)
+
+        marker_name = 'default'
+        if ':' in line:
+            marker_name = line.split(':')[1].strip()
+        # There must have been a marker to repeat.
+        if not marker_name in self.repeat_markers:
+            raise AnimationError('Line {0} specified a repeat, '
+                                 'but there is no marker set.'.format(line_idx + 1),
+                                 line_idx + 1)
+        repeat_marker = self.repeat_markers[marker_name]
+        so_far = self.frame_count
+        # repeat_forever must be the last entry in the file
+        if line.startswith('repeat_forever'):
+            self.repeat_forever = True
+            space_left = MEMORY_ENTRIES - so_far
+            repetition_length = so_far - repeat_marker + 1
+            repetitions = space_left // repetition_length
+            for r in range(repetitions):
+                self.log('Repeating frame {0} to {1}'.format(repeat_marker, so_far+1))
+                for frame in self.frames_from(repeat_marker, so_far+1):
+                    self.append(frame)
+        else:
+            self.log('Repeating frame {0} (marker {1}) to {2}'.format(
+                     repeat_marker, marker_name, so_far+1))
+            for frame in self.frames_from(repeat_marker, so_far+1):
+                self.append(frame)
+
+def pretty_print_frame(frame):
+    '''Prints an animation frame to stdout in multi-line format as in help.'''
+    frame = list(frame[1])
+    longest = (4 + 3) * 2
+    leds_lines = (1, 1, 2, 3, 4, 1)
+    for leds_line in leds_lines:
+        line_str = ''
+        for led in range(leds_line):
+            line_str += str(frame.pop(0))
+            line_str += str(frame.pop(0))
+            line_str += '  '
+        line_str = line_str[:-2]
+        padding_amt = (longest - len(line_str)) // 2
+        line_str = ' ' * padding_amt + line_str
+        print(line_str)
+    print()
+
+def optimize_frames(animation_frames, budget=None, log=print):
+    '''Reports how many frames are redundant and, if budget is given and the
+    animation is too long, shortens its fades and holds to fit.'''
+    leds = [tuple(frame.leds) for frame in animation_frames]
+    holds = sum(1 for previous, frame in zip(leds, leds[1:]) if frame == previous)
+    repeats = len(leds) - len(set(leds)) - holds
+    log('{0} of the {1} frames hold the frame before them and {2} more '
+        'repeat an earlier frame.'.format(holds, len(leds), repeats))
+    if budget is None or len(animation_frames) <= budget:
+        return animation_frames
+    if not load_frame_store():
+        log('Fitting the animation needs NumPy to be installed; leaving it '
+            'as it is.')
+        return animation_frames
+    keep = frame_store.fit_to_budget(leds, [frame.faded for frame in animation_frames],
+                                     budget)
+    if keep is None:
+        log('Too many different frames to fit in {0}; leaving the animation '
+            'as it is.'.format(budget))
+        return animation_frames
+    log('Shortened fades and holds to fit {0} frames into {1}.'.format(
+        len(animation_frames), len(keep)))
+    return [animation_frames[i] for i in keep]
+
+def convert_frames(animation_frames, verbose=False, log=print):
+    '''Converts frames to the memory image the board stores, truncating or
+    padding the animation to fill memory exactly.'''
+    leds = [frame.leds for frame in animation_frames]
+    if verbose:
+        for frame in animation_frames:
+            pretty_print_frame(frame)
+
+    # Check that there weren't too many frames to fit in memory.
+    if len(leds) > MEMORY_ENTRIES:
+        log('{0} frames in animation but only 256 fit in memory. '
+            'Last {1} frames are thrown out (stream_animation.py --stored '
+            'can play all of them).'.format(len(leds), len(leds) - MEMORY_ENTRIES))
+        leds = leds[:MEMORY_ENTRIES]
+
+    # If there were not 256 frames in the input animation, repeat the last frame
+    # until there are.
+    if len(leds) < MEMORY_ENTRIES:
+        log('Repeating last frame {0} more times '
+            'to make 256 frames in animation.'.format(MEMORY_ENTRIES - len(leds)))
+        leds += [leds[-1]] * (MEMORY_ENTRIES - len(leds))
+
+    # Convert each frame to format accepted by christmas tree board.
+    return led_mem_utils.encode_frames(leds)
+
+def frame_budget(text):
+    '''Parses the number given to --fit, which has to be somewhere between 1
+    and the 256 frames the board holds.'''
+    budget = int(text)
+    if not 1 <= budget <= MEMORY_ENTRIES:
+        raise argparse.ArgumentTypeError('{0} frames is not between 1 and '
+                                         '{1}.'.format(budget, MEMORY_ENTRIES))
+    return budget
+
+def main(argv=None, prog=None):
+    '''Converts the animation file named on the command line, argv
+    (sys.argv[1:] if None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("input_pattern_file", help="The input pattern file to process.")
+    parser.add_argument("output_data", help="The raw output data ready to program. "
+                        "If the name ends in .bin, it's written as a binary "
+                        "pattern image instead of text.")
+    parser.add_argument('--verbose', dest='verbose', action='store_const',
+                        const=True, default=False,
+                        help="Pretty-print the output which will be written to memory.")
+    parser.add_argument('--fit', type=frame_budget, nargs='?', const=MEMORY_ENTRIES,
+                        metavar='FRAMES',
+                        help="If the animation is too long, shorten its fades "
+                             "and holds evenly to fit in FRAMES frames (256 if "
+                             "not given) rather than cutting off the end. "
+                             "Needs NumPy.")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+
+    args = parser.parse_args(argv)
+    if args.fit and not load_frame_store():
+        print('--fit needs NumPy to be installed.')
+        sys.exit(1)
+
+    # Read the pattern file a line at a time and turn it into frames.
+    try:
+        with open(args.input_pattern_file, 'r') as f:
+            animation_frames = list(AnimationParser().parse(f))
+    except AnimationError as e:
+        print(e)
+        sys.exit(1)
+
+    print('Successfully created {0} animation frames '
+          'from input file or commands.'.format(len(animation_frames)))
+
+    animation_frames = optimize_frames(animation_frames, args.fit)
+
+    memory_image = convert_frames(animation_frames, args.verbose)
+
+    # Write them out to the output file.
+    if args.output_data.endswith('.bin'):
+        with open(args.input_pattern_file, 'rb') as f:
+            source = f.read()
+        pattern_image.write_image(args.output_data, memory_image,
+                                  min(len(animation_frames), MEMORY_ENTRIES),
+                                  source)
+    else:
+        led_mem_utils.write_pattern_file(args.output_data, memory_image)
+
+    print('Successfully converted animation and wrote output to {0}.'.format(
+          args.output_data))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+'''Remembers the cards this computer has been connected to, and notices when
+serial ports are plugged in or unplugged.
+
+The registry is a JSON file in the home directory, a dict from port_key() (the
+SERIAL_ATTRIBUTES_MATCH attributes of the card's USB-serial adapter) to what
+is known about the card: those attributes, when it was first and last seen,
+and anything else the tools store, like the fastest baud rate divisor which
+worked with it.
+
+PortMonitor watches for ports coming and going. On Linux it asks inotify to
+say when device nodes in /dev are created, removed or have their permissions
+changed, so a card is noticed a few milliseconds after udev has set it up;
+elsewhere it lists the ports every poll_interval seconds.'''
+
+import json
+import os
+import time
+import serial.tools.list_ports
+from xmascard.inotify_events import Inotify, IN_ATTRIB, IN_CREATE, IN_DELETE
+from xmascard.serial_utils import SERIAL_ATTRIBUTES_MATCH, get_port_info, port_identity, port_key
+
+REGISTRY_FILE = os.path.join(os.path.expanduser('~'), '.xmascard_devices.json')
+
+# Where device nodes for serial ports appear. /dev/serial/by-id is only made
+# by udev once a port is ready, and only exists while one is plugged in.
+DEVICE_DIRECTORIES = ['/dev', '/dev/serial/by-id']
+
+def load_registry():
+    try:
+        with open(REGISTRY_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_registry(registry):
+    with open(REGISTRY_FILE, 'w') as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+
+def remember(registry, port, **fields):
+    '''Records that the card on port (a list_ports entry) was just seen, along
+    with any other fields given. Returns its entry.'''
+    now = time.time()
+    entry = registry.setdefault(port_key(port), {'first_seen': now})
+    for attr in SERIAL_ATTRIBUTES_MATCH:
+        entry[attr] = str(getattr(port, attr))
+    entry['last_seen'] = now
+    entry.update(fields)
+    return entry
+
+def find_known_ports(registry, ports=None):
+    '''Returns the list_ports entries of the cards in the registry which are
+    plugged in, most recently seen first. ports is what's plugged in, if it's
+    already been listed.'''
+    if ports is None:
+        ports = serial.tools.list_ports.comports()
+    known = [port for port in ports if port_key(port) in registry]
+    known.sort(key=lambda port: registry[port_key(port)]['last_seen'], reverse=True)
+    return known
+
+def cached_divisor(registry, device):
+    '''Returns the baud rate divisor which last worked with the card on
+    device, a port name, or None if there isn't one.'''
+    entry = registry.get(port_identity(device))
+    return entry.get('divisor') if entry else None
+
+def remember_divisor(registry, device, divisor):
+    '''Records the baud rate divisor which works with the card on device.
+    Ports the system doesn't list, like the emulator's, aren't recorded.'''
+    port = get_port_info(device)
+    if port is not None:
+        remember(registry, port, divisor=divisor)
+
+def usable(port):
+    '''Whether port can be opened yet: udev changes the permissions of a new
+    device node a little after it appears.'''
+    return not os.path.exists(port.device) or os.access(port.device, os.R_OK | os.W_OK)
+
+class PortMonitor():
+    '''Reports serial ports which are plugged in or unplugged after it is
+    created. Uses inotify where it's available (and inotify is True), and
+    lists the ports every poll_interval seconds otherwise.'''
+
+    def __init__(self, poll_interval=0.5, inotify=True):
+        self.poll_interval = poll_interval
+        self.inotify = None
+        if inotify:
+            try:
+                self.inotify = Inotify()
+                self.watch_directories()
+            except OSError:
+                self.inotify = None
+        self.ports = self.scan()
+        self.scanned = time.time()
+
+    def watch_directories(self):
+        for directory in DEVICE_DIRECTORIES:
+            if os.path.isdir(directory) and directory not in self.inotify.watches.values():
+                self.inotify.add_watch(directory, IN_CREATE | IN_DELETE | IN_ATTRIB)
+
+    def scan(self):
+        '''Returns the usable ports on the system, by device name.'''
+        return dict((port.device, port) for port in serial.tools.list_ports.comports()
+                    if usable(port))
+
+    def changes(self, timeout=0):
+        '''Waits up to timeout seconds for ports to be plugged in or unplugged,
+        and returns lists of the list_ports entries added and removed. Returns
+        straight away if anything changed since it was last called.'''
+        deadline = time.time() + timeout
+        while True:
+            if self.inotify:
+                if self.inotify.wait(max(deadline - time.time(), 0)):
+                    self.inotify.read_events()
+                    # /dev/serial/by-id may have just been created.
+                    self.watch_directories()
+                    ports = self.scan()
+                else:
+                    ports = self.ports
+            else:
+                next_scan = self.scanned + self.poll_interval
+                time.sleep(max(min(deadline, next_scan) - time.time(), 0))
+                if time.time() >= next_scan:
+                    ports = self.scan()
+                    self.scanned = time.time()
+                else:
+                    ports = self.ports
+            added = [port for device, port in sorted(ports.items())
+                     if device not in self.ports]
+            removed = [port for device, port in sorted(self.ports.items())
+                       if device not in ports]
+            self.ports = ports
+            if added or removed or time.time() >= deadline:
+                return added, removed
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
+            self.inotify = None
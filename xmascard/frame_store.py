@@ -0,0 +1,128 @@
+'''Works on animations as NumPy arrays, so fades are computed for all LEDs
+and all steps at once rather than one LED at a time, and long animations can
+be analysed and shortened as a whole.'''
+
+import numpy
+from xmascard.led_mem_utils import LEDS_PER_BOARD, MEMORY_ENTRIES
+
+MAX_INTENSITY = 7
+
+# Duty cycle, out of 256, the pwm module in lights.v drives each intensity at.
+PWM_DUTY = numpy.array([0, 15, 35, 63, 99, 143, 195, 255], dtype=float)
+
+# Each easing takes the start and end frames, a column of the step numbers
+# (1 to steps - 1) of the intermediate frames and the total number of steps, and
+# returns the (unrounded) intensities of every LED at each of those steps.
+
+def linear(start, end, step, steps, speed):
+    '''Moves every LED by the same amount each step. This is the original fade,
+    kept operation for operation so it produces exactly the same frames.'''
+    start = start * speed
+    end = end * speed
+    return (start + (end - start) / steps * step) / speed
+
+def eased(shape):
+    '''Makes an easing out of a function mapping how far through the fade we
+    are (0 to 1) to how far the LEDs should have moved (also 0 to 1).'''
+    def interpolate(start, end, step, steps, speed):
+        return start + (end - start) * shape(step / steps)
+    return interpolate
+
+def gamma(start, end, step, steps, speed):
+    '''Moves every LED by the same amount of light each step. The PWM duty
+    cycles grow faster than the intensity levels, so a linear fade appears to
+    rush through the dim end; this one doesn't.'''
+    duty = PWM_DUTY[start] + (PWM_DUTY[end] - PWM_DUTY[start]) * (step / steps)
+    return numpy.interp(duty, PWM_DUTY, numpy.arange(len(PWM_DUTY)))
+
+EASINGS = {
+    'linear': linear,
+    'ease_in': eased(lambda t: t * t),
+    'ease_out': eased(lambda t: t * (2 - t)),
+    'ease_in_out': eased(lambda t: t * t * (3 - 2 * t)),
+    'gamma': gamma,
+}
+
+def as_frames(frames):
+    '''Returns frames as an (N, 24) uint8 array.'''
+    return numpy.asarray(frames, dtype=numpy.uint8).reshape(-1, LEDS_PER_BOARD)
+
+def fade(start, end, speed=1, easing='linear'):
+    '''Returns the frames of a fade from start to end, ending with end itself.
+
+    The fade takes as many steps as the largest change in any one LED,
+    multiplied by speed. If no LED changes by more than one there is nothing to
+    fade and only end is returned.'''
+    start = numpy.asarray(start, dtype=numpy.int64)
+    end = numpy.asarray(end, dtype=numpy.int64)
+    max_delta = int(numpy.abs(end - start).max())
+    if max_delta < 2:
+        return as_frames(end)
+    steps = max_delta * speed
+    step = numpy.arange(1, steps, dtype=float)[:, numpy.newaxis]
+    intermediate = EASINGS[easing](start, end, step, steps, speed)
+    intermediate = numpy.clip(numpy.trunc(intermediate), 0, MAX_INTENSITY)
+    return numpy.vstack((intermediate.astype(numpy.uint8), as_frames(end)))
+
+def count_redundant(frames):
+    '''Returns how many frames are holds (the same as the frame before them)
+    and how many repeat some other earlier frame.'''
+    frames = as_frames(frames)
+    if not len(frames):
+        return 0, 0
+    holds = int((frames[1:] == frames[:-1]).all(axis=1).sum())
+    distinct = len(numpy.unique(frames, axis=0))
+    return holds, len(frames) - distinct - holds
+
+def runs(frames, faded):
+    '''Splits an animation into runs which are either consecutive steps of a
+    fade, or a frame followed by its holds. Returns arrays of the start and
+    stop index of each run and whether it is a fade.'''
+    same = (frames[1:] == frames[:-1]).all(axis=1)
+    new_run = numpy.ones(len(frames), dtype=bool)
+    new_run[1:] = (faded[1:] != faded[:-1]) | (~faded[1:] & ~same)
+    starts = numpy.flatnonzero(new_run)
+    stops = numpy.append(starts[1:], len(frames))
+    return starts, stops, faded[starts]
+
+def fit_to_budget(frames, faded, budget=MEMORY_ENTRIES):
+    '''Picks which frames to keep so the animation fits in budget frames,
+    given which ones are steps of a fade. Every fade and hold is shortened by
+    about the same proportion so the animation's timing is kept as close as
+    possible; fades can disappear entirely, but every frame which isn't part
+    of a fade is kept at least once.
+
+    Returns an array of the indices of the frames to keep, or None if there
+    are too many distinct frames to fit.'''
+    frames = as_frames(frames)
+    faded = numpy.asarray(faded, dtype=bool)
+    if len(frames) <= budget:
+        return numpy.arange(len(frames))
+    starts, stops, is_fade = runs(frames, faded)
+    lengths = stops - starts
+    minimum = numpy.where(is_fade, 0, 1)
+    if minimum.sum() > budget:
+        return None
+
+    # Find how much everything needs to shrink by, allowing for the runs which
+    # can't shrink below their minimum.
+    low, high = 0.0, 1.0
+    for i in range(50):
+        scale = (low + high) / 2
+        if numpy.maximum(minimum, lengths * scale).sum() > budget:
+            high = scale
+        else:
+            low = scale
+    target = numpy.maximum(minimum, lengths * low)
+    new_lengths = numpy.floor(target).astype(int)
+    # Hand out the frames lost to rounding down to the runs which lost most.
+    order = numpy.argsort(new_lengths - target, kind='stable')
+    order = order[new_lengths[order] < lengths[order]]
+    new_lengths[order[:budget - new_lengths.sum()]] += 1
+
+    # Take evenly spaced frames from each run.
+    run_of_frame = numpy.repeat(numpy.arange(len(starts)), new_lengths)
+    position = numpy.arange(len(run_of_frame)) - numpy.repeat(
+        numpy.cumsum(new_lengths) - new_lengths, new_lengths)
+    return starts[run_of_frame] + ((2 * position + 1) * lengths[run_of_frame]
+                                   // (2 * new_lengths[run_of_frame]))
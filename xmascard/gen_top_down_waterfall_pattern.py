@@ -0,0 +1,137 @@
+import argparse
+import sys
+from xmascard.led_mem_utils import *
+from xmascard import pattern_image
+try:
+    from xmascard import patterns
+except ImportError:
+    patterns = None # The waterfall and sweep fall back to plain Python loops.
+
+# Variations of each pattern to try when filling the rest of memory.
+FILL_OPTIONS = {
+    'spiral': dict(period=[24, 32, 48, 64], twist=[0.0, 1.0, -1.0], width=[0.25, 0.4]),
+    'twinkle': dict(density=[0.03, 0.06, 0.1], decay=[0.5, 0.7, 0.85], seed=range(4)),
+    'chase': dict(speed=[0.25, 0.5, 1.0], tail=[2, 4, 8]),
+}
+
+# How many frames each pattern takes to come back round to where it started
+# with the given options: a spiral's period, or a chase's lap of every LED.
+# Twinkles never repeat, so can stop on any frame.
+CYCLES = {
+    'spiral': lambda period, **options: period,
+    'twinkle': lambda **options: 1,
+    'chase': lambda speed, **options: int(round(LEDS_PER_BOARD / speed)),
+}
+
+def sweep():
+    '''Generates a pattern where each light fades up gradually one after another.'''
+    if patterns:
+        return patterns.sweep(levels=range(MemoryEntry.MIN_BRIGHTNESS,
+                                           MemoryEntry.FULL_BRIGHTNESS + 1, 2)).render().tolist()
+    sweep_frames = []
+    # For each led on the board,
+    for sweep_led in range(LEDS_PER_BOARD):
+        # for each brightness level,
+        #  (half the levels because it is too slow to iterate through each one)
+        for led_val in range((MemoryEntry.FULL_BRIGHTNESS+1)//2):
+            # generate a frame. Each LED is off unless it is the sweep_led.
+            frame = [MemoryEntry.MIN_BRIGHTNESS] * LEDS_PER_BOARD
+            frame[sweep_led] = led_val*2
+            sweep_frames.append(frame)
+
+    return sweep_frames
+
+def waterfall():
+    '''Generates a pattern where lights fade on from top to bottom.'''
+    if patterns:
+        return patterns.waterfall(levels_red).then(
+            patterns.waterfall(levels_green)).render().tolist()
+    waterfall_frames = []
+    # First fade all the red colors, then the green ones.
+    for color in [levels_red, levels_green]:
+        previous_levels = []
+        # Fade all the LEDs in each level on at the same time.
+        for level in color:
+            # Fade from off to fully on.
+            for intensity in range(MemoryEntry.MIN_BRIGHTNESS, MemoryEntry.FULL_BRIGHTNESS+1):
+                # Each frame describes all LEDs, so loop through all.
+                frame = []
+                for led in range(LEDS_PER_BOARD):
+                    # Keep track of previous level to determine if other levels
+                    # are on or off.
+                    if led in level:
+                        frame.append(intensity)
+                    elif led in previous_levels:
+                        frame.append(MemoryEntry.FULL_BRIGHTNESS)
+                    else:
+                        frame.append(MemoryEntry.MIN_BRIGHTNESS)
+
+                waterfall_frames.append(frame)
+            previous_levels += level
+
+        # Turn all on for a bit at the end of the fade before switching to
+        # something to allow user to enjoy LEDs.
+        for intensity in range(8):
+            waterfall_frames.append(frame)
+
+    return waterfall_frames
+
+def fill(name, budget, log=print):
+    '''Returns the frames of the variation of the named pattern which best
+    fills budget frames. Each variation is made as many whole cycles long as
+    fit, so ones with different cycles leave different amounts of the budget
+    unused, and the search favours those which leave least. Needs NumPy.'''
+    make = patterns.PATTERNS[name]
+    cycle = CYCLES[name]
+    def candidate(**options):
+        return make(budget // cycle(**options) * cycle(**options), **options)
+    fits = patterns.search(patterns.variations(candidate, **FILL_OPTIONS[name]), budget)
+    if not fits:
+        log('\tNo variation has a cycle short enough to fit.')
+        return []
+    options, frames = fits[0]
+    log('\tUsing', ', '.join('%s=%s' % item for item in sorted(options.items())),
+        '(%d frames)' % len(frames))
+    return frames
+
+def generate(fill_with=None, log=print):
+    '''Returns the frames of the waterfall and sweep, followed by the best
+    fitting variation of the pattern named fill_with if given.'''
+    log('Generating waterfall pattern.')
+    frames = waterfall()
+    log('\tDone. Used %d memory entries out of 256.' % (len(frames)))
+    log('Generating sweep pattern.')
+    frames += sweep()
+    log('\tDone. Used %d memory entries out of 256' % (len(frames)))
+    if fill_with and len(frames) < MEMORY_ENTRIES:
+        log('Generating %s pattern.' % (fill_with))
+        frames += list(fill(fill_with, MEMORY_ENTRIES - len(frames), log))
+        log('\tDone. Used %d memory entries out of 256' % (len(frames)))
+    return frames
+
+def main(argv=None, prog=None):
+    '''Writes the generated pattern to the file named on the command line,
+    argv (sys.argv[1:] if None).'''
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("pattern_file", help="A text file which will contain the new pattern. "
+                        "If the name ends in .bin, it's written as a binary pattern image.")
+    parser.add_argument("--fill", choices=sorted(FILL_OPTIONS),
+                        help="Fill the memory left over after the waterfall and sweep "
+                             "with whichever variation of this pattern fits it best. "
+                             "Needs NumPy.")
+    args = parser.parse_args(argv)
+
+    if args.fill and not patterns:
+        print('--fill needs NumPy to be installed.')
+        sys.exit(1)
+    frames = generate(args.fill)
+    if args.pattern_file.endswith('.bin'):
+        # Pattern images always fill memory; leave the rest of it off.
+        frame_count = len(frames)
+        frames += [[MemoryEntry.MIN_BRIGHTNESS] * LEDS_PER_BOARD] * (MEMORY_ENTRIES - frame_count)
+        pattern_image.write_image(args.pattern_file, encode_frames(frames), frame_count)
+    else:
+        write_pattern_file(args.pattern_file, encode_frames(frames))
+
+if __name__ == '__main__':
+    main()
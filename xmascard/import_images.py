@@ -0,0 +1,187 @@
+usage = '''
+This program turns pictures into an animation for the Xmas Tree Board: an
+animated GIF, a sequence of still images, or a directory of them (used in
+order of name).
+
+Each frame is laid over the tree, a grid of its 6 rows with each bulb in the
+place it has on the card, and every bulb takes the colour of the part of the
+picture it sits on: its red LED shows how red that is and its green LED how
+green. Blue is ignored, since the bulbs have none.
+
+Brightnesses become the nearest of the 8 intensities the board can show,
+allowing for the PWM duty cycle each is shown at, and the frames are retimed
+to the board's 24.6 frames a second: GIFs by the time each of their frames is
+shown for, still images by --fps.
+
+The output is written as convert_animation_file.py writes it: a pattern image
+if the name ends in .bin, otherwise a text pattern file, either of them the
+first 256 frames. With --animation an animation file of every frame is written
+instead, which convert_animation_file.py can convert or stream_animation.py
+--stored can play whatever its length.
+
+Needs Pillow and NumPy.
+'''
+
+import argparse
+import os
+import sys
+import numpy
+from xmascard import frame_store
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.convert_animation_file import Frame, convert_frames
+from xmascard.led_mem_utils import BOARD_FPS, LEDS_PER_BOARD, MEMORY_ENTRIES, ROW_LENGTHS
+from xmascard.patterns import RED, ROW, X
+try:
+    from PIL import Image, ImageSequence
+except ImportError:
+    Image = None
+
+# Pictures are shrunk to a grid of cells the shape of the tree: a row of cells
+# for each row of bulbs, and two columns of cells for every bulb in the widest
+# row, so that each bulb covers two cells whether its row has an odd or an
+# even number of bulbs.
+GRID_ROWS = len(ROW_LENGTHS)
+GRID_COLUMNS = 2 * max(ROW_LENGTHS)
+# The left hand one of the two columns each LED's bulb covers.
+LEFT = (X * 2 + max(ROW_LENGTHS) - 1).astype(int)
+
+GAMMA = 2.2                 # How pictures encode brightness
+GIF_FRAME_DEFAULT = 0.1     # Seconds to show GIF frames which don't say
+GIF_FRAME_MINIMUM = 0.02    # Shorter GIF frames are shown for the default
+
+def picture_paths(paths):
+    '''Expands any directories in paths into the files in them, in order of
+    name.'''
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            expanded += [os.path.join(path, name) for name in sorted(os.listdir(path))
+                         if not name.startswith('.')]
+        else:
+            expanded.append(path)
+    return expanded
+
+def read_pictures(paths, fps=None):
+    '''Reads every frame of the pictures in paths. Returns them shrunk to the
+    grid, as an (N, GRID_ROWS, GRID_COLUMNS, 3) array of RGB values, and how
+    many seconds each frame is shown for: 1 / fps if fps is given, otherwise
+    however long a GIF says and one board frame for a still image.
+
+    Frames are shrunk as they are decoded, with Pillow's box filter averaging
+    each cell, so a long video never has to be held at full size.'''
+    cells = []
+    durations = []
+    for path in paths:
+        with Image.open(path) as picture:
+            for frame in ImageSequence.Iterator(picture):
+                cells.append(numpy.asarray(frame.convert('RGB').resize(
+                    (GRID_COLUMNS, GRID_ROWS), Image.BOX)))
+                duration = frame.info.get('duration')
+                if fps:
+                    durations.append(1.0 / fps)
+                elif duration is None:
+                    durations.append(1.0 / BOARD_FPS)
+                elif duration / 1000.0 < GIF_FRAME_MINIMUM:
+                    # As browsers do, since such GIFs were made to be shown
+                    # that way.
+                    durations.append(GIF_FRAME_DEFAULT)
+                else:
+                    durations.append(duration / 1000.0)
+    if not cells:
+        raise ValueError('No pictures to import.')
+    return numpy.stack(cells), numpy.array(durations)
+
+def sample_leds(cells):
+    '''Returns the brightness (0 to 255) of every LED in every frame of cells,
+    an (N, GRID_ROWS, GRID_COLUMNS, 3) array, as an (N, 24) array: red LEDs the
+    red and green LEDs the green averaged over the two cells of their bulb.'''
+    cells = cells.astype(float)
+    bulbs = (cells[:, ROW, LEFT] + cells[:, ROW, LEFT + 1]) / 2
+    return numpy.where(RED, bulbs[:, :, 0], bulbs[:, :, 1])
+
+def to_intensities(brightness, gamma=GAMMA):
+    '''Returns the intensity whose duty cycle gives out the nearest amount of
+    light to each brightness (0 to 255, encoded with gamma as pictures are).'''
+    duty = 255 * (numpy.asarray(brightness) / 255.0) ** gamma
+    midpoints = (frame_store.PWM_DUTY[1:] + frame_store.PWM_DUTY[:-1]) / 2
+    return numpy.searchsorted(midpoints, duty).astype(numpy.uint8)
+
+def retime(durations, fps=BOARD_FPS):
+    '''Returns which of the frames, shown for durations seconds each, is being
+    shown halfway through each frame at fps.'''
+    ends = numpy.cumsum(durations)
+    count = max(int(round(ends[-1] * fps)), 1)
+    middles = (numpy.arange(count) + 0.5) / fps
+    return numpy.minimum(numpy.searchsorted(ends, middles, side='right'),
+                         len(durations) - 1)
+
+def import_pictures(paths, fps=None, gamma=GAMMA):
+    '''Returns the pictures in paths (see read_pictures()) as an (N, 24) array
+    of intensities, a frame for each frame the board shows.'''
+    cells, durations = read_pictures(picture_paths(paths), fps)
+    frames = to_intensities(sample_leds(cells), gamma)
+    return frames[retime(durations)]
+
+def write_animation(path, frames):
+    '''Writes frames as an animation file, a line per frame with each bulb's
+    pair of LEDs together.'''
+    with open(path, 'w') as f:
+        for frame in frames:
+            f.write(' '.join('{0}{1}'.format(*frame[i:i + 2])
+                             for i in range(0, LEDS_PER_BOARD, 2)) + '\n')
+
+def main(argv=None, prog=None):
+    '''Imports the pictures named on the command line, argv (sys.argv[1:] if
+    None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("pictures", nargs='+',
+                        help="An animated GIF, or still images or directories "
+                             "of them to use as the frames.")
+    parser.add_argument("output_data",
+                        help="Where to write the pattern. If the name ends in "
+                             ".bin, it's written as a binary pattern image.")
+    parser.add_argument("--fps", type=float,
+                        help="How many of the pictures' frames to show a "
+                             "second. By default GIFs keep their own timing and "
+                             "still images are one board frame each.")
+    parser.add_argument("--gamma", type=float, default=GAMMA,
+                        help="The gamma the pictures are encoded with "
+                             "(default: {0}). Lower makes dim parts brighter.".format(GAMMA))
+    parser.add_argument("--animation", action='store_true',
+                        help="Write an animation file of every frame instead "
+                             "of a pattern.")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+    if Image is None:
+        print('Importing pictures needs Pillow to be installed '
+              '(pip install pillow).')
+        sys.exit(1)
+
+    try:
+        frames = import_pictures(args.pictures, args.fps, args.gamma)
+    except (IOError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+    print('Imported {0} frames, {1:.1f} seconds of animation.'.format(
+          len(frames), len(frames) / BOARD_FPS))
+
+    if args.animation:
+        write_animation(args.output_data, frames)
+    else:
+        memory_image = convert_frames([Frame(i, list(leds)) for i, leds in enumerate(frames)])
+        if args.output_data.endswith('.bin'):
+            pattern_image.write_image(args.output_data, memory_image,
+                                      min(len(frames), MEMORY_ENTRIES))
+        else:
+            led_mem_utils.write_pattern_file(args.output_data, memory_image)
+
+    print('Wrote {0}.'.format(args.output_data))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+'''A minimal wrapper around Linux's inotify, through ctypes, for finding out
+straight away when files appear, change or disappear instead of checking
+every so often. Inotify() raises OSError where inotify isn't available, so
+callers can fall back to polling.'''
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+
+# Event flags, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+
+EVENT = struct.Struct('iIII')
+
+class Inotify():
+    '''Watches directories for the events in mask. read_events() returns what
+    has happened since it was last called as (directory, name, mask)
+    tuples.'''
+
+    def __init__(self):
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK)
+        except (AttributeError, TypeError):
+            raise OSError('inotify is not available on this system')
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.watches = {}
+
+    def add_watch(self, directory, mask):
+        wd = self.libc.inotify_add_watch(self.fd, directory.encode(), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), 'Could not watch ' + directory)
+        self.watches[wd] = directory
+
+    def fileno(self):
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def wait(self, timeout=None):
+        '''Waits up to timeout seconds (forever if None) for an event.
+        Returns True if one arrived.'''
+        return bool(select.select([self.fd], [], [], timeout)[0])
+
+    def read_events(self):
+        try:
+            buf = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = EVENT.unpack_from(buf, offset)
+            offset += EVENT.size
+            name = buf[offset:offset + length].rstrip(b'\0').decode(errors='replace')
+            offset += length
+            events.append((self.watches.get(wd), name, mask))
+        return events
@@ -0,0 +1,126 @@
+LEDS_PER_BOARD = 24
+MEMORY_ENTRIES = 256 # Animation frames the board's pattern RAM holds
+BYTES_PER_ENTRY = 9  # Each frame is 24 LEDs of 3 bits; 72 bits
+# The board moves on to the next entry every 2 ** 18 cycles of its 6.4512 MHz
+# clock (clk_step in hdl/lights.v), about 24.6 times a second.
+BOARD_FPS = 6451200.0 / 2 ** 18
+
+def pack_entry(intensities):
+    '''Packs 24 intensities (0-7) into the 72 bit value stored in one memory
+    entry. LED 0 goes in the least significant bits.'''
+    value = 0
+    for intensity in reversed(intensities):
+        value = (value << 3) | (intensity & 7)
+    return value
+
+def unpack_entry(value):
+    '''Returns the list of 24 intensities packed into a 72 bit value.'''
+    return [(value >> (3 * led)) & 7 for led in range(LEDS_PER_BOARD)]
+
+def entry_to_bytes(value):
+    '''Returns the 9 bytes of a memory entry, most significant first, which is
+    the order the board receives them in.'''
+    return value.to_bytes(BYTES_PER_ENTRY, 'big')
+
+def encode_frames(frames):
+    '''Packs a sequence of frames (an (N, 24) array or list of lists) into
+    one contiguous buffer of N 9 byte memory entries.'''
+    try:
+        import numpy
+    except ImportError:
+        return b''.join(entry_to_bytes(pack_entry(frame)) for frame in frames)
+    frames = numpy.asarray(frames, dtype=numpy.uint8).reshape(-1, LEDS_PER_BOARD)
+    # Split every intensity into its 3 bits, least significant first, which
+    # lists the bits of the entry from bit 0 up. Reverse that and pack it into
+    # bytes most significant first.
+    bits = (frames[:, :, numpy.newaxis] >> numpy.arange(3, dtype=numpy.uint8)) & 1
+    bits = bits.reshape(len(frames), -1)[:, ::-1]
+    return numpy.packbits(bits, axis=1).tobytes()
+
+def decode_frames(data):
+    '''Unpacks a buffer of 9 byte memory entries into an (N, 24) array of
+    intensities (a list of lists if NumPy isn't installed).'''
+    try:
+        import numpy
+    except ImportError:
+        return [unpack_entry(int.from_bytes(entry, 'big'))
+                for entry in split_entries(data)]
+    entries = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, BYTES_PER_ENTRY)
+    bits = numpy.unpackbits(entries, axis=1)[:, ::-1].reshape(-1, LEDS_PER_BOARD, 3)
+    return (bits << numpy.arange(3, dtype=numpy.uint8)).sum(axis=2, dtype=numpy.uint8)
+
+def split_entries(data):
+    '''Returns a buffer of memory entries as a list of 9 byte slices.'''
+    return [data[i:i + BYTES_PER_ENTRY]
+            for i in range(0, len(data), BYTES_PER_ENTRY)]
+
+def read_pattern_file(path):
+    '''Reads a pattern file (a line of 18 hex digits per memory entry) into
+    one buffer.'''
+    with open(path, 'r') as f:
+        return bytes.fromhex(''.join(line.strip() for line in f))
+
+def write_pattern_file(path, data):
+    '''Writes a buffer of memory entries as a pattern file.'''
+    with open(path, 'w') as f:
+        for entry in split_entries(data):
+            f.write(entry.hex() + '\n')
+
+class MemoryEntry():
+    FULL_BRIGHTNESS = 7
+    MIN_BRIGHTNESS = 0
+    def __init__(self):
+        self.value = 0
+        self.led_count = 0
+
+    def add_led(self, intensity):
+        '''Call 24 times to add LEDs from 0 to 23 to array.
+        Intensity from 0 to 7'''
+        self.value |= (intensity & 7) << (3 * self.led_count)
+        self.led_count += 1
+
+    def get_entry(self):
+        '''Call to print the line of memory.'''
+        return '%018x' % (self.value)
+
+    def get_bytes(self):
+        '''Returns the line of memory as the 9 bytes sent to the board.'''
+        return entry_to_bytes(self.value)
+
+
+# How many bulbs are in each row of the tree, from the top down. Bulbs are
+# numbered along each row in turn, and each has two LEDs, listed below.
+ROW_LENGTHS = [1, 1, 2, 3, 4, 1]
+
+#            *R
+#            RG 
+#          RG  RG
+#        RG  GR  GR
+#      GR  RG  GR  RG
+#            RG
+leds = [
+    ['r','g'], # 0 1
+    ['r','g'], # 2 3
+    ['r','g'],['r','g'], # 4 5  6 7
+    ['r','g'],['g','r'],['g','r'], # 8 9  10 11  12 13
+    ['g','r'],['r','g'],['g','r'],['r','g'], # 14 15  16 17  18 19  20 21
+    ['r','g'] # 22 23
+]
+
+levels_red = [
+    [0],
+    [2],
+    [4,6],
+    [8, 11, 13],
+    [15, 16, 19, 20],
+    [22]
+]
+
+levels_green = [
+    [0],
+    [3],
+    [5,7],
+    [9,10,12],
+    [14,17,18,21],
+    [23]
+]
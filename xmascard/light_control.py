@@ -0,0 +1,373 @@
+try:
+    from Tkinter import *
+    import tkMessageBox
+except ImportError:
+    from tkinter import *
+    from tkinter import messagebox as tkMessageBox
+
+from random import randint
+
+import argparse
+import serial
+import struct
+import time
+from xmascard.device_registry import (PortMonitor, cached_divisor, find_known_ports,
+                             load_registry, remember, save_registry)
+from xmascard.serial_utils import (MODE_INDIVIDUAL_LEDS, SerialWorker, get_port_info,
+                          negotiate_baudrate, restore_baudrate)
+try:
+    from ctypes import windll
+except ImportError:
+    pass
+
+# Configurable parameters related to UI appearance
+canvas_width = 300
+canvas_height = 400
+inter_led_spacing_x = 80
+led_diameter = 30
+
+# Non-UI Globals
+worker = None       # The SerialWorker which owns the port to the board
+connected = False   # Whether the board has answered since the port was opened
+pending_leds = {}   # LED changes not yet handed to the worker
+flush_in_flight = False # Whether the worker is busy sending LED changes
+latencies = []      # How long recent commands took, in seconds
+error_count = 0     # How many commands have failed since connecting
+search_time = 30    # How long should we try to look for the board?
+monitor = None      # The PortMonitor watching for the board to be plugged in
+search_deadline = 0 # When to give up looking for it
+port_name = None    # Name of the serial port
+fast = False        # Whether to switch the board to a faster baud rate
+
+def initialize_ui():
+    global connect, connect_text, canvas, port, root, status
+
+    # Setup the UI widgets (the canvas for the LEDs, and the connect box and button)
+    root = Tk()
+
+    canvas = Canvas(root, width=canvas_width, height=canvas_height)
+    canvas.pack()
+    canvas.bind("<Button-1>", canvas_click)
+
+    status = StringVar(value='Not connected.')
+    label_status = Label(root, textvariable=status)
+    label_status.pack(side='bottom')
+
+    label_port = Label(root, text="Port:")
+    label_port.pack(side='left')
+
+    port = StringVar(value='')
+
+    entry_port = Entry(root, textvariable=port)
+    entry_port.pack(side='left')
+
+    connect_text = StringVar()
+    connect = Button(root, textvariable=connect_text, command=connect_button)
+    connect.pack(side='right')
+    connect_text.set("Connect")
+
+    # Draw the LEDs
+    led_lines = [1,1,2,3,4,1]
+    led_radius = led_diameter / 2
+    led_idx = 0
+    for i, leds_in_line in enumerate(led_lines):
+        inter_led_spacing_y = canvas_height / (len(led_lines) + 1)
+        led_offset_top = inter_led_spacing_y * (i + 1)
+        #                ( center canvas  ) - (  span of the leds draw on this line  ) / 2
+        led_start_left = (canvas_width / 2) - (inter_led_spacing_x * (leds_in_line-1)) / 2
+        for j in range(leds_in_line):
+            led_offset_left = led_start_left + inter_led_spacing_x * j
+            canvas.create_oval(led_offset_left - led_radius, \
+                               led_offset_top - led_radius, \
+                               led_offset_left + led_radius, \
+                               led_offset_top + led_radius, \
+                               fill="white", \
+                               tags='LEDNUM_%d' % (led_idx ))
+            led_idx += 1
+
+    root.after(50, poll_worker)
+
+# UI callbacks
+def connect_button():
+    global connected
+
+    if connect.cget('text') == "Disconnect":
+        print_link_stats()
+        drop_worker()
+        connected = False
+        status.set('Not connected.')
+        port_name = None
+        connect_text.set("Connect")
+        return
+
+    portname = port.get()
+    if portname == '':
+        tkMessageBox.showinfo('Setup xmas card connection',
+            "We need to setup the connection to the card. " \
+            "You'll only need to do this once. " \
+            "First, unplug it if it's plugged in, then click OK.")
+        start_port_search()
+        port.set("OK; now plug it in")
+        connect_text.set("Connecting")
+        connect.config(state='disabled')
+        root.after(20, find_serial_port)
+        return
+
+    tkMessageBox.showerror("Unexpected problem", "Please restart.")
+
+def canvas_click(event):
+    if not connected:
+        tkMessageBox.showerror("Error changing LED", \
+                               "Click Connect button below.")
+        return
+
+    if canvas.find_withtag(CURRENT):
+        if canvas.itemcget(CURRENT, "fill") == "white":
+            newcolor = 'red'
+            canvas.itemconfig(CURRENT, fill=newcolor)
+        elif canvas.itemcget(CURRENT, "fill") == "red":
+            newcolor = 'green'
+            canvas.itemconfig(CURRENT, fill=newcolor)
+        else:
+            newcolor = 'white'
+            canvas.itemconfig(CURRENT, fill=newcolor)
+
+        lednum = int(canvas.gettags(CURRENT)[0].split('LEDNUM_')[1])
+
+        canvas.update_idletasks()
+
+        for idx, color in enumerate(('red', 'green')):
+            pending_leds[lednum * 2 + idx] = 7 if newcolor == color else 0
+        send_pending_leds()
+
+# Serial port manipulation routines
+def open_serial_port(device):
+    """Starts a worker to open device and set up the board. on_connected() is
+    called once it has either succeeded or failed."""
+    global worker, connected, error_count, flush_in_flight
+
+    postfixed_device = device
+    if device.startswith('COM'):
+        postfixed_device = device + ':'
+    connected = False
+    error_count = 0
+    del latencies[:]
+    flush_in_flight = False
+    pending_leds.clear()
+    worker = SerialWorker(postfixed_device)
+    worker.device_name = device
+    worker.start()
+    preferred = cached_divisor(load_registry(), device) if fast else None
+    def connect(client):
+        divisor = negotiate_baudrate(client.ser, preferred) if fast else None
+        initialize_board(client)
+        return divisor
+    worker.submit('connect', connect)
+    status.set('Connecting to %s...' % (device))
+
+def close_worker():
+    """Has the worker close the port once it's done, first putting the board
+    back to the baud rate the other tools expect if it was changed."""
+    if fast:
+        worker.submit('restore', lambda client: restore_baudrate(client.ser))
+    worker.stop()
+
+def drop_worker():
+    """Closes the worker and forgets it, along with any LED changes meant
+    for it. A result it hasn't reported yet never will be, so the LED change
+    it was sending is no longer in flight either."""
+    global worker, flush_in_flight
+    close_worker()
+    worker = None
+    flush_in_flight = False
+    pending_leds.clear()
+
+def initialize_board(client):
+    """Runs on the worker: switches to individual LED mode and blanks the
+    tree."""
+    client.set_display_mode(MODE_INDIVIDUAL_LEDS)
+    client.set_leds([0] * 24)
+    client.flush()
+
+def poll_worker():
+    """Handles whatever the worker has finished since last time, then checks
+    again shortly."""
+    while worker and not worker.results.empty():
+        name, value, error, seconds = worker.results.get()
+        handle_result(name, value, error, seconds)
+    root.after(50, poll_worker)
+
+def handle_result(name, value, error, seconds):
+    global connected, flush_in_flight, error_count
+
+    if name in ('open', 'connect'):
+        if error:
+            error_message = str(error)
+            print(repr(error_message))
+            if error_message == '':
+                error_message = 'Unknown error; are the wires loose?'
+            status.set('Error opening serial port: %s' % (error_message))
+            on_connected(False)
+        elif name == 'connect':
+            connected = True
+            on_connected(True, value)
+        return
+
+    if name == 'leds':
+        flush_in_flight = False
+        latencies.append(seconds)
+        del latencies[:-20]
+        if error:
+            error_count += 1
+            print(repr(str(error)))
+        message = 'Last command %d ms, average %d ms, %d errors' % (
+            seconds * 1000, sum(latencies) / len(latencies) * 1000, error_count)
+        if error:
+            message += ' (%s)' % (error)
+        status.set(message)
+        # Send anything that was clicked while that was going on.
+        send_pending_leds()
+
+def on_connected(success, divisor=None):
+    """Updates the UI once the board has been set up (or failed to be).
+    divisor is the baud rate divisor chosen with --fast."""
+    global worker, port_name
+
+    if success:
+        port.set(worker.device_name)
+        port_name = worker.device_name
+        remember_card(worker.device_name, divisor)
+        status.set('Connected to %s.' % (worker.device_name))
+        connect_text.set("Disconnect")
+        connect.config(state='normal')
+    else:
+        # The port may have opened even though setting the board up failed.
+        drop_worker()
+        connect_text.set("Connect")
+        connect.config(state='normal')
+        port.set("")
+
+def open_serial_if_exists():
+    """Connects to the card this computer was last connected to, if it's
+    plugged in."""
+    known = find_known_ports(load_registry())
+    if known:
+        port.set(known[0].device)
+        connect_text.set("Connecting")
+        connect.config(state='disabled')
+        open_serial_port(known[0].device)
+
+def start_port_search():
+    """Starts watching for the card to be plugged in."""
+    global monitor, search_deadline
+
+    if monitor:
+        monitor.close()
+    monitor = PortMonitor()
+    search_deadline = time.time() + search_time
+
+def find_serial_port():
+    """Checks whether the card has been plugged in since start_port_search(),
+    and connects to it if so."""
+    global monitor, port_name
+
+    if port_name:
+        port.set(port_name)
+        connect_text.set("Disconnect")
+        connect.config(state='normal')
+        return
+
+    added, removed = monitor.changes()
+    if not added and time.time() < search_deadline:
+        root.after(20, find_serial_port)
+        return
+    monitor.close()
+    monitor = None
+
+    if len(added) != 1:
+        tkMessageBox.showerror("Not found", \
+            "Sadly, could not find it. You might need to install drivers.")
+        connect_text.set("Connect")
+        connect.config(state='normal')
+        port.set("")
+        return
+
+    port.set('Found it!')
+
+    # Connect in the background; on_connected() takes it from there and
+    # remembers the card for next time.
+    open_serial_port(added[0].device)
+
+def remember_card(device, divisor=None):
+    """Records the card on device in the registry, so it's connected to
+    straight away next time, along with the baud rate divisor which worked
+    with it, if one was chosen."""
+    info = get_port_info(device)
+    if info is None:
+        return
+    registry = load_registry()
+    if divisor:
+        remember(registry, info, divisor=divisor)
+    else:
+        remember(registry, info)
+    save_registry(registry)
+
+def dump_port_info(port):
+    print('device:      %s' % (port.device))
+    print('description: %s' % (port.description))
+
+def print_link_stats():
+    """Prints what happened on the serial link to the console, for tracking
+    down a slow or flaky connection."""
+    if worker:
+        print('Serial link to %s:' % (worker.device_name))
+        print(worker.stats.summary())
+
+# LED manipulation routines
+def send_pending_leds():
+    """Hands the queued LED changes to the worker. While it is busy, clicks
+    keep collecting in pending_leds and only the latest state of each LED is
+    sent once it's done."""
+    global flush_in_flight
+
+    if flush_in_flight or not pending_leds or not connected:
+        return
+    changes = dict(pending_leds)
+    pending_leds.clear()
+    flush_in_flight = True
+    def flush(client):
+        client.set_leds(changes)
+        return client.flush()
+    worker.submit('leds', flush)
+
+def map_led_bulb_and_color_to_led_pin(led_bulb, color):
+    '''Maps a given LED bulb (0-11) and color 'red, blue' to a physical pin on
+    the FPGA (0-23) controlling that color in that LED bulb.'''
+    pass
+
+def main(argv=None, prog=None):
+    """Opens the window and runs until it's closed, with the command line
+    options in argv (sys.argv[1:] if None)."""
+    global fast
+
+    parser = argparse.ArgumentParser(prog=prog, description="Click the lights "
+        "on the tree to change them on the board.")
+    parser.add_argument("--fast", action='store_true',
+                        help="Talk to the board at the fastest baud rate "
+                             "which passes a quick link test, rather than "
+                             "115200.")
+    fast = parser.parse_args(argv).fast
+    try:
+        windll.shcore.SetProcessDpiAwareness(2)
+    except Exception:
+        pass
+    initialize_ui()
+    open_serial_if_exists()
+    root.mainloop()
+    print_link_stats()
+    if worker:
+        close_worker()
+        worker.join(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+usage = '''
+This program looks at transcripts of the serial traffic between a computer and
+an Xmas Tree Board, recorded with the --transcript option of
+upload_new_pattern.py.
+
+'show' prints a transcript a line per read, write, discarded input or change
+of baud rate, with when it happened.
+'replay' sends the recorded writes to a board again with the same timing,
+changing baud rate where the original did (as upload_new_pattern.py --fast
+does), and reports where its answers differ from the recorded ones, which helps tell
+whether a misbehaving card, cable or driver is to blame.
+'''
+
+import argparse
+import bisect
+import contextlib
+import sys
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+HISTOGRAM_BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float('inf')]
+
+class LinkStats():
+    '''Counters and timings for the traffic on one serial link.
+
+    Commands are timed from sending them to receiving their whole response.
+    Phases are stretches of time spent on one part of a job, such as waiting
+    for responses; time spent in a phase which is entered several times adds
+    up.'''
+
+    def __init__(self):
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies = {}     # Command name to list of round trip times
+        self.phases = {}        # Phase name to total seconds
+        self.retries = 0        # Commands sent again after failing
+        self.mismatches = 0     # Responses which came back wrong
+        self.timeouts = 0       # Responses which didn't come back in time
+
+    def record(self, command, seconds):
+        self.latencies.setdefault(command, []).append(seconds)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.perf_counter() - start
+
+    def histogram(self, command):
+        '''Returns how many of command's round trips fell in each bucket.'''
+        counts = [0] * len(HISTOGRAM_BOUNDS)
+        for seconds in self.latencies.get(command, []):
+            counts[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds * 1000)] += 1
+        return counts
+
+    def to_dict(self):
+        commands = {}
+        for command, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            commands[command] = {
+                'count': len(ordered),
+                'mean_ms': sum(ordered) / len(ordered) * 1000,
+                'median_ms': ordered[len(ordered) // 2] * 1000,
+                'p95_ms': ordered[int(len(ordered) * 0.95)] * 1000,
+                'max_ms': ordered[-1] * 1000,
+                'histogram': dict(zip(bucket_names(), self.histogram(command))),
+            }
+        return {
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'commands': commands,
+            'phases': dict(self.phases),
+            'retries': self.retries,
+            'mismatches': self.mismatches,
+            'timeouts': self.timeouts,
+        }
+
+    def summary(self):
+        '''Returns a few lines describing the link, for people.'''
+        stats = self.to_dict()
+        lines = ['{0} bytes sent, {1} received; {2} retries, {3} mismatched '
+                 'responses, {4} timeouts'.format(
+                 self.bytes_sent, self.bytes_received, self.retries,
+                 self.mismatches, self.timeouts)]
+        if self.phases:
+            lines.append('Time spent: ' + ', '.join(
+                '{0} {1:.2f} s'.format(name, seconds)
+                for name, seconds in sorted(self.phases.items())))
+        for command, command_stats in sorted(stats['commands'].items()):
+            lines.append("'{0}': {1} round trips, {2:.1f} ms average, {3:.1f} ms "
+                         "median, {4:.1f} ms 95th percentile, {5:.1f} ms worst".format(
+                         command, command_stats['count'], command_stats['mean_ms'],
+                         command_stats['median_ms'], command_stats['p95_ms'],
+                         command_stats['max_ms']))
+            counts = self.histogram(command)
+            widest = max(counts)
+            for name, count in zip(bucket_names(), counts):
+                if count:
+                    lines.append('  {0:>9} {1:6} {2}'.format(
+                                 name, count, '#' * (count * 40 // widest)))
+        return '\n'.join(lines)
+
+def bucket_names():
+    names = []
+    for bound in HISTOGRAM_BOUNDS:
+        names.append('<{0}ms'.format(bound) if bound != float('inf') else 'slower')
+    return names
+
+class InstrumentedSerial():
+    '''Wraps an open serial port, counting the bytes that go through it in
+    stats and, if transcript is an open text file, writing each read, write,
+    discarded input buffer and change of baud rate to it with a timestamp. Everything else is
+    passed to the port.'''
+
+    def __init__(self, ser, stats, transcript=None):
+        self.ser = ser
+        self.stats = stats
+        self.transcript = transcript
+        self.start = time.perf_counter()
+
+    def log(self, direction, data):
+        '''Writes an entry to the transcript: data is the bytes read or
+        written, or the new rate for a baud rate change ('b').'''
+        if self.transcript:
+            self.transcript.write('{0:.6f} {1} {2}\n'.format(
+                time.perf_counter() - self.start, direction,
+                data if direction == 'b' else bytes(data).hex()))
+
+    def write(self, data):
+        written = self.ser.write(data)
+        self.stats.bytes_sent += len(data)
+        self.log('>', data)
+        return written
+
+    def read(self, size=1):
+        data = self.ser.read(size)
+        self.stats.bytes_received += len(data)
+        self.log('<', data)
+        return data
+
+    def reset_input_buffer(self):
+        self.ser.reset_input_buffer()
+        self.log('x', b'')
+
+    # Settings have to be changed on the port itself, not on the wrapper.
+    @property
+    def baudrate(self):
+        return self.ser.baudrate
+
+    @baudrate.setter
+    def baudrate(self, baudrate):
+        self.ser.baudrate = baudrate
+        self.log('b', baudrate)
+
+    @property
+    def timeout(self):
+        return self.ser.timeout
+
+    @timeout.setter
+    def timeout(self, timeout):
+        self.ser.timeout = timeout
+
+    def __getattr__(self, name):
+        return getattr(self.ser, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.ser.close()
+
+def read_transcript(path):
+    '''Returns the (seconds, direction, data) entries of a transcript. data is
+    bytes, except for baud rate changes where it's the new rate.'''
+    entries = []
+    with open(path, 'r') as f:
+        for line in f:
+            seconds, direction, data = (line.split() + [''])[:3]
+            data = int(data) if direction == 'b' else bytes.fromhex(data)
+            entries.append((float(seconds), direction, data))
+    return entries
+
+DIRECTIONS = {'>': 'sent', '<': 'read', 'x': 'discarded input', 'b': 'baud'}
+
+def show(entries):
+    for seconds, direction, data in entries:
+        if direction == 'b':
+            print('{0:12.6f} {1:4} {2}'.format(seconds, DIRECTIONS[direction], data))
+            continue
+        print('{0:12.6f} {1:4} {2:<40} {3}'.format(
+              seconds, DIRECTIONS[direction], data.hex(),
+              repr(data) if data else ''))
+
+def replay(entries, ser, log=print):
+    '''Sends the writes in entries to ser at the times they were made, and
+    changes its baud rate when the original did, and reads back as much as
+    was read originally, reporting every read which differs. Returns the
+    number which did.'''
+    start = time.perf_counter()
+    differences = 0
+    for seconds, direction, data in entries:
+        if direction in '>xb':
+            delay = seconds - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
+        if direction == '>':
+            ser.write(data)
+        elif direction == 'x':
+            ser.reset_input_buffer()
+        elif direction == 'b':
+            ser.baudrate = data
+        elif data:
+            answer = ser.read(len(data))
+            if answer != data:
+                differences += 1
+                log('At {0:.6f} s, read {1} where {2} was recorded.'.format(
+                    seconds, repr(answer), repr(data)))
+    return differences
+
+def main(argv=None, prog=None):
+    '''Shows or replays the transcript named on the command line, argv
+    (sys.argv[1:] if None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("action", choices=['show', 'replay'])
+    parser.add_argument("transcript", help="A transcript file.")
+    parser.add_argument("com_port", nargs='?', help="The com port of the FPGA "
+                        "to replay the transcript to (ex: 'COM3:').")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+
+    entries = read_transcript(args.transcript)
+    if args.action == 'show':
+        show(entries)
+    else:
+        if not args.com_port:
+            parser.error('replay needs a com_port')
+        import serial
+        with serial.Serial(args.com_port, 115200, timeout=1) as ser:
+            differences = replay(entries, ser)
+        print('{0} of {1} reads differed.'.format(differences,
+              sum(1 for entry in entries if entry[1] == '<')))
+        if differences:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
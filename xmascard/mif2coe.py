@@ -0,0 +1,26 @@
+import argparse
+from xmascard.led_mem_utils import split_entries
+from xmascard.pattern_image import read_memory
+
+def to_coe(memory):
+    '''Returns a memory image as the text of a Xilinx .coe file, for
+    initializing the pattern memory when the FPGA is built.'''
+    vector = []
+    vector.append('memory_initialization_vector = ')
+    for entry in split_entries(memory):
+        vector.append(entry.hex())
+        vector.append(',')
+    vector.pop()
+    vector.append(';')
+    return 'memory_initialization_radix = 16;\n' + ''.join(vector)
+
+def main(argv=None, prog=None):
+    '''Prints the pattern file named on the command line, argv
+    (sys.argv[1:] if None), as a .coe file.'''
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("pattern_file", help="A text pattern file or pattern image.")
+    args = parser.parse_args(argv)
+    print(to_coe(read_memory(args.pattern_file)))
+
+if __name__ == '__main__':
+    main()
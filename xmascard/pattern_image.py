@@ -0,0 +1,91 @@
+'''Reads and writes pattern images: a compact binary alternative to the text
+pattern files, holding a short header followed by the board's memory exactly
+as it is sent to it.
+
+The header is, in little endian order:
+    4 bytes  magic, b'XMAS'
+    1 byte   format version
+    1 byte   reserved, zero
+    2 bytes  number of frames in the animation before it was padded to fill
+             memory
+    4 bytes  CRC-32 of the memory image
+    20 bytes SHA-1 of the source the image was made from (zeros if unknown)
+followed by the 256 9-byte memory entries.'''
+
+import binascii
+import hashlib
+import mmap
+import struct
+from xmascard.led_mem_utils import MEMORY_ENTRIES, BYTES_PER_ENTRY, read_pattern_file
+
+MAGIC = b'XMAS'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHI20s')
+IMAGE_SIZE = MEMORY_ENTRIES * BYTES_PER_ENTRY
+
+class PatternImage():
+    '''A pattern image read from disk. data is a memoryview of the memory
+    image, mapped straight from the file rather than copied.'''
+    def __init__(self, data, frame_count, checksum, source_hash):
+        self.data = data
+        self.frame_count = frame_count
+        self.checksum = checksum
+        self.source_hash = source_hash
+
+def source_hash(source):
+    '''Returns the hash stored in the header for the given source bytes.'''
+    if source is None:
+        return b'\x00' * 20
+    return hashlib.sha1(source).digest()
+
+def pack_image(data, frame_count=MEMORY_ENTRIES, source=None):
+    '''Returns a complete pattern image for a 2304 byte memory image.'''
+    if len(data) != IMAGE_SIZE:
+        raise ValueError('Memory image is {0} bytes but should be {1}.'.format(
+                         len(data), IMAGE_SIZE))
+    header = HEADER.pack(MAGIC, VERSION, 0, frame_count,
+                         binascii.crc32(data) & 0xffffffff, source_hash(source))
+    return header + bytes(data)
+
+def write_image(path, data, frame_count=MEMORY_ENTRIES, source=None):
+    '''Writes a memory image to path as a pattern image.'''
+    with open(path, 'wb') as f:
+        f.write(pack_image(data, frame_count, source))
+
+def unpack_image(buf):
+    '''Checks the header of a pattern image held in buf and returns it as a
+    PatternImage whose data refers to buf without copying it.'''
+    if len(buf) != HEADER.size + IMAGE_SIZE:
+        raise ValueError('Pattern image is {0} bytes but should be {1}.'.format(
+                         len(buf), HEADER.size + IMAGE_SIZE))
+    magic, version, reserved, frame_count, checksum, source_hash = \
+        HEADER.unpack_from(buf)
+    if magic != MAGIC:
+        raise ValueError('Not a pattern image.')
+    if version != VERSION:
+        raise ValueError('Pattern image version {0} is not supported.'.format(
+                         version))
+    data = memoryview(buf)[HEADER.size:]
+    if binascii.crc32(data) & 0xffffffff != checksum:
+        raise ValueError('Pattern image is corrupt; its checksum does not match.')
+    return PatternImage(data, frame_count, checksum, source_hash)
+
+def read_image(path):
+    '''Memory maps the pattern image at path and returns it as a
+    PatternImage.'''
+    with open(path, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return unpack_image(buf)
+
+def is_image(path):
+    '''Returns True if path holds a pattern image rather than a text pattern
+    file.'''
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read_memory(path):
+    '''Returns the memory image held in path, which can be either a pattern
+    image or a text pattern file.'''
+    if is_image(path):
+        return read_image(path).data
+    return read_pattern_file(path)
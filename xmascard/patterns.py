@@ -0,0 +1,202 @@
+'''Builds animations procedurally, as functions of time and of where each LED
+is on the tree, computed for every frame and every LED at once with NumPy.
+
+A Pattern wraps a function which takes a column of frame numbers and returns
+the brightness (0.0 to 7.0) of all 24 LEDs at each of them. Patterns can be
+played one after another, overlaid, masked to some of the LEDs, sped up or
+slowed down, and rendered to an (N, 24) array of intensities ready for
+led_mem_utils.encode_frames().'''
+
+import itertools
+import numpy
+from xmascard import frame_store
+from xmascard.frame_store import MAX_INTENSITY
+from xmascard.led_mem_utils import LEDS_PER_BOARD, MEMORY_ENTRIES, ROW_LENGTHS, leds
+
+# The geometry of the tree, precomputed for every LED. Each bulb holds a red
+# and a green LED; x is measured in bulb spacings from the middle of the tree
+# and y in rows down from the top.
+BULB = numpy.arange(LEDS_PER_BOARD) // 2
+_bulb_rows = numpy.repeat(numpy.arange(len(ROW_LENGTHS)), ROW_LENGTHS)
+_bulb_x = numpy.concatenate([numpy.arange(n) - (n - 1) / 2.0 for n in ROW_LENGTHS])
+ROW = _bulb_rows[BULB]
+X = _bulb_x[BULB]
+Y = ROW.astype(float)
+RED = numpy.array([leds[bulb][led % 2] == 'r'
+                   for led, bulb in enumerate(BULB)])
+GREEN = ~RED
+# NEIGHBORS[a, b] is True if LEDs a and b are the same color and on bulbs
+# next to each other (in the same row or diagonally between rows).
+_distance = numpy.hypot(X[:, numpy.newaxis] - X, Y[:, numpy.newaxis] - Y)
+NEIGHBORS = (RED[:, numpy.newaxis] == RED) & (_distance > 0) & (_distance < 1.6)
+
+# Every bulb's LEDs in the order a chase visits them: along each row, turning
+# back at the end of it like a snake.
+SNAKE = numpy.concatenate([
+    numpy.flatnonzero(ROW == row)[numpy.argsort(X[ROW == row] * (-1) ** row,
+                                                kind='stable')]
+    for row in range(len(ROW_LENGTHS))])
+
+def rows_of(levels):
+    '''Returns the level each LED is in, given a list of lists of LEDs (like
+    led_mem_utils.levels_red), or -1 for LEDs in none of them.'''
+    level_of = numpy.full(LEDS_PER_BOARD, -1)
+    for level, level_leds in enumerate(levels):
+        level_of[level_leds] = level
+    return level_of
+
+def quantize(brightness):
+    '''Rounds brightnesses to the nearest intensity the board can show.'''
+    return numpy.clip(numpy.rint(brightness), 0, MAX_INTENSITY).astype(numpy.uint8)
+
+class Pattern():
+    '''An animation length frames long, defined by function: given a column
+    of frame numbers (counting from 0), it returns the brightness of every LED
+    at each of them as a (frames, 24) array.'''
+
+    def __init__(self, function, length):
+        self.function = function
+        self.length = length
+
+    def render(self):
+        '''Returns every frame as an (N, 24) array of intensities.'''
+        return quantize(self.function(numpy.arange(self.length)[:, numpy.newaxis]))
+
+    def then(self, *others):
+        return sequence(self, *others)
+
+    def __or__(self, other):
+        '''The brighter of two patterns at each LED, lasting as long as the
+        longer one; the shorter one holds its last frame.'''
+        def function(t):
+            return numpy.maximum(self.function(numpy.minimum(t, self.length - 1)),
+                                 other.function(numpy.minimum(t, other.length - 1)))
+        return Pattern(function, max(self.length, other.length))
+
+    def masked(self, mask):
+        '''Only lights the LEDs where mask (an array of 24 bools) is set.'''
+        return Pattern(lambda t: self.function(t) * mask, self.length)
+
+    def scaled(self, factor):
+        '''Plays the pattern factor times slower (or faster, below 1).'''
+        return Pattern(lambda t: self.function(numpy.floor(t / factor)),
+                       int(round(self.length * factor)))
+
+    def reversed(self):
+        return Pattern(lambda t: self.function(self.length - 1 - t), self.length)
+
+    def repeated(self, times):
+        return Pattern(lambda t: self.function(t % self.length), self.length * times)
+
+    def spread(self, amount=0.5):
+        '''Lets some of each LED's light spill over to its neighbors.'''
+        def function(t):
+            brightness = self.function(t)
+            return numpy.maximum(brightness, amount * (brightness @ NEIGHBORS))
+        return Pattern(function, self.length)
+
+def sequence(*patterns):
+    '''Plays patterns one after another.'''
+    starts = numpy.cumsum([0] + [pattern.length for pattern in patterns])
+    def function(t):
+        brightness = numpy.zeros((len(t), LEDS_PER_BOARD))
+        for pattern, start in zip(patterns, starts):
+            during = ((t >= start) & (t < start + pattern.length))[:, 0]
+            if during.any():
+                brightness[during] = pattern.function(t[during] - start)
+        return brightness
+    return Pattern(function, int(starts[-1]))
+
+def still(frame, length):
+    '''Shows a single frame (24 brightnesses) for length frames.'''
+    frame = numpy.asarray(frame, dtype=float)
+    return Pattern(lambda t: numpy.broadcast_to(frame, (len(t), LEDS_PER_BOARD)),
+                   length)
+
+def sweep(order=range(LEDS_PER_BOARD), levels=(0, 2, 4, 6)):
+    '''Lights each LED on its own, one after another in order, stepping
+    through levels.'''
+    order = numpy.asarray(order)
+    levels = numpy.asarray(levels, dtype=float)
+    def function(t):
+        t = t.astype(int)
+        lit = order[t // len(levels)]
+        return numpy.where(numpy.arange(LEDS_PER_BOARD) == lit,
+                           levels[t % len(levels)], 0)
+    return Pattern(function, len(order) * len(levels))
+
+def waterfall(levels, fade=MAX_INTENSITY + 1, hold=MAX_INTENSITY + 1):
+    '''Fades levels (a list of lists of LEDs) on one after another, each
+    taking fade frames, then holds them all on for hold frames. LEDs in none of
+    the levels stay off.'''
+    level_of = rows_of(levels)
+    def function(t):
+        # During the hold everything stays as it was on the last frame of the
+        # fades.
+        t = numpy.minimum(t.astype(int), len(levels) * fade - 1)
+        stage = t // fade
+        step = (t % fade) * MAX_INTENSITY / (fade - 1)
+        finished = (level_of >= 0) & (level_of < stage)
+        return numpy.where(finished, MAX_INTENSITY,
+                           numpy.where(level_of == stage, step, 0))
+    return Pattern(function, len(levels) * fade + hold)
+
+def spiral(length, period=48, twist=1.0, width=0.35):
+    '''A stripe which winds down around the tree like a barber's pole,
+    coming round every period frames. twist tilts it.'''
+    def function(t):
+        phase = (Y + twist * X) / len(ROW_LENGTHS) - t / period
+        distance = numpy.abs(phase - numpy.rint(phase))
+        return MAX_INTENSITY * numpy.clip(1 - distance / width, 0, 1)
+    return Pattern(function, length)
+
+def twinkle(length, density=0.05, decay=0.7, seed=0):
+    '''LEDs flash on at random, density being the chance each one does on any
+    frame, and fade away by decay every frame after.'''
+    flashes = numpy.random.default_rng(seed).random((length, LEDS_PER_BOARD)) < density
+    # How long ago each LED last flashed, for every frame at once.
+    frame = numpy.arange(length)[:, numpy.newaxis]
+    last = numpy.maximum.accumulate(numpy.where(flashes, frame, -length), axis=0)
+    brightness = MAX_INTENSITY * decay ** (frame - last)
+    return Pattern(lambda t: brightness[t.astype(int)[:, 0]], length)
+
+def chase(length, speed=0.5, tail=4, order=SNAKE):
+    '''A light with a fading tail runs along order (by default round every
+    bulb in turn), moving speed LEDs a frame.'''
+    order = numpy.asarray(order)
+    position = numpy.empty(LEDS_PER_BOARD)
+    position[order] = numpy.arange(len(order))
+    position[numpy.setdiff1d(numpy.arange(LEDS_PER_BOARD), order)] = numpy.nan
+    def function(t):
+        behind = (t * speed - position) % len(order)
+        brightness = MAX_INTENSITY * numpy.clip(1 - behind / tail, 0, 1)
+        return numpy.nan_to_num(brightness)
+    return Pattern(function, length)
+
+PATTERNS = {
+    'spiral': spiral,
+    'twinkle': twinkle,
+    'chase': chase,
+}
+
+def variations(make, **options):
+    '''Yields (options, pattern) for make called with every combination of
+    options, each given as a list of values to try.'''
+    names = sorted(options)
+    for values in itertools.product(*(options[name] for name in names)):
+        chosen = dict(zip(names, values))
+        yield chosen, make(**chosen)
+
+def search(candidates, budget=MEMORY_ENTRIES):
+    '''Renders (options, pattern) candidates and returns the (options, frames)
+    of those which fit in budget frames, best first: the ones which use most of
+    the budget, with the fewest frames which just repeat an earlier one.'''
+    fits = []
+    for options, pattern in candidates:
+        if pattern.length > budget or pattern.length == 0:
+            continue
+        frames = pattern.render()
+        holds, repeats = frame_store.count_redundant(frames)
+        fits.append((budget - len(frames), holds + repeats, options, frames))
+    fits.sort(key=lambda fit: fit[:2])
+    return [(options, frames) for unused, redundant, options, frames in fits]
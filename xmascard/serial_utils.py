@@ -0,0 +1,275 @@
+import queue
+import struct
+import threading
+import time
+import serial
+import serial.tools.list_ports
+from xmascard.led_mem_utils import LEDS_PER_BOARD
+from xmascard.link_stats import LinkStats, InstrumentedSerial
+
+# Attributes which together identify a particular card's USB-serial adapter.
+SERIAL_ATTRIBUTES_MATCH = ['device', 'hwid', 'vid', 'pid', 'serial_number']
+
+def get_port_info(device):
+    '''Returns the list_ports entry for device, or None if the system doesn't
+    list it (a pseudo-terminal, for instance).'''
+    device = device.rstrip(':') # Accept 'COM3:' as well as 'COM3'
+    for port in serial.tools.list_ports.comports():
+        if port.device == device:
+            return port
+    return None
+
+def port_key(port):
+    '''Returns a string identifying the card on a list_ports entry, built from
+    its SERIAL_ATTRIBUTES_MATCH attributes.'''
+    return '|'.join(str(getattr(port, attr)) for attr in SERIAL_ATTRIBUTES_MATCH)
+
+def port_identity(device):
+    '''Returns port_key() for the port device names, or just the name if the
+    system doesn't list it.'''
+    port = get_port_info(device)
+    if port is None:
+        return device.rstrip(':')
+    return port_key(port)
+
+def find_card_ports():
+    '''Returns the list_ports entries of every USB serial adapter on the
+    system, which is where cards show up.'''
+    return [port for port in serial.tools.list_ports.comports()
+            if port.vid is not None]
+
+# Display modes the board can be switched to with the 'm' command.
+MODE_FREE_RUNNING = 0
+MODE_STORED_PATTERN = 1
+MODE_RANDOM = 2
+MODE_INDIVIDUAL_LEDS = 3
+
+# The board's UART runs at BASE_BAUDRATE divided by a divisor from 1 to 7,
+# which the 'r' command changes. It starts at DEFAULT_DIVISOR, 115200 baud, and
+# goes back to it if a new rate isn't confirmed by a ping within RATE_TIMEOUT
+# seconds.
+BASE_BAUDRATE = 806400
+DEFAULT_DIVISOR = 7
+DEFAULT_BAUDRATE = BASE_BAUDRATE // DEFAULT_DIVISOR
+RATE_TIMEOUT = 0.33
+
+# What a ping carries after the 'p'. The board echoes each byte, and only
+# confirms a new baud rate if all of them arrive intact. None of them is a
+# command, so boards without pings ignore them.
+PING_BYTES = b'\x00\xff\x55\xaa\x0f\xf0\x33\xcc'
+
+# How many pings a new baud rate has to survive to be kept. 7 fit in the
+# board's receive FIFO.
+LINK_TEST_PINGS = 4
+
+def divisor_baudrate(divisor):
+    return BASE_BAUDRATE // divisor
+
+def ping(ser, count=1, timeout=0.1):
+    '''Sends count pings, waiting up to timeout seconds for each echo.
+    Returns whether they all came back intact.'''
+    saved = ser.timeout
+    ser.timeout = timeout
+    try:
+        ser.write((b'p' + PING_BYTES) * count)
+        return ser.read(len(PING_BYTES) * count) == PING_BYTES * count
+    finally:
+        ser.timeout = saved
+
+def fall_back(ser):
+    '''Gets the board and ser back to 115200 baud after a new rate failed its
+    link test. Raises IOError if the board can't be reached.'''
+    # The board may have taken one of the pings and kept the new rate, so ask
+    # it to go back. If it didn't, this is garbage to it, but it'll go back by
+    # itself once RATE_TIMEOUT is up.
+    ser.write(b'r' + bytes([DEFAULT_DIVISOR]))
+    ser.flush()
+    ser.baudrate = DEFAULT_BAUDRATE
+    for attempt in range(3):
+        time.sleep(RATE_TIMEOUT + 0.1)
+        ser.reset_input_buffer()
+        if ping(ser):
+            return
+    raise IOError('Lost touch with the board after a failed baud rate change.')
+
+def try_divisor(ser, divisor):
+    '''Switches the board and ser to the baud rate for divisor, and keeps it
+    if a few pings get through. Returns whether it was kept; if not, both are
+    back at 115200 baud.'''
+    ser.reset_input_buffer()
+    ser.write(b'r' + bytes([divisor]))
+    if ser.read(1) != bytes([divisor]):
+        raise IOError('The board did not echo baud rate divisor {0}.'.format(divisor))
+    ser.baudrate = divisor_baudrate(divisor)
+    if ping(ser, LINK_TEST_PINGS):
+        return True
+    fall_back(ser)
+    return False
+
+def negotiate_baudrate(ser, preferred=None, log=print):
+    '''Switches the board and ser, which should be open at 115200 baud, to the
+    fastest baud rate which survives a link test. preferred, the divisor which
+    worked last time, is tried first, and kept if it still works. Returns the
+    divisor in use: DEFAULT_DIVISOR if nothing faster works or the board can't
+    change baud rate.'''
+    if not ping(ser):
+        # A tool which stopped part way may have left the board at a faster
+        # rate.
+        if preferred and preferred != DEFAULT_DIVISOR:
+            ser.baudrate = divisor_baudrate(preferred)
+            if ping(ser):
+                return preferred
+            ser.baudrate = DEFAULT_BAUDRATE
+        log('The board does not answer pings; staying at {0} baud.'.format(DEFAULT_BAUDRATE))
+        return DEFAULT_DIVISOR
+    divisors = list(range(1, DEFAULT_DIVISOR))
+    if preferred in divisors:
+        divisors.remove(preferred)
+        divisors.insert(0, preferred)
+    for divisor in divisors:
+        if try_divisor(ser, divisor):
+            return divisor
+        log('{0} baud failed the link test.'.format(divisor_baudrate(divisor)))
+    return DEFAULT_DIVISOR
+
+def restore_baudrate(ser):
+    '''Puts the board and ser back to 115200 baud, which the other tools
+    expect, after negotiate_baudrate(). Returns whether the board confirmed
+    it.'''
+    if ser.baudrate == DEFAULT_BAUDRATE:
+        return True
+    ser.reset_input_buffer()
+    ser.write(b'r' + bytes([DEFAULT_DIVISOR]))
+    ser.read(1)
+    ser.baudrate = DEFAULT_BAUDRATE
+    return ping(ser)
+
+class BoardClient():
+    '''Controls the LEDs of a board individually over an open serial port.
+
+    Changes are collected with set_led() and set_leds(), which only remember
+    the latest intensity for each LED, and sent together by flush(). Round
+    trips and failures are recorded in stats, a LinkStats.'''
+
+    # Sent after each 'i' command. The board ignores it, but it gives boards
+    # without a receive FIFO time to finish echoing one command before the next
+    # one arrives.
+    SPACER = b'\x00'
+
+    def __init__(self, ser, stats=None):
+        self.ser = ser
+        self.stats = stats or LinkStats()
+        self.pending = {}
+        # What each LED was last successfully set to; None if unknown.
+        self.intensities = [None] * LEDS_PER_BOARD
+
+    def set_display_mode(self, mode):
+        '''Switches the board's display mode, checking it echoes the new
+        mode.'''
+        mode_byte = struct.pack('B', mode)
+        sent = time.perf_counter()
+        self.ser.write(b'm' + mode_byte)
+        readback = self.ser.read()
+        self.record('m', sent, readback, mode_byte)
+        if readback != mode_byte:
+            raise IOError('Board answered {0} when switching to mode {1}; '
+                          'are the wires loose?'.format(repr(readback), mode))
+
+    def set_led(self, led, intensity):
+        '''Queues a change to a given led (0-23)'s intensity (0-7, 0: off,
+        7: full on).'''
+        self.pending[led] = intensity
+
+    def set_leds(self, intensities):
+        '''Queues changes to several LEDs, given as a list of all 24
+        intensities or a dict from LED to intensity.'''
+        if not isinstance(intensities, dict):
+            intensities = dict(enumerate(intensities))
+        self.pending.update(intensities)
+
+    def flush(self):
+        '''Sends every queued change the board doesn't already have in one
+        write, then checks all the echoes. Returns the number of LEDs
+        changed.'''
+        changes = [(led, intensity) for led, intensity in sorted(self.pending.items())
+                   if self.intensities[led] != intensity]
+        self.pending.clear()
+        if not changes:
+            return 0
+        sent = time.perf_counter()
+        self.ser.write(b''.join(b'i' + struct.pack('BB', led, intensity) + self.SPACER
+                                for led, intensity in changes))
+        expected = b''.join(struct.pack('BB', led, intensity)
+                            for led, intensity in changes)
+        readback = self.ser.read(len(expected))
+        self.record('i', sent, readback, expected)
+        if readback != expected:
+            # Some of the changes may have been made, but there's no telling
+            # which.
+            for led, intensity in changes:
+                self.intensities[led] = None
+            raise IOError('Board echoed {0} when setting LEDs {1}; '
+                          'expected {2}.'.format(repr(readback),
+                                                 [led for led, i in changes],
+                                                 repr(expected)))
+        for led, intensity in changes:
+            self.intensities[led] = intensity
+        return len(changes)
+
+    def record(self, command, sent, readback, expected):
+        '''Records how a command sent at time sent went in stats. A batch of
+        LED changes counts as one round trip.'''
+        if len(readback) < len(expected):
+            self.stats.timeouts += 1
+        elif readback != expected:
+            self.stats.mismatches += 1
+        else:
+            self.stats.record(command, time.perf_counter() - sent)
+
+class SerialWorker(threading.Thread):
+    '''Owns a serial port on a background thread so callers never wait on it.
+
+    Jobs are functions taking the worker's BoardClient. submit() queues one,
+    and once it has run a (name, value, error, seconds) tuple is put on the
+    results queue: what it returned, the exception it raised (or None) and
+    how long it took. Opening the port is reported the same way, as a job
+    named 'open'. The port's traffic is recorded in stats, a LinkStats.'''
+
+    def __init__(self, device, baudrate=115200, timeout=1):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.device = device
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.stats = LinkStats()
+
+    def submit(self, name, job):
+        self.jobs.put((name, job))
+
+    def stop(self):
+        '''Closes the port once the jobs already queued have run.'''
+        self.jobs.put(None)
+
+    def run(self):
+        start = time.time()
+        try:
+            ser = serial.Serial(self.device, self.baudrate, timeout=self.timeout)
+        except Exception as e:
+            self.results.put(('open', None, e, time.time() - start))
+            return
+        self.results.put(('open', None, None, time.time() - start))
+        client = BoardClient(InstrumentedSerial(ser, self.stats), self.stats)
+        with ser:
+            while True:
+                item = self.jobs.get()
+                if item is None:
+                    break
+                name, job = item
+                start = time.time()
+                try:
+                    value, error = job(client), None
+                except Exception as e:
+                    value, error = None, e
+                self.results.put((name, value, error, time.time() - start))
@@ -0,0 +1,360 @@
+usage = '''
+This program plays an animation on the Xmas Tree Board live, by switching it to
+individual LED mode and sending each frame as it's due, rather than uploading
+it to the board's memory. That means animations can be any length, and can
+even be generated on the fly by another program and piped in.
+
+The animation can be an animation file (see convert_animation_file.py), a
+pattern image, a converted pattern file with --converted, or '-' to read an
+animation file from stdin as it's written.
+
+With --stored, the animation is played from the board's pattern RAM instead,
+in stored pattern mode and at the board's own frame rate, as an uploaded
+pattern is. While the board shows one half of the RAM, the next 128 frames
+are written to the other half, so the animation can still be any length.
+'''
+
+import argparse
+import itertools
+import math
+import queue
+import sys
+import threading
+import time
+import serial
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.convert_animation_file import AnimationParser, AnimationError
+from xmascard.device_registry import cached_divisor, load_registry, remember_divisor, save_registry
+from xmascard.led_mem_utils import BOARD_FPS, MEMORY_ENTRIES
+from xmascard.link_stats import LinkStats, InstrumentedSerial
+from xmascard.serial_utils import (BoardClient, DEFAULT_BAUDRATE, MODE_INDIVIDUAL_LEDS,
+                          MODE_STORED_PATTERN, divisor_baudrate,
+                          negotiate_baudrate, restore_baudrate)
+from xmascard.upload_new_pattern import set_display_mode, write_bursts, write_lines
+
+# With --stored, the RAM is written a block of half of it at a time.
+BLOCK = MEMORY_ENTRIES // 2
+
+# How many lines past the one being shown the animation starts, to leave time
+# to write its first block.
+LEAD = 16
+
+# A block which can't be written until this close to the end of its turn to
+# be shown is skipped rather than written.
+MARGIN = 4
+
+class PlaybackStats():
+    '''Keeps track of how well playback is keeping up.'''
+    def __init__(self):
+        self.start = time.time()
+        self.finish = None # When the last frame was shown, if it's known
+        self.shown = 0
+        self.dropped = 0
+        self.underruns = 0 # Frames the board reached before they were written
+        self.latencies = []
+
+    def summary(self):
+        elapsed = max((self.finish or time.time()) - self.start, 1e-9)
+        parts = ['{0:.1f} fps'.format(self.shown / elapsed)]
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            parts.append('latency {0:.1f} ms average, {1:.1f} ms worst'.format(
+                         sum(latencies) / len(latencies) * 1000, latencies[-1] * 1000))
+        parts.append('{0} frames shown, {1} dropped'.format(self.shown, self.dropped))
+        if self.underruns:
+            parts.append('{0} underruns'.format(self.underruns))
+        return ', '.join(parts)
+
+def play(client, frames, fps, log=print, stats=None):
+    '''Shows frames on the board at fps frames per second, keeping track of
+    how it went in stats, and returns stats. Only the LEDs which changed since
+    the last frame are sent.
+
+    When a frame can't be shown on time it is dropped in favor of the next one
+    rather than queued, since a backlog would only put the board further and
+    further behind.'''
+    period = 1.0 / fps
+    stats = stats or PlaybackStats()
+    last_report = stats.start
+    for index, frame in enumerate(frames):
+        deadline = stats.start + index * period
+        now = time.time()
+        if now > deadline + period:
+            stats.dropped += 1
+            continue
+        if now < deadline:
+            time.sleep(deadline - now)
+        sent = time.time()
+        client.set_leds(frame)
+        client.flush()
+        stats.latencies.append(time.time() - sent)
+        stats.shown += 1
+        if sent - last_report >= 1:
+            log(stats.summary())
+            last_report = sent
+    return stats
+
+def play_address(ser):
+    '''Asks the board which line of its pattern RAM it's showing.'''
+    ser.write(b'a')
+    answer = ser.read(1)
+    if not answer:
+        raise IOError("The board didn't say which line it's showing; it needs "
+                      "to be built with the playback address command.")
+    return answer[0]
+
+class PlaybackClock():
+    '''Keeps track of how far through a long animation the board is, as it
+    plays it from the pattern RAM. Frame n of the animation is at line
+    (base + n) % 256, and frame 0 is LEAD lines after the one the board was
+    showing when the clock was made.
+
+    Where the board is up to is predicted from BOARD_FPS, and corrected each
+    time sync() asks it, so the difference between its clock and this
+    computer's doesn't build up.'''
+
+    def __init__(self, ser, lead=LEAD):
+        self.ser = ser
+        address, when = self.ask()
+        self.base = (address + lead) % MEMORY_ENTRIES
+        self.start = when + (lead - 0.5) / BOARD_FPS
+
+    def ask(self):
+        '''Returns the line the board is showing and roughly when it said
+        so.'''
+        sent = time.time()
+        address = play_address(self.ser)
+        return address, (sent + time.time()) / 2
+
+    def frame_at(self, when):
+        '''Returns which frame the board is predicted to be showing at time
+        when; negative before the animation starts.'''
+        return int(math.floor((when - self.start) * BOARD_FPS))
+
+    def time_of(self, frame):
+        '''Returns when the board is predicted to start showing frame.'''
+        return self.start + frame / BOARD_FPS
+
+    def sync(self):
+        '''Asks the board which frame it's showing and returns it.'''
+        address, when = self.ask()
+        predicted = self.frame_at(when)
+        # The line only gives the frame modulo 256; take whichever frame with
+        # that line is nearest the prediction. The board moved on to it at
+        # some point in the last frame time, so say halfway through.
+        frame = predicted + (address - self.base - predicted + BLOCK) % MEMORY_ENTRIES - BLOCK
+        self.start = when - (frame + 0.5) / BOARD_FPS
+        return frame
+
+def stored_blocks(frames):
+    '''Splits frames into blocks of BLOCK memory entries to write, each
+    paired with how many of its frames are from the animation. The last is
+    padded with its final frame, and followed by two more blocks of it, so
+    the board is left showing it once the animation is over.'''
+    frames = iter(frames)
+    last = None
+    while True:
+        block = list(itertools.islice(frames, BLOCK))
+        if not block:
+            break
+        last = block[-1]
+        yield led_mem_utils.encode_frames(block + [last] * (BLOCK - len(block))), len(block)
+        if len(block) < BLOCK:
+            break
+    if last is not None:
+        hold = led_mem_utils.encode_frames([last] * BLOCK)
+        yield hold, 0
+        yield hold, 0
+
+def play_stored(ser, frames, log=print, stats=None, link_stats=None):
+    '''Plays frames, an iterable of any length, from the board's pattern RAM
+    at the board's own frame rate, and returns stats, a PlaybackStats. The
+    traffic is recorded in link_stats, a LinkStats.
+
+    The RAM is used as two blocks of BLOCK lines. Each block is written once
+    the board has finished showing what was in it, while the board shows the
+    other one, and has to be finished before the board gets back round to
+    it. Frames the board reached first are counted as underruns: it shows
+    whatever was in the line before instead. If a block can only be written
+    once the board is nearly done with it, it's skipped and its frames are
+    counted as dropped, to catch up.'''
+    stats = stats or PlaybackStats()
+    link_stats = link_stats or LinkStats()
+    set_display_mode(ser, MODE_STORED_PATTERN, link_stats)
+    clock = PlaybackClock(ser)
+    stats.start = clock.time_of(0)
+    first = 0 # The frame the next block starts with
+    end = 0   # The frame after the last one written
+    for data, count in stored_blocks(frames):
+        # Wait for the board to finish with the block written last time round.
+        while True:
+            time.sleep(max(clock.time_of(first - BLOCK) - time.time(), 0))
+            shown = clock.sync()
+            stats.shown = max(min(shown, end), 0) - stats.dropped
+            if shown >= first - BLOCK:
+                break
+        if shown >= first + BLOCK - MARGIN:
+            log('Too late for frames {0} to {1}; skipping them.'.format(
+                first, first + BLOCK - 1))
+            stats.dropped += count
+            first += BLOCK
+            end = first
+            continue
+        lines = [((clock.base + first + i) % MEMORY_ENTRIES, entry)
+                 for i, entry in enumerate(led_mem_utils.split_entries(data))]
+        failed = write_bursts(ser, lines, log, stats=link_stats)
+        if failed:
+            link_stats.retries += len(failed)
+            failed = write_lines(ser, failed, log=log, stats=link_stats)
+        if failed:
+            log('Could not write lines', [address for address, entry in failed])
+        shown = clock.sync()
+        if shown >= first:
+            late = min(shown - first + 1, count)
+            log('Underrun: the board reached frame {0} before it was written, '
+                'and was {1} frames into the block by the time it was.'.format(
+                first, shown - first + 1))
+            stats.underruns += late
+        if count:
+            end = first + count
+            if stats.shown:
+                log(stats.summary())
+        first += BLOCK
+    # The board carries on showing the last frame once the animation is over.
+    stats.finish = clock.time_of(end)
+    return stats
+
+def latest_frames(frames):
+    '''Reads frames on a background thread for a live source, and each time
+    it's asked returns the newest one which has arrived since, so frames which
+    arrive faster than they can be shown are merged rather than queued up. If
+    nothing new has arrived, the previous frame is returned again.'''
+    arrived = queue.Queue()
+    done = object()
+    errors = []
+    def read():
+        try:
+            for frame in frames:
+                arrived.put(frame)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            arrived.put(done)
+    threading.Thread(target=read, daemon=True).start()
+
+    frame = arrived.get() # Wait for the first frame.
+    while frame is not done:
+        yield frame
+        while not arrived.empty():
+            newest = arrived.get()
+            if newest is done:
+                frame = done
+                break
+            frame = newest
+    # Pass on anything which went wrong reading the frames.
+    if errors:
+        raise errors[0]
+
+def load_frames(source, converted):
+    '''Returns the frames of source, an animation file, a pattern image or a
+    converted pattern file.'''
+    if pattern_image.is_image(source):
+        image = pattern_image.read_image(source)
+        return list(led_mem_utils.decode_frames(image.data)[:image.frame_count])
+    if converted:
+        return list(led_mem_utils.decode_frames(led_mem_utils.read_pattern_file(source)))
+    with open(source, 'r') as f:
+        return [frame.leds for frame in AnimationParser(log=lambda *a: None).parse(f)]
+
+def main(argv=None, prog=None):
+    '''Plays the animation named on the command line, argv (sys.argv[1:] if
+    None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("com_port", help="The com port of the FPGA (ex: 'COM3:')")
+    parser.add_argument("source", help="The animation to play, or '-' to read one from stdin.")
+    parser.add_argument("--fps", type=float, default=25,
+                        help="Frames per second to play at.")
+    parser.add_argument("--loop", action='store_true',
+                        help="Play the animation over and over until stopped. "
+                             "Not possible when reading from stdin.")
+    parser.add_argument("--stored", action='store_true',
+                        help="Play from the board's pattern RAM at its own "
+                             "frame rate, writing one half while it shows the "
+                             "other, rather than setting the LEDs for every "
+                             "frame. Needs a board built with the burst write "
+                             "and playback address commands. --fps is ignored.")
+    parser.add_argument("--converted", action='store_true',
+                        help="The source is a text pattern file made by "
+                             "convert_animation_file.py.")
+    parser.add_argument("--fast", action='store_true',
+                        help="Switch the board to the fastest baud rate which "
+                             "passes a quick link test while playing, so "
+                             "busier animations keep up.")
+    parser.add_argument("--stats", action='store_true',
+                        help="Print statistics about the serial traffic at the end.")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+    if args.loop and args.source == '-':
+        parser.error("--loop can't replay an animation read from stdin.")
+
+    if args.source == '-':
+        frames = (frame.leds for frame in
+                  AnimationParser(log=lambda *a: None).parse(sys.stdin))
+        if not args.stored:
+            frames = latest_frames(frames)
+    else:
+        try:
+            frames = load_frames(args.source, args.converted)
+        except (IOError, AnimationError) as e:
+            print(e)
+            sys.exit(1)
+        if args.loop:
+            frames = itertools.cycle(frames)
+
+    link_stats = LinkStats()
+    try:
+        with serial.Serial(args.com_port, DEFAULT_BAUDRATE, timeout=1) as ser:
+            client = BoardClient(InstrumentedSerial(ser, link_stats), link_stats)
+            if args.fast:
+                registry = load_registry()
+                divisor = negotiate_baudrate(client.ser, cached_divisor(registry, args.com_port))
+                remember_divisor(registry, args.com_port, divisor)
+                save_registry(registry)
+                print('Playing at {0} baud.'.format(divisor_baudrate(divisor)))
+            stats = PlaybackStats()
+            try:
+                if args.stored:
+                    play_stored(client.ser, frames, stats=stats, link_stats=link_stats)
+                else:
+                    client.set_display_mode(MODE_INDIVIDUAL_LEDS)
+                    play(client, frames, args.fps, stats=stats)
+            except KeyboardInterrupt:
+                print()
+            finally:
+                if args.fast:
+                    # Leave the card at the rate the other tools expect, even
+                    # if playback failed.
+                    try:
+                        restore_baudrate(client.ser)
+                    except (IOError, serial.SerialException):
+                        pass # Most likely the card is gone; report why it went.
+            print('Done:', stats.summary())
+            if args.stats:
+                print(link_stats.summary())
+    except AnimationError as e:
+        print(e)
+        sys.exit(1)
+    except (IOError, serial.SerialException) as e:
+        # The port couldn't be opened, or the card stopped answering or was
+        # unplugged part way through.
+        print(e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
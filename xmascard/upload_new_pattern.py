@@ -0,0 +1,559 @@
+import argparse
+import binascii
+import collections
+import concurrent.futures
+import glob
+import json
+import os
+import sys
+import serial
+import struct
+import time
+from xmascard import led_mem_utils
+from xmascard import pattern_image
+from xmascard.led_mem_utils import MEMORY_ENTRIES
+from xmascard.device_registry import (cached_divisor, find_known_ports, load_registry,
+                             remember_divisor, save_registry)
+from xmascard.link_stats import LinkStats, InstrumentedSerial
+from xmascard.serial_utils import (DEFAULT_BAUDRATE, divisor_baudrate, find_card_ports,
+                          negotiate_baudrate, port_identity, restore_baudrate)
+
+# Remembers what was last written to each card so --delta can skip lines which
+# already hold the right value.
+CACHE_FILE = os.path.join(os.path.expanduser('~'), '.xmascard_upload_cache.json')
+
+# Each 'w' command is answered with 'o', the address, the 9 data bytes and 'd'.
+RESPONSE_LEN = 1 + 1 + 9 + 1
+
+# The board's receive FIFO holds 63 bytes, so at most this many 'w' commands
+# can be in flight. Sending more overflows it, and the bytes left over once the
+# board loses track of where commands start can write garbage to any line.
+MAX_WINDOW = 63 // (1 + 1 + 9)
+
+# A 'b' command writes up to 256 consecutive lines, and is answered once with
+# 'o', the 16 bit sum of every byte sent after the 'b' (most significant byte
+# first) and 'd'.
+MAX_BURST = 256
+BURST_RESPONSE_LEN = 1 + 2 + 1
+
+# A 'c' command asks for the CRC of a run of lines, and is answered the same
+# way. Cards are checked a block of lines at a time, with every block's
+# command sent at once: that fits in the receive FIFO.
+CHECK_BLOCK = 16
+MAX_CHECKS = 63 // 3
+
+def read_pattern(pattern_file):
+    '''Reads a pattern image, or a text pattern file of 256 lines of 18 hex
+    digits, into a list of 9 byte RAM lines.'''
+    return led_mem_utils.split_entries(pattern_image.read_memory(pattern_file))
+
+def set_display_mode(ser, mode, stats=None):
+    '''Switches the board's display mode, checking it echoes the new mode.'''
+    stats = stats or LinkStats()
+    mode_byte = struct.pack('B', mode)
+    sent = time.perf_counter()
+    ser.write(b'm' + mode_byte)
+    readback = ser.read()
+    if len(readback) != 1:
+        stats.timeouts += 1
+        raise IOError('Board did not answer when switching to mode {0}; '
+                      'is it plugged in?'.format(mode))
+    stats.record('m', time.perf_counter() - sent)
+    if readback != mode_byte:
+        stats.mismatches += 1
+        raise IOError('Board answered {0} when switching to mode {1}; '
+                      'are the wires loose?'.format(repr(readback), mode))
+
+def build_write_command(address, data):
+    '''Builds a complete 'w' command for one RAM line in a single buffer.'''
+    assert len(data) == led_mem_utils.BYTES_PER_ENTRY
+    return b'w' + struct.pack('B', address) + data # RAM indexes from 0 - 255
+
+def check_response(address, data, response, log=print):
+    '''Returns True if response is the expected echo of writing data to
+    address.'''
+    if len(response) != RESPONSE_LEN or response[0:1] != b'o':
+        log('Error writing line', address, repr(response[0:1]))
+        return False
+    if response[1] != address:
+        log('Error writing line', address, 'address echoed as', response[1])
+        return False
+    data_back = response[2:11]
+    if data_back != data:
+        for byte_idx in range(9):
+            if data_back[byte_idx] != data[byte_idx]:
+                log('fv:', byte_idx, repr(bytes(data[byte_idx:byte_idx+1])),
+                    repr(data_back[byte_idx:byte_idx+1]))
+        return False
+    if response[11:12] != b'd':
+        log('Error writing line', address, 'missing done marker')
+        return False
+    return True
+
+def build_burst_command(address, lines):
+    '''Builds a 'b' command writing the 9 byte RAM lines in lines to address
+    onwards.'''
+    assert 0 < len(lines) <= MAX_BURST
+    return b'b' + struct.pack('BB', address, len(lines) - 1) + b''.join(lines)
+
+def burst_response(command):
+    '''Returns the response the board should give to a 'b' command.'''
+    return b'o' + struct.pack('>H', sum(command[1:]) & 0xffff) + b'd'
+
+def find_runs(lines):
+    '''Splits (address, data) pairs into runs of consecutive addresses, each
+    short enough for one burst.'''
+    runs = []
+    for address, data in lines:
+        if (runs and len(runs[-1]) < MAX_BURST and
+                runs[-1][-1][0] + 1 == address):
+            runs[-1].append((address, data))
+        else:
+            runs.append([(address, data)])
+    return runs
+
+def build_check_command(address, count):
+    '''Builds a 'c' command asking for the CRC of count lines from address.'''
+    assert 0 < count <= MAX_BURST
+    return b'c' + struct.pack('BB', address, count - 1)
+
+def line_crc(lines):
+    '''Returns the CRC the board computes over a run of 9 byte RAM lines:
+    CRC-16-CCITT starting from 0xFFFF.'''
+    return binascii.crc_hqx(b''.join(lines), 0xffff)
+
+def read_checks(ser, blocks, stats=None):
+    '''Asks the board for the CRC of each (address, count) block, sending
+    MAX_CHECKS commands at a time. Returns the CRCs, with None for any that
+    weren't answered properly.'''
+    stats = stats or LinkStats()
+    crcs = []
+    for start in range(0, len(blocks), MAX_CHECKS):
+        group = blocks[start:start + MAX_CHECKS]
+        sent = time.perf_counter()
+        ser.write(b''.join(build_check_command(address, count)
+                           for address, count in group))
+        response = ser.read(BURST_RESPONSE_LEN * len(group))
+        if len(response) == BURST_RESPONSE_LEN * len(group):
+            stats.record('c', time.perf_counter() - sent)
+        else:
+            stats.timeouts += 1
+        for i in range(len(group)):
+            answer = response[i * BURST_RESPONSE_LEN:(i + 1) * BURST_RESPONSE_LEN]
+            if (len(answer) == BURST_RESPONSE_LEN and answer[0:1] == b'o' and
+                    answer[3:4] == b'd'):
+                crcs.append(struct.unpack('>H', answer[1:3])[0])
+            else:
+                crcs.append(None)
+        if None in crcs[start:]:
+            resync(ser)
+    return crcs
+
+def find_differences(ser, pattern, stats=None):
+    '''Returns the addresses of the lines of pattern which the board might not
+    hold: every line of each CHECK_BLOCK line block whose CRC differs.'''
+    blocks = [(address, min(CHECK_BLOCK, len(pattern) - address))
+              for address in range(0, len(pattern), CHECK_BLOCK)]
+    crcs = read_checks(ser, blocks, stats)
+    return [address
+            for (start, count), crc in zip(blocks, crcs)
+            if crc != line_crc(pattern[start:start + count])
+            for address in range(start, start + count)]
+
+def resync(ser):
+    '''Discards whatever is left of the responses still on their way so the
+    next command starts from a clean slate.'''
+    ser.flush()
+    time.sleep(ser.timeout or 0.1)
+    ser.reset_input_buffer()
+
+def write_lines(ser, lines, window=1, log=print, progress=None, stats=None):
+    '''Writes (address, data) pairs to the board with up to window lines in
+    flight at once, checking each response as it arrives. Returns the list of
+    (address, data) pairs which could not be verified. If given, progress is
+    called with the number of lines checked so far and the total, and stats
+    is a LinkStats to record round trips and time spent sending ('write') and
+    waiting for responses ('verify') in.
+
+    A window of 1 waits for every line to be acknowledged before sending the
+    next, which every version of the board supports. Larger windows need a
+    board whose serial receiver buffers incoming bytes while it is still
+    sending the readback for an earlier line.'''
+    lines = list(lines)
+    stats = stats or LinkStats()
+    window = max(1, min(window, MAX_WINDOW))
+    in_flight = collections.deque()
+    failed = []
+    checked = [0]
+
+    def check_oldest():
+        address, data, sent = in_flight.popleft()
+        with stats.phase('verify'):
+            response = ser.read(RESPONSE_LEN)
+        checked[0] += 1
+        if progress:
+            progress(checked[0], len(lines))
+        if len(response) == RESPONSE_LEN:
+            stats.record('w', time.perf_counter() - sent)
+        if check_response(address, data, response, log):
+            return
+        if len(response) < RESPONSE_LEN:
+            stats.timeouts += 1
+        else:
+            stats.mismatches += 1
+        # Once one response is wrong there's no telling where the next one
+        # starts, so give up on everything still in flight and start over.
+        failed.append((address, data))
+        failed.extend((address, data) for address, data, sent in in_flight)
+        checked[0] += len(in_flight)
+        in_flight.clear()
+        with stats.phase('verify'):
+            resync(ser)
+
+    for address, data in lines:
+        if len(in_flight) >= window:
+            check_oldest()
+        with stats.phase('write'):
+            ser.write(build_write_command(address, data))
+        in_flight.append((address, data, time.perf_counter()))
+    while in_flight:
+        check_oldest()
+    return failed
+
+def write_bursts(ser, lines, log=print, progress=None, stats=None):
+    '''Writes (address, data) pairs to the board with 'b' commands, one for
+    each run of consecutive addresses, checking the sum each is answered with.
+    Takes the same progress and stats as write_lines(), and likewise returns
+    the pairs which could not be verified.
+
+    Only one burst is sent at a time: if a byte of one is lost, the board
+    waits for the rest of it, and anything sent after it would be taken as
+    line data. Boards built before the 'b' command was added would take the
+    line data as commands instead, so only use this with newer boards.'''
+    stats = stats or LinkStats()
+    failed = []
+    checked = 0
+    for run in find_runs(lines):
+        command = build_burst_command(run[0][0], [data for address, data in run])
+        expected = burst_response(command)
+        with stats.phase('write'):
+            ser.write(command)
+        sent = time.perf_counter()
+        with stats.phase('verify'):
+            response = ser.read(BURST_RESPONSE_LEN)
+        checked += len(run)
+        if progress:
+            progress(checked, len(lines))
+        if response == expected:
+            stats.record('b', time.perf_counter() - sent)
+            continue
+        if len(response) < BURST_RESPONSE_LEN:
+            stats.timeouts += 1
+            log('No answer to burst of lines', run[0][0], 'to', run[-1][0])
+        else:
+            stats.mismatches += 1
+            log('Error writing lines', run[0][0], 'to', run[-1][0],
+                'answered', repr(response), 'expected', repr(expected))
+        failed.extend(run)
+        with stats.phase('verify'):
+            resync(ser)
+    return failed
+
+def upload_pattern(ser, pattern, window=1, retries=3, previous=None,
+                   log=print, progress=None, stats=None, burst=False,
+                   check=False):
+    '''Uploads a pattern, retrying lines which fail one at a time. If previous
+    holds what the board was last known to contain, only lines which differ
+    from it are sent. If check is True, the board is asked instead which
+    blocks of lines differ (see find_differences()), and previous is ignored.
+    If burst is True, lines are first sent with 'b' commands (see
+    write_bursts()) rather than 'w' commands. Returns the addresses which
+    could not be written.'''
+    stats = stats or LinkStats()
+    with stats.phase('mode'):
+        set_display_mode(ser, 1, stats)
+    if check:
+        with stats.phase('check'):
+            changed = find_differences(ser, pattern, stats)
+        lines = [(address, pattern[address]) for address in changed]
+        if not lines:
+            log('The card already holds this pattern.')
+            return []
+    else:
+        lines = [(address, data) for address, data in enumerate(pattern)
+                 if previous is None or address >= len(previous)
+                 or previous[address] != data]
+    if previous is not None or check:
+        log('Skipping {0} unchanged lines; sending {1}.'.format(
+            len(pattern) - len(lines), len(lines)))
+    if burst:
+        failed = write_bursts(ser, lines, log, progress, stats)
+    else:
+        failed = write_lines(ser, lines, window, log, progress, stats)
+    for attempt in range(retries):
+        if not failed:
+            break
+        log('Retrying {0} lines.'.format(len(failed)))
+        stats.retries += len(failed)
+        failed = write_lines(ser, failed, log=log, stats=stats)
+    return [address for address, data in failed]
+
+def load_cache():
+    '''Returns the upload cache, a dict from port identity to the hex string
+    last written at each address (None where unknown).'''
+    try:
+        with open(CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def save_cache(cache):
+    with open(CACHE_FILE, 'w') as f:
+        json.dump(cache, f)
+
+def cached_pattern(cache, identity):
+    '''Returns what the cache says the card holds as a list of RAM lines, or
+    None if nothing is known about it. Lines the cache has no record of, such
+    as those past the end of a shorter pattern, are None.'''
+    if identity not in cache:
+        return None
+    lines = [bytes.fromhex(line) if line else None for line in cache[identity]]
+    return lines + [None] * (MEMORY_ENTRIES - len(lines))
+
+def update_cache(cache, identity, pattern, failed):
+    '''Records pattern as the card's contents, except for failed addresses
+    whose contents are now unknown. Lines past the end of pattern keep what
+    was recorded for them, since the card still holds it.'''
+    cache[identity] = [None if address in failed else data.hex()
+                       for address, data in enumerate(pattern)] + \
+                      cache.get(identity, [])[len(pattern):]
+
+def expand_ports(spec):
+    '''Turns the com_port argument into a list of devices. It can be a single
+    port, a comma separated list of ports or globs (ex: '/dev/ttyUSB*'),
+    'auto' to use every USB serial adapter on the system, or 'known' for the
+    cards in the device registry which are plugged in.'''
+    if spec == 'auto':
+        return [port.device for port in find_card_ports()]
+    if spec == 'known':
+        return [port.device for port in find_known_ports(load_registry())]
+    devices = []
+    for item in spec.split(','):
+        if any(c in item for c in '*?['):
+            devices += sorted(glob.glob(item))
+        else:
+            devices.append(item)
+    return devices
+
+def transcript_path(args, device, devices):
+    '''Returns where to write device's transcript, or None if one wasn't asked
+    for. With several cards, each gets its own file named after its port.'''
+    if not args.transcript or len(devices) == 1:
+        return args.transcript
+    return '{0}.{1}'.format(args.transcript, os.path.basename(device.rstrip(':')))
+
+def upload_to_port(device, pattern, args, cache, stats, log=print,
+                   progress=None, transcript=None, registry=None):
+    '''Opens device and uploads pattern to it according to the command line
+    options, updating cache and recording the traffic in stats (and in a
+    transcript written to the file named transcript, if given). Returns the
+    addresses which could not be written. With --audit nothing is written,
+    and the addresses which might differ from pattern are returned instead.
+    With --fast, the baud rate which works is recorded in registry.'''
+    identity = port_identity(device)
+    previous = cached_pattern(cache, identity) if args.delta else None
+    transcript_file = open(transcript, 'w') if transcript else None
+    failed = None
+    try:
+        # Open the serial port; this will raise an exception if not found.
+        with serial.Serial(device, DEFAULT_BAUDRATE, timeout=1) as ser:
+            ser = InstrumentedSerial(ser, stats, transcript_file)
+            if args.fast:
+                with stats.phase('negotiate'):
+                    divisor = negotiate_baudrate(ser, cached_divisor(registry, device), log)
+                remember_divisor(registry, device, divisor)
+                log('Talking at {0} baud.'.format(divisor_baudrate(divisor)))
+            try:
+                if args.audit:
+                    with stats.phase('check'):
+                        return find_differences(ser, pattern, stats)
+                failed = upload_pattern(ser, pattern, args.window, args.retries,
+                                        previous, log, progress, stats, args.burst,
+                                        args.check)
+            finally:
+                if args.fast:
+                    # Leave the card at the rate the other tools expect.
+                    with stats.phase('negotiate'):
+                        restore_baudrate(ser)
+    finally:
+        if transcript_file:
+            transcript_file.close()
+        if failed is None and not args.audit:
+            # Stopped part way, so any of the pattern's lines could hold the
+            # old or the new contents.
+            update_cache(cache, identity, pattern, range(len(pattern)))
+    update_cache(cache, identity, pattern, failed)
+    return failed
+
+def upload_to_ports(devices, pattern, args, cache, stats, registry=None):
+    '''Uploads pattern to every device at once, one thread per card, then
+    prints a table of which succeeded. stats is a dict from device to its
+    LinkStats. Returns True if they all did.'''
+    def flash(device):
+        def log(*items):
+            print(device + ':', *items)
+        def progress(done, total):
+            # Report every quarter of the way through.
+            if done * 4 // total != (done - 1) * 4 // total:
+                log('{0}/{1} lines'.format(done, total))
+        try:
+            failed = upload_to_port(device, pattern, args, cache, stats[device],
+                                    log, progress,
+                                    transcript_path(args, device, devices),
+                                    registry)
+        except Exception as e:
+            return 'FAIL ({0})'.format(str(e) or 'unknown error')
+        if args.audit:
+            return 'DIFFERS ({0} lines)'.format(len(failed)) if failed else 'matches'
+        if failed:
+            return 'FAIL ({0} lines not written)'.format(len(failed))
+        return 'pass'
+
+    with concurrent.futures.ThreadPoolExecutor(len(devices)) as pool:
+        results = list(pool.map(flash, devices))
+
+    width = max(len(device) for device in devices + ['Port'])
+    print('{0:{1}}  Result'.format('Port', width))
+    for device, result in zip(devices, results):
+        print('{0:{1}}  {2}'.format(device, width, result))
+    return all(result in ('pass', 'matches') for result in results)
+
+def main(argv=None, prog=None):
+    '''Uploads a pattern as the command line arguments argv (sys.argv[1:] if
+    None) say.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("com_port", help="The com port of the FPGA (ex: 'COM3:'). "
+                        "Several cards can be programmed at once by giving a "
+                        "comma separated list of ports or globs "
+                        "(ex: '/dev/ttyUSB*'), 'auto' for every USB serial "
+                        "adapter, or 'known' for every card light_control.py "
+                        "has connected to.")
+    parser.add_argument("pattern_file", help="A text file or pattern image containing the new pattern to program")
+    parser.add_argument("--window", type=int, default=1,
+                        help="How many lines to send before waiting for the "
+                             "first to be acknowledged. Values above 1 need "
+                             "the board's serial receive FIFO, and at most "
+                             "{0} fit in it.".format(MAX_WINDOW))
+    parser.add_argument("--burst", action='store_true',
+                        help="Send runs of lines with a single burst write "
+                             "command each, answered with a checksum rather "
+                             "than the whole line. Needs a board built with "
+                             "the burst write command; --window is ignored.")
+    parser.add_argument("--fast", action='store_true',
+                        help="Switch each card to the fastest baud rate which "
+                             "passes a quick link test, remembering it for "
+                             "next time, and back to 115200 at the end. Falls "
+                             "back to 115200 for boards which can't change "
+                             "baud rate.")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="How many times to retry lines which fail.")
+    parser.add_argument("--delta", action='store_true',
+                        help="Only send lines which differ from what was last "
+                             "uploaded to this card. The card forgets uploaded "
+                             "patterns when switched off, so do a full upload "
+                             "after a power cycle.")
+    parser.add_argument("--check", action='store_true',
+                        help="Ask the card which blocks of lines differ from "
+                             "the pattern and only send those, or nothing if "
+                             "it already holds it. Works after a power cycle, "
+                             "unlike --delta, but needs a board built with the "
+                             "verify command.")
+    parser.add_argument("--audit", action='store_true',
+                        help="Only check whether the card holds the pattern, "
+                             "without changing it. Needs a board built with "
+                             "the verify command.")
+    parser.add_argument("--stats", action='store_true',
+                        help="Print statistics about the serial traffic: "
+                             "bytes, round trip times, retries and where the "
+                             "time went. They're printed anyway if anything "
+                             "fails.")
+    parser.add_argument("--stats-json", metavar='FILE',
+                        help="Write the statistics to FILE as JSON.")
+    parser.add_argument("--transcript", metavar='FILE',
+                        help="Record every byte sent and received, with "
+                             "timestamps, in FILE (one per card, with the "
+                             "port's name added, for several cards). "
+                             "link_stats.py can show or replay it.")
+    args = parser.parse_args(argv)
+
+    # Read the contents of the pattern file.
+    pattern = read_pattern(args.pattern_file)
+
+    devices = expand_ports(args.com_port)
+    if not devices:
+        print('No serial ports found matching', args.com_port)
+        sys.exit(1)
+
+    cache = load_cache()
+    registry = load_registry() if args.fast else None
+    stats = collections.OrderedDict((device, LinkStats()) for device in devices)
+    if len(devices) == 1:
+        # Program it to the FPGA.
+        one_at_a_time = not (args.burst or args.check or args.delta or
+                             args.window > 1 or args.fast)
+        if one_at_a_time and not args.audit:
+            # Each line waits for its echo: about 5 seconds for a full pattern.
+            print('Sending pattern. Should take about {0} seconds.'.format(
+                  max(1, round(5.0 * len(pattern) / MEMORY_ENTRIES))))
+        elif not args.audit:
+            # How long these take depends on the card and on how much of the
+            # pattern it already holds.
+            print('Sending pattern.')
+        try:
+            failed = upload_to_port(devices[0], pattern, args, cache,
+                                    stats[devices[0]], transcript=args.transcript,
+                                    registry=registry)
+        except IOError as e:
+            save_cache(cache)
+            print(stats[devices[0]].summary())
+            print(e)
+            sys.exit(1)
+        save_cache(cache)
+        passed = not failed
+        if args.stats or (failed and not args.audit):
+            print(stats[devices[0]].summary())
+        if args.audit:
+            if failed:
+                print('The card differs from the pattern in {0} of its {1} '
+                      'lines.'.format(len(failed), len(pattern)))
+            else:
+                print('The card holds the pattern.')
+        elif failed:
+            print('Failed to write lines', failed)
+        else:
+            print('Completed sending data.')
+    else:
+        print('{0} {1} cards.'.format('Checking' if args.audit else
+                                      'Sending pattern to', len(devices)))
+        passed = upload_to_ports(devices, pattern, args, cache, stats, registry)
+        save_cache(cache)
+        if args.stats or not (passed or args.audit):
+            for device, device_stats in stats.items():
+                print(device + ':')
+                print(device_stats.summary())
+
+    if registry is not None:
+        save_registry(registry)
+
+    if args.stats_json:
+        with open(args.stats_json, 'w') as f:
+            json.dump(dict((device, device_stats.to_dict())
+                           for device, device_stats in stats.items()),
+                      f, indent=2)
+    if not passed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+usage = '''
+This program watches an animation file while you edit it, and every time it's
+saved, converts it again and sends the lines of the board's memory which
+changed straight to the board. Leave it running next to your editor to see
+each change on the tree a moment after saving.
+
+The serial port stays open the whole time. The board forgets its pattern when
+it's switched off, so restart this program after a power cycle.
+'''
+
+import argparse
+import os
+import sys
+import time
+import serial
+from xmascard import convert_animation_file
+from xmascard import led_mem_utils
+from xmascard import upload_new_pattern
+from xmascard.convert_animation_file import AnimationParser, AnimationError, convert_frames
+from xmascard.led_mem_utils import MEMORY_ENTRIES
+from xmascard.inotify_events import Inotify, IN_CLOSE_WRITE, IN_MOVED_TO
+from xmascard.serial_utils import MODE_STORED_PATTERN
+
+class FileWatcher():
+    '''Waits for a file to be saved, using inotify on Linux and checking its
+    modification time every poll_interval seconds elsewhere (or if inotify is
+    False).
+
+    The file's directory is watched rather than the file itself, since many
+    editors save by writing a new file and renaming it over the old one.'''
+
+    def __init__(self, path, poll_interval=0.2, inotify=True):
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self.inotify = None
+        if inotify:
+            try:
+                self.inotify = Inotify()
+                self.inotify.add_watch(os.path.dirname(self.path),
+                                       IN_CLOSE_WRITE | IN_MOVED_TO)
+            except OSError:
+                self.inotify = None
+        self.stamp = self.stat()
+
+    def stat(self):
+        try:
+            info = os.stat(self.path)
+        except OSError:
+            return None
+        return info.st_mtime_ns, info.st_size
+
+    def wait(self):
+        '''Returns once the file has been saved again.'''
+        if self.inotify is None:
+            while True:
+                time.sleep(self.poll_interval)
+                stamp = self.stat()
+                if stamp != self.stamp and stamp is not None:
+                    self.stamp = stamp
+                    return
+        name = os.path.basename(self.path)
+        while True:
+            self.inotify.wait()
+            if any(event[1] == name for event in self.inotify.read_events()):
+                # Let the rest of the save finish before reading the file.
+                while self.inotify.wait(0.02):
+                    self.inotify.read_events()
+                return
+
+class IncrementalParser():
+    '''Parses new versions of an animation file, starting from the last
+    checkpoint before the first line which changed rather than from the top.
+
+    A checkpoint is a copy of the parser's state taken every CHECKPOINT_EVERY
+    lines, along with how many frames it had produced by then.'''
+
+    CHECKPOINT_EVERY = 32
+
+    def __init__(self, log=print):
+        self.lines = []
+        self.frames = []
+        self.checkpoints = [(0, AnimationParser(log=log), 0)]
+
+    def update(self, lines):
+        '''Parses lines, the new contents of the file, and returns all its
+        frames and the line parsing started again from. Raises AnimationError
+        if it can't be parsed.'''
+        first_changed = 0
+        for old, new in zip(self.lines, lines):
+            if old != new:
+                break
+            first_changed += 1
+        while self.checkpoints[-1][0] > first_changed:
+            self.checkpoints.pop()
+        start, parser, frame_count = self.checkpoints[-1]
+        parser = parser.copy()
+        del self.frames[frame_count:]
+        line_idx = start
+        try:
+            for line_idx in range(start, len(lines)):
+                if line_idx > start and line_idx % self.CHECKPOINT_EVERY == 0:
+                    self.checkpoints.append((line_idx, parser.copy(), len(self.frames)))
+                self.frames.extend(parser.parse_line(lines[line_idx]))
+            self.lines = lines
+        except AnimationError:
+            # Everything before the bad line can still be reused next time.
+            self.lines = lines[:line_idx]
+            raise
+        parser.finish()
+        return self.frames, start
+
+def push(ser, pattern, on_card, window, log=print):
+    '''Writes the lines of pattern which differ from on_card, what the board is
+    known to hold (None where unknown), and updates on_card. Returns how many
+    lines were sent and how many failed.'''
+    lines = [(address, data) for address, data in enumerate(pattern)
+             if on_card[address] != data]
+    failed = upload_new_pattern.write_lines(ser, lines, window, log)
+    if failed:
+        failed = upload_new_pattern.write_lines(ser, failed, log=log)
+    for address, data in lines:
+        on_card[address] = data
+    for address, data in failed:
+        on_card[address] = None
+    return len(lines), len(failed)
+
+def convert(frames, fit):
+    '''Returns the memory lines for frames, without any of the converter's
+    messages.'''
+    quiet = lambda *items: None
+    frames = convert_animation_file.optimize_frames(frames, fit, quiet)
+    return led_mem_utils.split_entries(convert_frames(frames, log=quiet))
+
+def main(argv=None, prog=None):
+    '''Watches the animation named on the command line, argv (sys.argv[1:] if
+    None). prog is what to call the program in help.'''
+    if argv is None:
+        argv = sys.argv[1:]
+    parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument("com_port", help="The com port of the FPGA (ex: 'COM3:')")
+    parser.add_argument("animation_file", help="The animation file to watch.")
+    parser.add_argument("--fit", type=convert_animation_file.frame_budget, nargs='?',
+                        const=MEMORY_ENTRIES, metavar='FRAMES',
+                        help="Shorten the animation to fit, as "
+                             "convert_animation_file.py --fit does.")
+    parser.add_argument("--window", type=int, default=1,
+                        help="How many lines to send before waiting for the "
+                             "first to be acknowledged (see upload_new_pattern.py).")
+    parser.add_argument("--poll", action='store_true',
+                        help="Check the file's modification time regularly "
+                             "instead of asking the system to say when it changes.")
+    if not argv:
+        print(usage)
+        parser.print_help()
+        sys.exit(0)
+    args = parser.parse_args(argv)
+
+    watcher = FileWatcher(args.animation_file, inotify=not args.poll)
+    incremental = IncrementalParser(log=lambda *items: None)
+    on_card = [None] * MEMORY_ENTRIES
+
+    with serial.Serial(args.com_port, 115200, timeout=1) as ser:
+        upload_new_pattern.set_display_mode(ser, MODE_STORED_PATTERN)
+        print('Watching {0}; press Ctrl-C to stop.'.format(args.animation_file))
+        try:
+            while True:
+                start = time.time()
+                try:
+                    with open(args.animation_file, 'r') as f:
+                        lines = f.read().splitlines()
+                    frames, reparsed_from = incremental.update(lines)
+                except AnimationError as e:
+                    print(e)
+                except IOError as e:
+                    print('Could not read {0}: {1}'.format(args.animation_file, e))
+                else:
+                    sent, failed = push(ser, convert(frames, args.fit), on_card,
+                                        args.window)
+                    print('{0} frames (parsed from line {1}); sent {2} changed '
+                          'lines in {3:.0f} ms{4}.'.format(
+                          len(frames), reparsed_from + 1, sent,
+                          (time.time() - start) * 1000,
+                          ', {0} FAILED'.format(failed) if failed else ''))
+                watcher.wait()
+        except KeyboardInterrupt:
+            print()
+
+if __name__ == '__main__':
+    main()